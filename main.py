@@ -49,15 +49,20 @@ def main():
         "files_skipped_due_to_no_change": 0,
         "files_processed": 0,
         "documents_sent_to_llamaparse": 0,
+        "llamaparse_cache_hits": 0,
+        "llamaparse_cache_misses": 0,
         "documents_empty_from_llamaparse": 0,
         "documents_successful_after_retries": 0,
         "documents_failed_after_retries": 0,
         "md_files_generated": 0,
         "files_with_only_metadata": 0,
-        "pdf_files_always_processed": 0,
+        "pdf_files_processed": 0,
+        "pdf_files_unchanged_text": 0,
+        "html_files_unchanged_content": 0,
     }
     detail_json_path = "data/last_crawl_detail.json"
     output_data_path = "data/last_output_data.csv"
+    http_cache_path = "data/http_cache.json"
 
     detailed_log_path = os.path.join(DATA_PATH, "pipeline_detailed_log.jsonl")
     error_csv_path = os.path.join(DATA_PATH, "error", "error.csv")
@@ -77,16 +82,21 @@ def main():
     last_data_json = initialize_json_file(detail_json_path, output_data_path)
 
     print("===>Getting indexes...\n")
-    stats["total_documents_crawled"] = get_indexes()
+    previous_links_path = os.path.join(last_data_json["last_folder_crawl"], "all_links.csv")
+    stats["total_documents_crawled"] = get_indexes(previous_links_path=previous_links_path)
 
     print("Crawler Started...\n")
-    crawl_data(stats, detailed_log_path)
+    # 304 rows rely on last run's output and markdown, so only pages that have both are revalidated
+    previous_markdown_dir = None
+    if os.path.exists(output_data_path):
+        previous_markdown_dir = os.path.join(last_data_json["last_folder_crawl"], "out", "from_html")
+    crawl_data(stats, detailed_log_path, http_cache_path, previous_markdown_dir=previous_markdown_dir)
 
     print("===>Starting parser...\n")
     # Ensure the key exists before parsing
     stats["files_processed_by_directory"] = 0
     parse_files_to_md(last_data_json=last_data_json, stats=stats, detailed_log_path=detailed_log_path)
-    # pdf_files_always_processed is set in parser.py as len(pdf_df)
+    # pdf_files_processed and the *_unchanged_* counts are set by analyze_file_changes
 
     print("===>Updating crawl timestamp...\n")
     update_crawl_timestamp(detail_json_path, DATA_PATH)
@@ -135,6 +145,12 @@ Number of files that were processed (either new or changed).
 => documents_sent_to_llamaparse: {stats.get("documents_sent_to_llamaparse", "N/A")}
 Number of files sent to LlamaParse for conversion to markdown.
 
+=> llamaparse_cache_hits: {stats.get("llamaparse_cache_hits", "N/A")}
+Number of files whose markdown was reused from the LlamaParse cache because the same text was parsed before.
+
+=> llamaparse_cache_misses: {stats.get("llamaparse_cache_misses", "N/A")}
+Number of files that were actually sent to the LlamaParse API.
+
 => documents_empty_from_llamaparse: {stats.get("documents_empty_from_llamaparse", "N/A")}
 Number of times LlamaParse returned empty content (likely due to unsupported, blank input or API limits).
 
@@ -150,8 +166,14 @@ Total markdown files created (one per input file).
 => files_with_only_metadata: {stats.get("files_with_only_metadata", "N/A")}
 Markdown files that contain only metadata (no actual content).
 
-=> pdf_files_always_processed: {stats.get("pdf_files_always_processed", "N/A")}
-All PDF files bypass change detection and are always processed because PDF content cannot be reliably compared for changes.
+=> pdf_files_processed: {stats.get("pdf_files_processed", "N/A")}
+Number of PDF files that were new or changed and therefore processed.
+
+=> pdf_files_unchanged_text: {stats.get("pdf_files_unchanged_text", "N/A")}
+PDF files whose bytes changed (e.g. new embedded timestamps) but whose normalized text did not, so they were not processed again.
+
+=> html_files_unchanged_content: {stats.get("html_files_unchanged_content", "N/A")}
+HTML files whose bytes changed (e.g. rotating tokens or counters outside the main content) but whose cleaned content did not, so they were not processed again.
 
 => files_processed_by_directory: {stats.get("files_processed_by_directory", "N/A")}
 Total files processed by the directory parser (should match input count).
@@ -5,11 +5,12 @@ import dotenv
 import pandas as pd
 
 from utils.crawl import crawl_csv
+from utils.indexes import read_links_diff
 
 dotenv.load_dotenv()
 
 
-def crawl_data(stats, detailed_log_path):
+def crawl_data(stats, detailed_log_path, http_cache_path=None, previous_markdown_dir=None):
     """Crawl the data from the csv file."""
     # load the path
     DATA_PATH = os.getenv("DATA_PATH")
@@ -19,8 +20,19 @@ def crawl_data(stats, detailed_log_path):
         """Crawl the index and get the data."""
         df = pd.read_csv(os.path.join(DATA_PATH, "all_links.csv"))
         stats["total_documents_crawled"] = len(df)
+        # Removed URLs would stay in the HTTP cache forever, and a 304 for a URL whose
+        # metadata changed would carry forward the old Section/Subsection/Title
+        links_diff = read_links_diff(DATA_PATH)
+        forget_urls = links_diff["removed"] | links_diff["metadata_changed"] if links_diff else set()
         # filter only the urls from whatsapp
-        await crawl_csv(df=df, base_dir=DATA_PATH, detailed_log_path=detailed_log_path)
+        await crawl_csv(
+            df=df,
+            base_dir=DATA_PATH,
+            detailed_log_path=detailed_log_path,
+            http_cache_path=http_cache_path,
+            previous_markdown_dir=previous_markdown_dir,
+            forget_urls=forget_urls,
+        )
 
     loop = asyncio.get_event_loop()
     loop.run_until_complete(main())
\ No newline at end of file
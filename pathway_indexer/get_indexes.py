@@ -9,6 +9,7 @@ from utils.indexes import (
     Selectors,
     crawl_index,
     create_root_folders,
+    diff_link_inventories,
     get_help_links,
     get_services_links,
 )
@@ -17,8 +18,13 @@ from utils.tools import generate_hash_filename
 dotenv.load_dotenv()
 
 
-def get_indexes():
-    """Get the indexes from the websites."""
+def get_indexes(previous_links_path=None):
+    """
+    Get the indexes from the websites.
+
+    If `previous_links_path` points to the last run's all_links.csv, the URLs added,
+    removed or with changed metadata since then are written to links_diff.csv.
+    """
     # first, create the necessary folders
     DATA_PATH = os.getenv("DATA_PATH")
     print(DATA_PATH)
@@ -54,23 +60,29 @@ def get_indexes():
 
     HELP_SELECTOR = "#knownIssueArticles"
 
-    # Crawling Process
-    acm_data = crawl_index(ACM_URL, acm_selectors)
+    # Crawling Process: the four sources are independent, so fetch them concurrently
+    async def crawl_all_indexes():
+        return await asyncio.gather(
+            asyncio.to_thread(crawl_index, ACM_URL, acm_selectors),
+            asyncio.to_thread(crawl_index, MISSIONARY_URL, missionary_selectors),
+            get_help_links(HELP_URL, HELP_SELECTOR),
+            get_services_links(STUDENT_SERVICES_URL),
+        )
+
+    acm_data, missionary_data, help_data, student_services_data = asyncio.run(crawl_all_indexes())
+
     print("ACM data collected!")
     print(f"Length of ACM data: {len(acm_data)}")
     print()
 
-    missionary_data = crawl_index(MISSIONARY_URL, missionary_selectors)
     print("Missionary data collected!")
     print(f"Length of missionary data: {len(missionary_data)}")
     print()
 
-    help_data = asyncio.run(get_help_links(HELP_URL, HELP_SELECTOR))
     print("Help data collected!")
     print(f"Length of help data: {len(help_data)}")
     print()
 
-    student_services_data = asyncio.run(get_services_links(STUDENT_SERVICES_URL))
     print("Student Services data collected!")
     print(f"Length of Student Services data: {len(student_services_data)}")
     print()
@@ -131,6 +143,18 @@ def get_indexes():
 
     ## add a final column with the hash filename
     df_merged["filename"] = df_merged["URL"].apply(generate_hash_filename)
+
+    # Diff against the previous inventory before it can be overwritten
+    if previous_links_path and os.path.exists(previous_links_path):
+        previous_df = pd.read_csv(previous_links_path, dtype=str, keep_default_na=False)
+    else:
+        previous_df = pd.DataFrame(columns=df_merged.columns)
+    links_diff = diff_link_inventories(previous_df, df_merged)
+    links_diff.to_csv(os.path.join(DATA_PATH, "links_diff.csv"), index=False)
+    print("Changes since the previous link inventory:")
+    for change in ["added", "removed", "metadata_changed"]:
+        print(f"    {change}: {(links_diff['Change'] == change).sum()}")
+
     # save the files as "all_links.csv"
     df_merged.to_csv(os.path.join(DATA_PATH, "all_links.csv"), index=False)
 
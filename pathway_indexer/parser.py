@@ -1,19 +1,34 @@
 import os
 import shutil
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
 
 import pandas as pd
 
 from utils.calendar_format import calendar_format
 from utils.parser import (
-    add_titles_tag,
-    associate_markdown_with_metadata,
-    attach_metadata_to_markdown_directories,
+    html_content_fingerprint,
+    load_link_metadata,
+    postprocess_markdown_files,
     process_directory,
 )
+from utils.pdf_extract import pdf_text_fingerprint
 
 DATA_PATH = os.getenv("DATA_PATH")
 OUT_PATH = os.path.join(DATA_PATH, "out")
 EXCLUDED_PATH = os.path.join(DATA_PATH, "excluded_domains.txt")
+# Number of worker processes used to convert documents (1 = sequential)
+PARSE_WORKERS = int(os.getenv("PARSE_WORKERS", "1"))
+# Files sent to LlamaParse at once after conversion (0 = one file at a time)
+LLAMAPARSE_MAX_IN_FLIGHT = int(os.getenv("LLAMAPARSE_MAX_IN_FLIGHT", "0"))
+# Concurrent PDF partition requests (1 = each PDF is converted with the rest of its file)
+PDF_PARTITION_WORKERS = int(os.getenv("PDF_PARTITION_WORKERS", "1"))
+# How the Markdown of unchanged files is carried forward from the last run: "hardlink" or "copy"
+CARRY_FORWARD_MODE = os.getenv("CARRY_FORWARD_MODE", "hardlink")
+# Columns added by compare_with_last_run that are not saved to output_data.csv
+COMPARISON_COLUMNS = ["Last Content Hash", "HasChanged"]
+# What Content Fingerprint hashes for each content type, see compare_with_last_run
+CONTENT_FINGERPRINTS = {"html": html_content_fingerprint, "pdf": pdf_text_fingerprint}
 
 
 def parse_files_to_md(
@@ -33,7 +48,9 @@ def parse_files_to_md(
 
     # print(last_data_json["last_folder_crawl"])
 
-    files_to_process = analyze_file_changes(output_data_path, last_output_data_path, out_folder, last_data_json, stats)
+    files_to_process, carried_paths = analyze_file_changes(
+        output_data_path, last_output_data_path, out_folder, last_data_json, stats
+    )
     if not files_to_process.empty:
         empty_llamaparse_files_counted = set()
         process_modified_files(
@@ -44,6 +61,7 @@ def parse_files_to_md(
             stats,
             empty_llamaparse_files_counted,
             detailed_log_path,
+            carried_paths,
         )
 
     # Save current_df as last_output_data.csv for next run
@@ -53,8 +71,17 @@ def parse_files_to_md(
 
 def analyze_file_changes(output_data_path, last_output_data_path, out_folder, last_data_json, stats):
     """
-    Analyze file changes by comparing current and last output data based on Content Hash,
-    only for HTML files. PDF files are always included in files_to_process.
+    Analyze file changes by comparing current and last output data based on Content Hash.
+
+    HTML and PDF files whose Content Hash matches the last run are unchanged. A file whose
+    bytes changed still counts as unchanged when its Content Fingerprint matches the last
+    run (see compare_with_last_run): the normalized text for PDFs, e.g. when only embedded
+    timestamps differ, and the cleaned main content for HTML, e.g. when only tokens or
+    counters in the page chrome differ.
+
+    The Markdown of unchanged files is carried forward from the previous run with
+    carry_forward_file and their crawled file is removed from the input directory.
+    Files whose previous Markdown is missing are processed again.
 
     Parameters:
     - output_data_path (str): Path to the current output data CSV file.
@@ -63,83 +90,169 @@ def analyze_file_changes(output_data_path, last_output_data_path, out_folder, la
 
     Returns:
     - files_to_process (DataFrame): DataFrame of files that have changed and need processing.
+    - carried_paths (list): Paths of the Markdown files carried forward from the last run.
     """
     if not os.path.exists(output_data_path):
         print(f"Output data file not found: {output_data_path}")
-        return pd.DataFrame()  # Return empty DataFrame
+        return pd.DataFrame(), []  # Return empty DataFrame
 
     current_df = pd.read_csv(output_data_path)
 
-    # Separate HTML and PDF files
-    html_df = current_df[current_df["Content Type"] == "html"]
-    pdf_df = current_df[current_df["Content Type"] == "pdf"]
-
     if not os.path.exists(last_output_data_path):
         print("Last output data file not found; processing all files.")
+        current_df = compare_with_last_run(
+            current_df, pd.DataFrame(columns=["URL", "Content Type", "Content Hash"]), workers=PARSE_WORKERS
+        )
+        # Keep the fingerprints for the next run's comparison
+        current_df.drop(columns=COMPARISON_COLUMNS).to_csv(output_data_path, index=False)
         stats["files_processed"] = len(current_df)
         stats["files_skipped_due_to_no_change"] = 0
-        stats["pdf_files_always_processed"] = len(current_df[current_df["Content Type"] == "pdf"])
-        with open(os.path.join(DATA_PATH, "processed_files.log"), "w") as f:
-            for _, row in current_df.iterrows():
-                f.write(f"{row["URL"]}\n")
-        return current_df  # Process all files if no last output data
+        stats["pdf_files_processed"] = int((current_df["Content Type"] == "pdf").sum())
+        stats["pdf_files_unchanged_text"] = 0
+        stats["html_files_unchanged_content"] = 0
+        write_url_log(os.path.join(DATA_PATH, "processed_files.log"), current_df)
+        return current_df, []  # Process all files if no last output data
 
     last_df = pd.read_csv(last_output_data_path)
-    last_hash_dict = last_df[last_df["Content Type"] == "html"].set_index("URL")["Content Hash"].to_dict()
-
-    # Apply hash check only to HTML files
-    def has_changes(row):
-        last_hash = last_hash_dict.get(row["URL"])
-        return row["Content Hash"] != last_hash
-
-    html_df["HasChanged"] = html_df.apply(has_changes, axis=1)
-    changed_html_files = html_df[html_df["HasChanged"]]
-    unchanged_html_files = html_df[~html_df["HasChanged"]]
-
-    # Copy unchanged HTML files and remove them from input directory
-    for _, row in unchanged_html_files.iterrows():
-        print("Skipping unchanged file:", row["Filepath"])
-        pathname = os.path.basename(row["Filepath"]).replace(".html", ".md")
-        src_path = os.path.join(last_data_json["last_folder_crawl"], "out", "from_html", pathname)
-        dst_path = os.path.join(out_folder, "from_html", pathname)
-
-        os.makedirs(os.path.dirname(dst_path), exist_ok=True)
-        
-        # Copy unchanged file as .md in out_folder only if paths are different
-        if os.path.exists(src_path) and os.path.normpath(src_path) != os.path.normpath(dst_path):
+    current_df = compare_with_last_run(current_df, last_df, workers=PARSE_WORKERS)
+    current_df.drop(columns=COMPARISON_COLUMNS).to_csv(output_data_path, index=False)
+
+    # Only HTML and PDF files are parsed
+    documents_df = current_df[current_df["Content Type"].isin(["html", "pdf"])].copy()
+    unchanged_files = documents_df[~documents_df["HasChanged"]]
+
+    # Carry forward the Markdown of unchanged files and remove them from input directory
+    carried = Counter()
+    carried_paths = []
+    missing_markdown = []
+    for index, filepath, content_type in zip(
+        unchanged_files.index, unchanged_files["Filepath"], unchanged_files["Content Type"]
+    ):
+        print("Skipping unchanged file:", filepath)
+        subfolder = "from_pdf" if content_type == "pdf" else "from_html"
+        pathname = os.path.basename(filepath).replace(f".{content_type}", ".md")
+        src_path = os.path.join(last_data_json["last_folder_crawl"], "out", subfolder, pathname)
+        dst_path = os.path.join(out_folder, subfolder, pathname)
+
+        if os.path.normpath(src_path) == os.path.normpath(dst_path):
+            print(f"WARNING: Skipping carry-forward because src and dst are identical: {src_path}")
+        elif not os.path.exists(src_path):
+            # e.g. the file failed to parse last time; keep its crawled file so it is parsed now
+            print(f"No previous Markdown for {filepath}; processing it again")
+            missing_markdown.append(index)
+            continue
+        else:
             try:
-                shutil.copyfile(src_path, dst_path)
-                print(f"Copied {src_path} to {dst_path}")
-            except shutil.SameFileError:
-                print(f"Skipping copy - source and destination are the same file: {src_path}")
+                os.makedirs(os.path.dirname(dst_path), exist_ok=True)
+                carried[carry_forward_file(src_path, dst_path)] += 1
+                carried_paths.append(dst_path)
             except Exception as e:
-                print(f"Error copying {src_path} to {dst_path}: {e}")
-        elif os.path.normpath(src_path) == os.path.normpath(dst_path):
-            print(f"WARNING: Skipping copy because src and dst are identical: {src_path}")
+                print(f"Error carrying forward {src_path} to {dst_path}: {e}")
 
         # Remove unchanged file from input_directory
-        if os.path.exists(row["Filepath"]):
-            os.remove(row["Filepath"])
-            print(f"Removed {row['Filepath']} from input_directory")
+        if os.path.exists(filepath):
+            os.remove(filepath)
+    print(f"Carried forward {sum(carried.values())} unchanged Markdown files ({dict(carried)})")
+
+    documents_df.loc[missing_markdown, "HasChanged"] = True
+    files_to_process = documents_df[documents_df["HasChanged"]]
+    skipped_files = documents_df[~documents_df["HasChanged"]]
+    is_pdf = documents_df["Content Type"] == "pdf"
+    # Skipped although their bytes changed, because their fingerprint did not
+    unchanged_content = ~documents_df["HasChanged"] & (documents_df["Content Hash"] != documents_df["Last Content Hash"])
+
+    stats["files_skipped_due_to_no_change"] = len(skipped_files)
+    stats["pdf_files_processed"] = int((documents_df["HasChanged"] & is_pdf).sum())
+    stats["pdf_files_unchanged_text"] = int((unchanged_content & is_pdf).sum())
+    stats["html_files_unchanged_content"] = int((unchanged_content & ~is_pdf).sum())
+
+    # Log skipped files and files to be processed
+    write_url_log(os.path.join(DATA_PATH, "skipped_files.log"), skipped_files)
+    write_url_log(os.path.join(DATA_PATH, "processed_files.log"), files_to_process)
+
+    stats["files_processed"] = len(files_to_process)
+    return files_to_process, carried_paths
+
 
-    # Combine changed HTML files with all PDF files for processing
-    files_to_process = pd.concat([changed_html_files, pdf_df], ignore_index=True)
+def compare_with_last_run(current_df, last_df, workers=1):
+    """
+    Compare the rows of output_data.csv with the last run's.
+
+    Returns a copy of current_df with "Last Content Hash" and "HasChanged" columns and a
+    "Content Fingerprint" column, the hash of what is actually parsed from the file:
+    the normalized text of a PDF (pdf_text_fingerprint) or the cleaned main content of
+    an HTML page (html_content_fingerprint). It is only computed when the bytes changed
+    (or the last run has none), in `workers` processes, and carried over from the last
+    run otherwise. A file whose bytes changed but whose fingerprint matches the last
+    run's is not marked as changed.
+    """
+    if "Content Fingerprint" not in last_df:
+        last_df = last_df.assign(**{"Content Fingerprint": None})
+    last_hashes = (
+        last_df[["URL", "Content Type", "Content Hash", "Content Fingerprint"]]
+        .drop_duplicates(["URL", "Content Type"], keep="last")
+        .rename(columns={"Content Hash": "Last Content Hash", "Content Fingerprint": "Last Content Fingerprint"})
+    )
+    # URLs new in this run have no last hash and count as changed
+    df = current_df.drop(columns=["Content Fingerprint"], errors="ignore").merge(
+        last_hashes, on=["URL", "Content Type"], how="left"
+    )
+    df.index = current_df.index
+    df["HasChanged"] = df["Content Hash"] != df["Last Content Hash"]
+
+    last_fingerprint = df.pop("Last Content Fingerprint").astype(object)
+    df["Content Fingerprint"] = last_fingerprint.where(~df["HasChanged"], None)
+    needs_fingerprint = df["Content Type"].isin(CONTENT_FINGERPRINTS) & (df["HasChanged"] | last_fingerprint.isna())
+    tasks = (df.loc[needs_fingerprint, "Filepath"], df.loc[needs_fingerprint, "Content Type"])
+    if workers > 1 and needs_fingerprint.sum() > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            fingerprints = list(executor.map(content_fingerprint, *tasks, chunksize=16))
+    else:
+        fingerprints = list(map(content_fingerprint, *tasks))
+    df.loc[needs_fingerprint, "Content Fingerprint"] = pd.Series(
+        fingerprints, index=df.index[needs_fingerprint], dtype=object
+    )
+
+    same_content = df["HasChanged"] & last_fingerprint.notna() & (df["Content Fingerprint"] == last_fingerprint)
+    df.loc[same_content, "HasChanged"] = False
+    if same_content.any():
+        print(f"{same_content.sum()} files changed bytes but not content; treating them as unchanged")
+    return df
+
+
+def content_fingerprint(filepath, content_type):
+    return CONTENT_FINGERPRINTS[content_type](filepath)
+
+
+def carry_forward_file(src_path, dst_path, mode=None):
+    """
+    Make the previous run's file src_path available at dst_path.
 
-    stats["files_skipped_due_to_no_change"] = len(unchanged_html_files)
-    stats["pdf_files_always_processed"] = len(pdf_df)
+    With mode "hardlink" (the default, see CARRY_FORWARD_MODE) the file is linked, which
+    is a single metadata operation and copies no data. It falls back to a copy when the
+    link fails, e.g. when the runs are on different filesystems. Linked files share their
+    content with the previous run, so later steps must replace them (utils.tools.replace_file)
+    instead of writing into them.
 
-    # Log skipped files
-    with open(os.path.join(DATA_PATH, "skipped_files.log"), "w") as f:
-        for _, row in unchanged_html_files.iterrows():
-            f.write(f"{row["URL"]}\n")
+    Returns "linked" or "copied".
+    """
+    mode = mode or CARRY_FORWARD_MODE
+    if os.path.lexists(dst_path):
+        os.remove(dst_path)
+    if mode == "hardlink":
+        try:
+            os.link(src_path, dst_path)
+            return "linked"
+        except OSError as e:
+            print(f"Could not hardlink {src_path} ({e}); copying it")
+    shutil.copyfile(src_path, dst_path)
+    return "copied"
 
-    # Log files to be processed
-    with open(os.path.join(DATA_PATH, "processed_files.log"), "w") as f:
-        for _, row in files_to_process.iterrows():
-            f.write(f"{row["URL"]}\n")
 
-    stats["files_processed"] = len(files_to_process)
-    return files_to_process
+def write_url_log(path, df):
+    """Write the URL column of df to path, one URL per line."""
+    with open(path, "w") as f:
+        f.writelines(f"{url}\n" for url in df["URL"])
 
 
 def process_modified_files(
@@ -150,40 +263,51 @@ def process_modified_files(
     stats,
     empty_llamaparse_files_counted,
     detailed_log_path,
+    carried_paths=(),
 ):
     """
     Process modified files and associate metadata with Markdown files.
+
+    The Markdown of processed files is written with its metadata; only the files carried
+    forward from the last run (`carried_paths`) are post-processed afterwards.
     """
     if is_directory_empty(input_directory):
         print("No modified files found; skipping file processing.")
         return
 
-    print("Starting file processing for modified files...")
-
-    stats["files_processed_by_directory"] = process_directory(
-        input_directory, out_folder, stats, empty_llamaparse_files_counted, detailed_log_path
-    )  # convert the files to md
-
-    print("File processing for modified files completed.")
-
-    add_titles_tag(input_directory, out_folder)
-
-    print("Associating Markdown files with metadata...")
     excluded_domains = []
     if os.path.exists(excluded_domains_path):
         with open(excluded_domains_path, encoding="UTF-8") as f:
             excluded_domains = f.read().splitlines()
 
     all_links_path = os.path.join(DATA_PATH, metadata_csv)
-    if not os.path.exists(all_links_path):
+    link_metadata = load_link_metadata(all_links_path) if os.path.exists(all_links_path) else None
+
+    print("Starting file processing for modified files...")
+
+    stats["files_processed_by_directory"] = process_directory(
+        input_directory,
+        out_folder,
+        stats,
+        empty_llamaparse_files_counted,
+        detailed_log_path,
+        workers=PARSE_WORKERS,
+        llamaparse_max_in_flight=LLAMAPARSE_MAX_IN_FLIGHT,
+        pdf_workers=PDF_PARTITION_WORKERS,
+        link_metadata=link_metadata,
+        excluded_domains=excluded_domains,
+    )  # convert the files to md and attach their metadata
+
+    print("File processing for modified files completed.")
+
+    if link_metadata is None:
         print(f"Error: {all_links_path} not found. Cannot attach metadata.")
         return
 
-    metadata_dict = associate_markdown_with_metadata(out_folder, all_links_path, excluded_domains)
-    print("Metadata association completed.")
-
-    print("Attaching metadata to Markdown files...")
-    attach_metadata_to_markdown_directories(out_folder, metadata_dict)
+    print("Cleaning and attaching metadata to carried-forward Markdown files...")
+    postprocess_markdown_files(
+        out_folder, all_links_path, excluded_domains, workers=PARSE_WORKERS, markdown_paths=carried_paths
+    )
     print("Metadata attachment completed.")
 
     print("Processing special formats...")
@@ -1,20 +1,47 @@
+import argparse
 import json
 import os
 import time
+from collections import Counter
 
 import dotenv
 import pandas as pd
 from pinecone import Pinecone, ServerlessSpec
-from llama_index.core import Document
+from llama_index.core import Document, VectorStoreIndex
 from llama_index.core.vector_stores.types import VectorStoreQueryMode
-from llama_index.embeddings.openai import OpenAIEmbedding
 from llama_index.vector_stores.pinecone import PineconeVectorStore
 
+from utils.embedding_cache import CachedOpenAIEmbedding
 from utils.hyper_functions import AltNodeParser, extract_index_metadata, run_pipeline
+from utils.vector_sync import PineconeSyncTarget, sync_documents
 
 # Load environment variables
 dotenv.load_dotenv()
 
+# "recreate" rebuilds the index from scratch; "incremental" only embeds new and changed
+# documents and deletes the vectors of removed ones (see utils.vector_sync); "bluegreen"
+# builds a new generation in its own namespace and switches the index pointer to it
+INDEX_SYNC_MODE = os.getenv("INDEX_SYNC_MODE", "recreate")
+
+EMBED_DIMENSIONS = 3072  # text-embedding-3-large
+
+# The live generation is recorded in a single pointer record, so readers resolve the
+# namespace to query with read_index_pointer and a switch is one atomic upsert. The record
+# is a placeholder vector in the same index, so it has EMBED_DIMENSIONS values: changing
+# the embedding dimensions means recreating the index, which also drops the pointer
+POINTER_NAMESPACE = "index-pointer"
+POINTER_ID = "live"
+GENERATION_PREFIX = "gen-"
+# How describe_index_stats names the namespace recreate and pre-bluegreen incremental runs write to
+DEFAULT_NAMESPACES = ("", "__default__")
+# A new generation is rejected if it has fewer vectors than this share of the live one
+INDEX_MIN_NODE_RATIO = float(os.getenv("INDEX_MIN_NODE_RATIO", "0.5"))
+# An incremental sync is aborted if it would keep less than INDEX_MIN_NODE_RATIO of the
+# documents in the index, or remove more than this many documents (-1 for no limit)
+INDEX_SYNC_MAX_REMOVED = int(os.getenv("INDEX_SYNC_MAX_REMOVED", "-1"))
+# How long to wait for the vector count of a new generation to catch up with the upserts
+INDEX_VALIDATION_TIMEOUT = int(os.getenv("INDEX_VALIDATION_TIMEOUT", "300"))
+
 
 def recreate_pinecone_index():
     """
@@ -42,12 +69,31 @@ def recreate_pinecone_index():
     except Exception as e:
         print(f"Error checking existing indexes: {e}")
     
-    # Create new index
+    create_pinecone_index(pc, index_name)
+
+
+def ensure_pinecone_index():
+    """
+    Create the Pinecone index if it does not exist yet, keeping its vectors otherwise.
+    """
+    pc = Pinecone()
+
+    index_name = os.getenv("PINECONE_INDEX_NAME")
+    if not index_name:
+        raise ValueError("PINECONE_INDEX_NAME environment variable is required")
+
+    if index_name in [index.name for index in pc.list_indexes()]:
+        print(f"Index '{index_name}' exists. Syncing it incrementally.")
+        return
+    create_pinecone_index(pc, index_name)
+
+
+def create_pinecone_index(pc, index_name):
     print(f"Creating new index '{index_name}'...")
     try:
         pc.create_index(
             name=index_name,
-            dimension=3072,  # Using text-embedding-3-large dimensions
+            dimension=EMBED_DIMENSIONS,
             metric="cosine",
             spec=ServerlessSpec(
                 cloud="aws",
@@ -60,7 +106,109 @@ def recreate_pinecone_index():
         raise
 
 
-def get_vector_store():
+def get_pinecone_index():
+    """
+    Get the Pinecone index named by PINECONE_INDEX_NAME.
+    """
+    index_name = os.getenv("PINECONE_INDEX_NAME")
+    if not index_name:
+        raise ValueError("PINECONE_INDEX_NAME environment variable is required")
+    return Pinecone().Index(index_name)
+
+
+def read_index_pointer(index):
+    """
+    Return the index pointer as {"live": namespace, "previous": namespace}, or {} if
+    no generation has been switched to yet.
+    """
+    response = index.fetch(ids=[POINTER_ID], namespace=POINTER_NAMESPACE)
+    record = response.vectors.get(POINTER_ID)
+    if record is None:
+        return {}
+    return {"live": record.metadata.get("live", ""), "previous": record.metadata.get("previous", "")}
+
+
+def write_index_pointer(index, live, previous):
+    # Pinecone does not accept all-zero vectors for the cosine metric
+    values = [1.0] + [0.0] * (EMBED_DIMENSIONS - 1)
+    index.upsert(
+        vectors=[{"id": POINTER_ID, "values": values, "metadata": {"live": live, "previous": previous or ""}}],
+        namespace=POINTER_NAMESPACE,
+    )
+
+
+def namespace_vector_count(index, namespace):
+    summary = index.describe_index_stats().namespaces.get(namespace)
+    return summary.vector_count if summary else 0
+
+
+def new_generation_namespace():
+    return GENERATION_PREFIX + time.strftime("%Y%m%d-%H%M%S")
+
+
+def validate_generation(index, namespace, expected_count, pointer):
+    """
+    Check that a new generation holds every node the pipeline produced and is not much
+    smaller than the live one. Raises ValueError otherwise, leaving the pointer untouched.
+    """
+    if expected_count == 0:
+        raise ValueError(f"Generation '{namespace}' has no nodes")
+
+    # Vector counts are eventually consistent, so wait for them to catch up with the upserts
+    deadline = time.time() + INDEX_VALIDATION_TIMEOUT
+    count = namespace_vector_count(index, namespace)
+    while count < expected_count and time.time() < deadline:
+        time.sleep(5)
+        count = namespace_vector_count(index, namespace)
+    if count != expected_count:
+        raise ValueError(f"Generation '{namespace}' has {count} vectors, expected {expected_count}")
+
+    live = pointer.get("live")
+    if live:
+        live_count = namespace_vector_count(index, live)
+        if count < live_count * INDEX_MIN_NODE_RATIO:
+            raise ValueError(
+                f"Generation '{namespace}' has {count} vectors, less than {INDEX_MIN_NODE_RATIO:.0%} "
+                f"of the {live_count} in the live generation '{live}'"
+            )
+    print(f"Generation '{namespace}' validated with {count} vectors.")
+
+
+def switch_index_pointer(index, namespace, pointer):
+    """
+    Point readers at `namespace`, keep the generation it replaces for rollback and
+    delete any older ones. The vectors left in the default namespace from before the
+    first switch are deleted too, since nothing reads or rolls back to them anymore.
+    """
+    previous = pointer.get("live", "")
+    write_index_pointer(index, namespace, previous)
+    print(f"Index pointer switched to '{namespace}' (previous: '{previous or 'none'}').")
+
+    for old_namespace in index.describe_index_stats().namespaces:
+        if old_namespace.startswith(GENERATION_PREFIX) and old_namespace not in (namespace, previous):
+            print(f"Deleting old generation '{old_namespace}'...")
+            index.delete(delete_all=True, namespace=old_namespace)
+        elif old_namespace in DEFAULT_NAMESPACES:
+            print("Deleting the vectors of the default namespace...")
+            index.delete(delete_all=True, namespace="")
+
+
+def rollback_index_pointer():
+    """
+    Point readers back at the previous generation. Running it again undoes the rollback.
+    """
+    index = get_pinecone_index()
+    pointer = read_index_pointer(index)
+    previous = pointer.get("previous")
+    if not previous:
+        raise ValueError("There is no previous generation to roll back to")
+    if namespace_vector_count(index, previous) == 0:
+        raise ValueError(f"The previous generation '{previous}' is empty")
+    write_index_pointer(index, previous, pointer["live"])
+    print(f"Index pointer rolled back to '{previous}' (previous: '{pointer['live']}').")
+
+
+def get_vector_store(namespace=None):
     """
     Get PineconeVectorStore instance using environment variables.
     """
@@ -78,6 +226,7 @@ def get_vector_store():
         api_key=api_key,
         index_name=index_name,
         environment=environment,
+        namespace=namespace,
     )
     return store
 
@@ -129,17 +278,18 @@ def load_documents():
 
 def setup_embedding_model():
     """
-    Setup the OpenAI embedding model.
+    Setup the OpenAI embedding model, backed by the on-disk embedding cache
+    (see utils.embedding_cache) so unchanged chunks are not embedded again.
     """
     embed_model_name = "text-embedding-3-large"
     
-    embed_model = OpenAIEmbedding(
+    embed_model = CachedOpenAIEmbedding(
         model=embed_model_name,
         embed_batch_size=100,
         max_retries=25,
         timeout=180,
         reuse_client=True,
-        dimensions=3072,
+        dimensions=EMBED_DIMENSIONS,
     )
     return embed_model
 
@@ -207,21 +357,52 @@ def main():
         print("Starting vector store recreation and document processing...")
         
         # Step 1: Recreate Pinecone index
-        print("\n=== Step 1: Recreating Pinecone Index ===")
-        recreate_pinecone_index()
+        namespace = None
+        if INDEX_SYNC_MODE in ("incremental", "bluegreen"):
+            print("\n=== Step 1: Checking Pinecone Index ===")
+            ensure_pinecone_index()
+            pinecone_index = get_pinecone_index()
+            pointer = read_index_pointer(pinecone_index)
+            if INDEX_SYNC_MODE == "bluegreen":
+                namespace = new_generation_namespace()
+                print(f"Building generation '{namespace}' (live: '{pointer.get('live') or 'none'}')")
+            else:
+                # Keep syncing the live generation if the index has switched to blue/green
+                namespace = pointer.get("live") or None
+        else:
+            print("\n=== Step 1: Recreating Pinecone Index ===")
+            recreate_pinecone_index()
         
         # Step 2: Setup components
         print("\n=== Step 2: Setting up components ===")
         documents = load_documents()
         embed_model = setup_embedding_model()
         splitter = setup_splitter()
-        vector_store = get_vector_store()
+        vector_store = get_vector_store(namespace)
         
         # Step 3: Run the processing pipeline
         print("\n=== Step 3: Running processing pipeline ===")
         print("Starting pipeline...")
-        index, nodes = run_pipeline(documents, splitter, embed_model, vector_store, False)
+        if INDEX_SYNC_MODE == "incremental":
+            nodes, node_counts, sync_stats = sync_documents(
+                documents,
+                splitter,
+                embed_model,
+                PineconeSyncTarget(vector_store),
+                min_document_ratio=INDEX_MIN_NODE_RATIO,
+                max_removed_documents=INDEX_SYNC_MAX_REMOVED if INDEX_SYNC_MAX_REMOVED >= 0 else None,
+            )
+            stats.update(sync_stats)
+            index = VectorStoreIndex.from_vector_store(vector_store, embed_model=embed_model)
+        else:
+            index, nodes = run_pipeline(documents, splitter, embed_model, vector_store, False)
+            node_counts = Counter(node.metadata.get("filepath") for node in nodes)
         print("Pipeline finished!")
+
+        if INDEX_SYNC_MODE == "bluegreen":
+            print("\n=== Step 3b: Validating and switching generation ===")
+            validate_generation(pinecone_index, namespace, sum(node_counts.values()), pointer)
+            switch_index_pointer(pinecone_index, namespace, pointer)
         
         # Step 4: Create retriever
         print("\n=== Step 4: Creating retriever ===")
@@ -229,6 +410,7 @@ def main():
         
         print(f"\n✅ Process completed successfully!")
         print(f"   - Total nodes processed: {len(nodes)}")
+        print(f"   - Total nodes in index: {sum(node_counts.values())}")
         print(f"   - Vector store ready for queries")
 
         # Track all markdown files loaded for indexing (all .md files in output dirs)
@@ -280,10 +462,10 @@ def main():
         except Exception as e:
             print(f"Warning: Could not load URLs from all_links.csv: {e}")
 
-        for node in nodes:
-            filepath = node.metadata.get("filepath")
+        # Unchanged documents are not split again in incremental mode, so count from node_counts
+        for filepath, count in node_counts.items():
             if filepath in stats["node_counts_per_file"]:
-                stats["node_counts_per_file"][filepath] += 1
+                stats["node_counts_per_file"][filepath] += count
 
         # Count nodes for each file and track zero-node files for error reporting
         zero_node_files_with_full_data = []
@@ -410,4 +592,12 @@ Number of files that had no indexable content.
 
 
 if __name__ == "__main__":
-    index, retriever, nodes = main()
+    parser = argparse.ArgumentParser(description="Load the crawled documents into the Pinecone index.")
+    parser.add_argument("--rollback", action="store_true",
+                        help="Point the index back at the previous blue/green generation and exit.")
+    args = parser.parse_args()
+
+    if args.rollback:
+        rollback_index_pointer()
+    else:
+        index, retriever, nodes = main()
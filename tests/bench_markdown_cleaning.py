@@ -0,0 +1,43 @@
+"""
+Microbenchmark of clean_markdown over the golden documents, or over the Markdown files
+given as arguments, e.g. a previous run's out/from_html folder:
+
+    python -m tests.bench_markdown_cleaning data/<run>/out/from_html/*.md
+"""
+
+import argparse
+import glob
+import os
+import timeit
+
+from utils.parser import MARKDOWN_CLEANING_RULES, clean_markdown
+
+GOLDEN_INPUT = os.path.join(os.path.dirname(__file__), "fixtures", "markdown_cleaning", "input", "*.md")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time clean_markdown per document and per rule.")
+    parser.add_argument("files", nargs="*", help="Markdown files (default: the golden inputs)")
+    parser.add_argument("--repeat", type=int, default=20, help="Passes over the documents")
+    args = parser.parse_args()
+
+    documents = []
+    for path in args.files or sorted(glob.glob(GOLDEN_INPUT)):
+        with open(path, encoding="utf-8") as f:
+            documents.append(f.read())
+    if not documents:
+        parser.error("no documents to clean")
+
+    seconds = timeit.timeit(lambda: [clean_markdown(text) for text in documents], number=args.repeat)
+    characters = sum(len(text) for text in documents)
+    print(f"{len(documents)} documents, {characters / len(documents):,.0f} chars on average")
+    print(f"{seconds / (args.repeat * len(documents)) * 1000:.3f} ms/doc\n")
+
+    MARKDOWN_CLEANING_RULES.reset_timings()
+    for text in documents:
+        clean_markdown(text, profile=True)
+    MARKDOWN_CLEANING_RULES.report()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+import http.server
+import threading
+import time
+
+import pytest
+
+
+class LocalSite:
+    """
+    Routes served by the local test server: path -> (status, headers, body).
+    Every request is recorded as (path, headers) and answered after `delay` seconds.
+    """
+
+    def __init__(self, url):
+        self.url = url
+        self.routes = {}
+        self.requests = []
+        self.delay = 0.0
+
+    def add(self, path, body, content_type="text/html; charset=utf-8", status=200, headers=None):
+        self.routes[path] = (status, {"Content-Type": content_type, **(headers or {})}, body)
+        return self.url + path
+
+    def paths_requested(self):
+        return [path for path, _ in self.requests]
+
+
+class _Server(http.server.ThreadingHTTPServer):
+    daemon_threads = True
+    # The default backlog of 5 makes extra concurrent connections wait for a SYN retry
+    request_queue_size = 64
+
+
+def _make_handler(site):
+    class Handler(http.server.BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            site.requests.append((self.path, dict(self.headers)))
+            time.sleep(site.delay)
+            status, headers, body = site.routes.get(self.path, (404, {}, b""))
+            if callable(body):
+                status, headers, body = body(self.headers)
+            self.send_response(status)
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    return Handler
+
+
+@pytest.fixture
+def local_site():
+    server = _Server(("127.0.0.1", 0), None)
+    site = LocalSite(f"http://127.0.0.1:{server.server_port}")
+    server.RequestHandlerClass = _make_handler(site)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield site
+    server.shutdown()
+    server.server_close()
@@ -0,0 +1,69 @@
+"""
+Local stand-in for the LlamaParse API, for tests and benchmarks of the parse stage.
+
+Point the parser at it with LLAMA_CLOUD_BASE_URL. Every upload becomes a job that
+succeeds on the first status check and whose Markdown is "# Parsed" followed by the
+uploaded text. The server records how many jobs were in flight (uploaded but their
+result not yet fetched) at the same time.
+
+Run it on its own with: python tests/mock_llamaparse.py [port]
+"""
+
+import asyncio
+import sys
+import threading
+import uuid
+
+from aiohttp import web
+
+
+class MockLlamaParse:
+    def __init__(self):
+        self.jobs = {}
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.uploads = 0
+        self.app = web.Application(client_max_size=50 * 2**20)
+        self.app.router.add_post("/api/parsing/upload", self.upload)
+        self.app.router.add_get("/api/parsing/job/{id}", self.status)
+        self.app.router.add_get("/api/parsing/job/{id}/result/{result_type}", self.result)
+
+    def reset(self):
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.uploads = 0
+
+    async def upload(self, request):
+        data = await request.post()
+        job_id = str(uuid.uuid4())
+        self.jobs[job_id] = data["file"].file.read().decode("utf-8")
+        self.uploads += 1
+        self.in_flight += 1
+        self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        return web.json_response({"id": job_id})
+
+    async def status(self, request):
+        return web.json_response({"status": "SUCCESS"})
+
+    async def result(self, request):
+        content = self.jobs.pop(request.match_info["id"])
+        self.in_flight -= 1
+        return web.json_response({request.match_info["result_type"]: f"# Parsed\n\n{content}"})
+
+    def start(self, port=0):
+        """Serve in a background thread and return the base URL."""
+        loop = asyncio.new_event_loop()
+        runner = web.AppRunner(self.app)
+        loop.run_until_complete(runner.setup())
+        site = web.TCPSite(runner, "127.0.0.1", port)
+        loop.run_until_complete(site.start())
+        self._stop = lambda: loop.call_soon_threadsafe(loop.stop)
+        threading.Thread(target=loop.run_forever, daemon=True).start()
+        return f"http://127.0.0.1:{site._server.sockets[0].getsockname()[1]}"
+
+    def stop(self):
+        self._stop()
+
+
+if __name__ == "__main__":
+    web.run_app(MockLlamaParse().app, host="127.0.0.1", port=int(sys.argv[1]) if len(sys.argv) > 1 else 8765)
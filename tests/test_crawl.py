@@ -0,0 +1,180 @@
+import asyncio
+import os
+import time
+
+import pandas as pd
+import pytest
+import requests
+
+from utils.crawl import CrawlJournal, CrawlResponse, HttpCache, crawl_csv, generate_hash_filename
+
+# Let the tests go as fast as the local server answers
+FAST = {"host_rate": 1000, "host_burst": 100, "retry_delay": 0}
+
+
+def links(*urls):
+    return pd.DataFrame(
+        [
+            {
+                "Section": "Section",
+                "Subsection": "Subsection",
+                "Title": f"Title {i}",
+                "URL": url,
+                "filename": generate_hash_filename(url),
+                "Role": "ACM",
+            }
+            for i, url in enumerate(urls)
+        ]
+    )
+
+
+def crawl(df, base_dir, **kwargs):
+    asyncio.run(crawl_csv(df, str(base_dir), **{**FAST, **kwargs}))
+    return pd.read_csv(os.path.join(base_dir, "output_data.csv"))
+
+
+def test_engines_write_the_same_rows(local_site, tmp_path):
+    df = links(
+        # No charset: requests decodes text/html as ISO-8859-1
+        local_site.add("/latin", "<html><body><p>Café</p></body></html>".encode("latin-1"), "text/html"),
+        local_site.add("/utf8", "<html><body><p>Café</p></body></html>".encode()),
+        local_site.add("/doc.pdf", b"%PDF-1.4 test", "application/pdf"),
+    )
+
+    outputs = {engine: crawl(df, tmp_path / engine, engine=engine) for engine in ("async", "sync")}
+
+    columns = ["URL", "Content Type", "Content Hash"]
+    pd.testing.assert_frame_equal(outputs["async"][columns], outputs["sync"][columns])
+    for filepath in outputs["async"]["Filepath"]:
+        if filepath.endswith(".html"):
+            with open(filepath, encoding="utf-8") as f:
+                assert "Café" in f.read()
+    user_agents = {headers["User-Agent"] for _, headers in local_site.requests}
+    assert user_agents == {requests.utils.default_user_agent()}
+
+
+def test_async_engine_fetches_concurrently(local_site, tmp_path):
+    local_site.delay = 0.2
+    df = links(*[local_site.add(f"/page{i}", f"<p>{i}</p>".encode()) for i in range(10)])
+
+    start = time.monotonic()
+    crawl(df, tmp_path / "sequential", max_concurrency=1, max_per_host=1)
+    sequential = time.monotonic() - start
+
+    start = time.monotonic()
+    output = crawl(df, tmp_path / "concurrent", max_concurrency=10, max_per_host=10)
+    concurrent = time.monotonic() - start
+
+    assert len(output) == 10
+    assert sequential >= 10 * local_site.delay
+    assert concurrent < sequential / 3
+
+
+def etag_page(body):
+    """A page that answers If-None-Match with 304."""
+
+    def respond(headers):
+        if headers.get("If-None-Match") == '"v1"':
+            return 304, {"ETag": '"v1"'}, b""
+        return 200, {"Content-Type": "text/html; charset=utf-8", "ETag": '"v1"'}, body
+
+    return respond
+
+
+def test_revalidates_only_pages_with_previous_markdown(local_site, tmp_path):
+    with_markdown = local_site.add("/with-markdown", etag_page(b"<p>a</p>"))
+    without_markdown = local_site.add("/without-markdown", etag_page(b"<p>b</p>"))
+    df = links(with_markdown, without_markdown)
+    http_cache_path = str(tmp_path / "http_cache.json")
+    crawl(df, tmp_path / "run1", http_cache_path=http_cache_path)
+
+    # Only the first page made it to Markdown last time
+    markdown_dir = tmp_path / "run1" / "out" / "from_html"
+    markdown_dir.mkdir(parents=True)
+    (markdown_dir / f"{generate_hash_filename(with_markdown)}.md").write_text("a")
+    local_site.requests.clear()
+    output = crawl(df, tmp_path / "run2", http_cache_path=http_cache_path, previous_markdown_dir=str(markdown_dir))
+
+    conditional = {path: "If-None-Match" in headers for path, headers in local_site.requests}
+    assert conditional == {"/with-markdown": True, "/without-markdown": False}
+    # The page without Markdown was downloaded again, so there is something to parse
+    assert output["Filepath"].map(os.path.exists).tolist() == [False, True]
+
+
+def test_does_not_revalidate_without_previous_markdown_dir(local_site, tmp_path):
+    df = links(local_site.add("/page", etag_page(b"<p>a</p>")))
+    http_cache_path = str(tmp_path / "http_cache.json")
+    crawl(df, tmp_path / "run1", http_cache_path=http_cache_path)
+    local_site.requests.clear()
+    crawl(df, tmp_path / "run2", http_cache_path=http_cache_path)
+
+    assert ["If-None-Match" in headers for _, headers in local_site.requests] == [False]
+
+
+def test_journal_is_removed_once_output_is_written(local_site, tmp_path):
+    df = links(local_site.add("/doc.pdf", b"%PDF-1.4 test", "application/pdf"))
+    output = crawl(df, tmp_path)
+    assert not os.path.exists(tmp_path / "crawl_journal.jsonl")
+
+    # A later crawl of the same folder fetches again instead of resuming
+    os.remove(output["Filepath"][0])
+    local_site.requests.clear()
+    output = crawl(df, tmp_path)
+
+    assert local_site.paths_requested() == ["/doc.pdf"]
+    assert os.path.exists(output["Filepath"][0])
+
+
+def test_resume_fetches_failed_urls_again(local_site, tmp_path):
+    ok = local_site.add("/ok", b"<p>ok</p>")
+    flaky = local_site.add("/flaky", b"", status=500)
+    df = links(ok, flaky)
+    # Writing the output fails, as if the crawl was interrupted after fetching
+    with pytest.raises(OSError):
+        asyncio.run(crawl_csv(df, str(tmp_path), output_file="missing/output_data.csv", **FAST))
+    journal = CrawlJournal(str(tmp_path / "crawl_journal.jsonl"))
+    assert list(journal.load()) == [ok]
+
+    local_site.add("/flaky", b"<p>back</p>")
+    local_site.requests.clear()
+    output = crawl(df, tmp_path)
+
+    assert local_site.paths_requested() == ["/flaky"]
+    assert output["Content Hash"].notna().all()
+    assert not os.path.exists(journal.path)
+
+
+@pytest.mark.parametrize("engine", ["async", "sync"])
+def test_saves_binaries_of_any_non_error_status(local_site, tmp_path, engine):
+    df = links(
+        local_site.add("/partial.pdf", b"%PDF-1.4 partial", "application/pdf", status=203),
+        # Not a redirect without a Location, so the body is not streamed
+        local_site.add("/choices.bin", b"\x00\x01", "application/octet-stream", status=300),
+    )
+    output = crawl(df, tmp_path, engine=engine)
+
+    assert output["Content Type"].tolist() == ["pdf", "octet-stream"]
+    for filepath, body in zip(output["Filepath"], [b"%PDF-1.4 partial", b"\x00\x01"]):
+        with open(filepath, "rb") as f:
+            assert f.read() == body
+
+
+def test_forgets_http_cache_entries(local_site, tmp_path):
+    kept = local_site.add("/kept", etag_page(b"<p>kept</p>"))
+    removed = local_site.add("/removed", etag_page(b"<p>removed</p>"))
+    http_cache_path = str(tmp_path / "http_cache.json")
+    crawl(links(kept, removed), tmp_path / "run1", http_cache_path=http_cache_path)
+
+    crawl(links(kept), tmp_path / "run2", http_cache_path=http_cache_path, forget_urls={removed})
+
+    assert set(HttpCache(http_cache_path).entries) == {kept}
+
+
+def test_response_text_is_decoded_once(monkeypatch):
+    detections = []
+    detect = requests.compat.chardet.detect
+    monkeypatch.setattr(requests.compat.chardet, "detect", lambda data: detections.append(data) or detect(data))
+    response = CrawlResponse("http://example.org/", 200, {}, "<p>caf\u00e9</p>".encode())
+
+    assert response.text == response.text == "<p>caf\u00e9</p>"
+    assert len(detections) == 1
@@ -0,0 +1,63 @@
+import multiprocessing
+
+import numpy as np
+
+from utils import embedding_cache
+from utils.embedding_cache import EmbeddingCache, get_embedding_cache
+
+
+def embedding(text, dimensions=8):
+    return np.random.default_rng(list(text.encode())).random(dimensions).tolist()
+
+
+def put_texts(cache_dir, texts):
+    cache = get_embedding_cache("text-embedding-3-small", cache_dir=cache_dir, max_mb=1)
+    for text in texts:
+        cache.put_many([text], [embedding(text)])
+
+
+def test_default_dimensions_share_a_cache(tmp_path):
+    cache = get_embedding_cache("text-embedding-3-large", cache_dir=str(tmp_path))
+
+    assert get_embedding_cache("text-embedding-3-large", 3072, cache_dir=str(tmp_path)) is cache
+    assert get_embedding_cache("text-embedding-3-large", 256, cache_dir=str(tmp_path)) is not cache
+    assert get_embedding_cache("text-embedding-3-large", cache_dir=str(tmp_path), max_mb=0) is None
+
+
+def test_evicts_least_recently_used_entries(tmp_path, monkeypatch):
+    monkeypatch.setattr(embedding_cache, "INITIAL_ROWS", 16)
+    texts = [f"chunk {i}" for i in range(150)]
+    # Room for 100 embeddings of 8 dimensions
+    cache = EmbeddingCache(str(tmp_path / "cache"), 100 * 8 * 4)
+    cache.put_many(texts[:100], [embedding(text) for text in texts[:100]])
+    cache.get_many(texts[:10])
+    cache.put_many(texts[100:], [embedding(text) for text in texts[100:]])
+
+    cached = EmbeddingCache(str(tmp_path / "cache"), 100 * 8 * 4).get_many(texts)
+    kept = [i for i, vector in enumerate(cached) if vector is not None]
+    # The ten entries read since are kept, and 50 of the other 90 are evicted
+    assert len(kept) == 100
+    assert set(range(10)) | set(range(100, 150)) <= set(kept)
+    for i in kept:
+        assert np.allclose(cached[i], embedding(texts[i]))
+
+
+def test_processes_share_the_cache(tmp_path, monkeypatch):
+    # Small files, so the processes grow them while the others are writing
+    monkeypatch.setattr(embedding_cache, "INITIAL_ROWS", 4)
+    cache_dir = str(tmp_path)
+    cache = get_embedding_cache("text-embedding-3-small", cache_dir=cache_dir, max_mb=1)
+    cache.put_many(["parent"], [embedding("parent")])
+
+    batches = [[f"process {p} text {i}" for i in range(100)] for p in range(4)]
+    context = multiprocessing.get_context("spawn")
+    processes = [context.Process(target=put_texts, args=(cache_dir, texts)) for texts in batches]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+    assert [process.exitcode for process in processes] == [0] * len(processes)
+
+    texts = ["parent"] + [text for texts in batches for text in texts]
+    cached = cache.get_many(texts)
+    assert all(vector is not None and np.allclose(vector, embedding(text)) for text, vector in zip(texts, cached))
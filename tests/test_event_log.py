@@ -0,0 +1,20 @@
+import json
+import time
+
+from utils.event_log import EventLogWriter
+
+
+def test_buffered_entries_are_flushed_after_the_interval(tmp_path):
+    path = tmp_path / "log.jsonl"
+    writer = EventLogWriter(str(path), flush_interval=0.1)
+    writer.write({"event": "first"})
+    assert not path.exists()
+
+    # No further write arrives, the timer alone writes the entry out
+    deadline = time.monotonic() + 5
+    while not path.exists() and time.monotonic() < deadline:
+        time.sleep(0.02)
+    writer.close()
+
+    assert [json.loads(line) for line in path.read_text(encoding="utf-8").splitlines()] == [{"event": "first"}]
+    assert writer.timer is None
@@ -0,0 +1,28 @@
+import os
+
+import pytest
+
+from utils.parser import convert_html_to_markdown, html_to_markdown
+
+# Saved pages converted by the clean_html that used soup.select and markdownify's
+# re-parse of str(soup), before the one-walk traversal
+FIXTURES_DIR = os.path.join(os.path.dirname(__file__), "fixtures", "html_to_markdown")
+
+
+@pytest.mark.parametrize("name", sorted(os.listdir(os.path.join(FIXTURES_DIR, "input"))))
+def test_converts_like_the_stored_markdown(name):
+    markdown, _ = convert_html_to_markdown(os.path.join(FIXTURES_DIR, "input", name))
+
+    with open(os.path.join(FIXTURES_DIR, "expected", name.replace(".html", ".md")), encoding="utf-8", newline="") as f:
+        assert markdown == f.read()
+
+
+def test_returns_the_title_the_crawler_prepended():
+    with open(os.path.join(FIXTURES_DIR, "input", "article.html"), encoding="utf-8") as f:
+        _, title = html_to_markdown(f.read())
+
+    assert title == "Tuition and Fees"
+
+
+def test_page_without_content_is_an_error():
+    assert html_to_markdown("<html><body><nav><a href='/'>Home</a></nav>\n\n</body></html>") == (None, "Error parsing.")
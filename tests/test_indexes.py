@@ -0,0 +1,31 @@
+import pandas as pd
+
+from utils.indexes import diff_link_inventories, read_links_diff
+
+
+def inventory(*rows):
+    return pd.DataFrame(rows, columns=["URL", "Section", "Subsection", "Title", "Role", "filename"])
+
+
+def test_read_links_diff_groups_urls_by_change(tmp_path):
+    previous = inventory(
+        ["https://a", "S", "", "A", "ACM", "a"],
+        ["https://b", "S", "", "B", "ACM", "b"],
+        ["https://c", "S", "", "C", "ACM", "c"],
+    )
+    current = inventory(
+        ["https://a", "S", "", "A", "ACM", "a"],
+        ["https://b", "S", "", "B renamed", "ACM", "b"],
+        ["https://d", "S", "", "D", "ACM", "d"],
+    )
+    diff_link_inventories(previous, current).to_csv(tmp_path / "links_diff.csv", index=False)
+
+    assert read_links_diff(str(tmp_path)) == {
+        "added": {"https://d"},
+        "removed": {"https://c"},
+        "metadata_changed": {"https://b"},
+    }
+
+
+def test_read_links_diff_without_diff(tmp_path):
+    assert read_links_diff(str(tmp_path)) is None
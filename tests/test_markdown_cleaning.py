@@ -0,0 +1,27 @@
+import os
+
+import pytest
+
+from utils.parser import MARKDOWN_CLEANING_RULES, clean_markdown
+
+# Documents cleaned by the clean_markdown that ran each re.sub in turn, before the rule table
+GOLDEN_DIR = os.path.join(os.path.dirname(__file__), "fixtures", "markdown_cleaning")
+
+
+def read(*path):
+    with open(os.path.join(GOLDEN_DIR, *path), encoding="utf-8", newline="") as f:
+        return f.read()
+
+
+@pytest.mark.parametrize("name", sorted(os.listdir(os.path.join(GOLDEN_DIR, "input"))))
+def test_clean_markdown_matches_golden_output(name):
+    assert clean_markdown(read("input", name)) == read("expected", name)
+
+
+def test_profiling_does_not_change_the_output():
+    text = read("input", "knowledge_article.md")
+    MARKDOWN_CLEANING_RULES.reset_timings()
+
+    assert clean_markdown(text, profile=True) == read("expected", "knowledge_article.md")
+    assert set(MARKDOWN_CLEANING_RULES.timings) == {rule.name for rule in MARKDOWN_CLEANING_RULES.rules}
+    MARKDOWN_CLEANING_RULES.reset_timings()
@@ -0,0 +1,125 @@
+import os
+from collections import Counter
+
+import pytest
+
+from tests.mock_llamaparse import MockLlamaParse
+from utils import parser
+from utils.llamaparse_cache import LlamaParseCache
+
+
+@pytest.fixture
+def mock_llamaparse(monkeypatch):
+    mock = MockLlamaParse()
+    monkeypatch.setenv("LLAMA_CLOUD_BASE_URL", mock.start())
+    monkeypatch.setenv("LLAMA_CLOUD_API_KEY", "llx-test")
+    yield mock
+    mock.stop()
+
+
+def parse_pages(data_dir, pages, monkeypatch, **kwargs):
+    """Run process_directory over HTML pages and return the Markdown it wrote, by file name."""
+    html_dir = data_dir / "crawl" / "html"
+    html_dir.mkdir(parents=True)
+    for name, html in pages.items():
+        (html_dir / f"{name}.html").write_text(html, encoding="utf-8")
+    for folder in ["from_html", "from_pdf", "error"]:
+        (data_dir / "out" / folder).mkdir(parents=True)
+    # A fresh LlamaParse cache per run, so every page goes to the API
+    monkeypatch.setattr(parser, "llamaparse_cache", LlamaParseCache(str(data_dir / "llamaparse_cache")))
+
+    parser.process_directory(
+        str(data_dir / "crawl"), str(data_dir / "out"), Counter(), set(), str(data_dir / "log.jsonl"), **kwargs
+    )
+    markdown_dir = data_dir / "out" / "from_html"
+    return {name: (markdown_dir / name).read_text(encoding="utf-8") for name in sorted(os.listdir(markdown_dir))}
+
+
+def test_bounded_in_flight_matches_sequential(mock_llamaparse, tmp_path, monkeypatch):
+    pages = {
+        f"page{i}": f"<html><head><title>Page {i}</title></head><body><main><h1>Heading {i}</h1>"
+        f"<p>Paragraph {i}</p></main></body></html>"
+        for i in range(6)
+    }
+
+    sequential = parse_pages(tmp_path / "sequential", pages, monkeypatch)
+    assert mock_llamaparse.peak_in_flight == 1
+
+    mock_llamaparse.reset()
+    concurrent = parse_pages(tmp_path / "concurrent", pages, monkeypatch, llamaparse_max_in_flight=3)
+
+    assert mock_llamaparse.uploads == len(pages)
+    assert mock_llamaparse.peak_in_flight == 3
+    assert concurrent == sequential
+    assert len(concurrent) == len(pages)
+    assert all("# Parsed" in markdown for markdown in concurrent.values())
+
+
+def test_markdown_is_finalized_as_it_is_written(mock_llamaparse, tmp_path, monkeypatch):
+    pages = {"page": "<html><head><title>Page Title</title></head><body><main><p>Text</p></main></body></html>"}
+    metadata = {
+        "url": "https://example.org/page",
+        "heading": "Section",
+        "subheading": "",
+        "title": "Page",
+        "role": "ACM",
+    }
+
+    raw = parse_pages(tmp_path / "raw", pages, monkeypatch)["page.md"]
+    markdown = parse_pages(tmp_path / "final", pages, monkeypatch, link_metadata={"page": metadata})["page.md"]
+
+    assert raw.startswith("title: ")
+    # Written once, with what the separate post-processing pass used to write
+    assert markdown == parser.finalize_markdown(raw, metadata, [])[0]
+    assert "title_tag:" in markdown
+
+
+def test_postprocess_only_rewrites_the_given_files(tmp_path):
+    csv_path = tmp_path / "all_links.csv"
+    csv_path.write_text(
+        "Section,Subsection,Title,URL,filename,Role\n"
+        "New Section,Missing,Carried,https://example.org/carried,carried.html,ACM\n"
+        "Section,Missing,Parsed,https://example.org/parsed,parsed.html,ACM\n",
+        encoding="utf-8",
+    )
+    out_folder = tmp_path / "out" / "from_html"
+    out_folder.mkdir(parents=True)
+    old_metadata = {"url": "https://example.org/carried", "heading": "Old Section", "title": "Carried"}
+    previous = tmp_path / "previous.md"
+    previous.write_text(parser.finalize_markdown("Carried text", old_metadata, [], "Carried Page")[0], encoding="utf-8")
+    previous_content = previous.read_text(encoding="utf-8")
+    # Carried forward as a hardlink into the previous run
+    os.link(previous, out_folder / "carried.md")
+    (out_folder / "parsed.md").write_text("already final", encoding="utf-8")
+
+    results = parser.postprocess_markdown_files(
+        str(tmp_path / "out"), str(csv_path), [], markdown_paths=[str(out_folder / "carried.md")]
+    )
+
+    assert list(results) == [str(out_folder / "carried.md")]
+    carried = (out_folder / "carried.md").read_text(encoding="utf-8")
+    assert "heading: New Section" in carried
+    assert "title_tag: Carried Page" in carried
+    assert carried.endswith("Carried text")
+    assert previous.read_text(encoding="utf-8") == previous_content
+    assert (out_folder / "parsed.md").read_text(encoding="utf-8") == "already final"
+
+
+def test_llamaparse_cache_tolerates_concurrent_eviction(tmp_path, monkeypatch):
+    cache = LlamaParseCache(str(tmp_path), max_bytes=0)
+    key = LlamaParseCache.key("content", "instruction")
+    cache.put(key, "# Cached")
+    # A put still being written by another worker
+    in_flight = tmp_path / key[:2] / "partial.tmp"
+    in_flight.write_text("# Partial", encoding="utf-8")
+
+    def evicted_meanwhile(path):
+        raise FileNotFoundError(path)
+
+    with monkeypatch.context() as patch:
+        patch.setattr(os, "utime", evicted_meanwhile)
+        assert cache.get(key) == "# Cached"
+
+    assert cache.evict() == 1
+    assert cache.get(key) is None
+    assert in_flight.read_text(encoding="utf-8") == "# Partial"
@@ -0,0 +1,88 @@
+import pytest
+from llama_index.core import Document
+from llama_index.core.embeddings import MockEmbedding
+from llama_index.core.node_parser import SentenceSplitter
+
+from utils.vector_sync import InMemorySyncTarget, sync_documents
+
+LONG_TEXT = " ".join(f"Sentence number {i} of the page." for i in range(60))
+
+
+class CountingEmbedding(MockEmbedding):
+    """MockEmbedding that counts the texts it embeds."""
+
+    calls: int = 0
+
+    def _get_text_embeddings(self, texts):
+        self.calls += len(texts)
+        return super()._get_text_embeddings(texts)
+
+
+def documents(run, texts):
+    """Documents of one run: the Markdown of each URL gets a new filepath every run."""
+    return [
+        Document(text=text, metadata={"url": f"https://example.org/{url}", "filepath": f"/run{run}/{url}.md"})
+        for url, text in texts.items()
+    ]
+
+
+@pytest.fixture
+def sync():
+    splitter = SentenceSplitter(chunk_size=128, chunk_overlap=0)
+    embed_model = CountingEmbedding(embed_dim=8)
+    target = InMemorySyncTarget()
+
+    def run(docs, **kwargs):
+        embed_model.calls = 0
+        nodes, node_counts, stats = sync_documents(docs, splitter, embed_model, target, **kwargs)
+        return node_counts, stats, embed_model.calls
+
+    run.target = target
+    return run
+
+
+def test_sync_only_embeds_new_and_changed_documents(sync):
+    # A vector from a full rebuild, whose id is not in the sync format
+    sync.target.nodes["legacy-node-id"] = None
+    texts = {"long": LONG_TEXT, "short": "Short page.", "gone": "A page that is removed later."}
+
+    node_counts, stats, calls = sync(documents(1, texts))
+    assert stats["documents_new"] == 3
+    assert "legacy-node-id" not in sync.target.nodes
+    assert sum(node_counts.values()) == len(sync.target.nodes) == calls
+
+    node_counts, stats, calls = sync(documents(2, texts))
+    assert stats["documents_unchanged"] == 3
+    assert calls == 0
+    assert set(node_counts) == {"/run2/long.md", "/run2/short.md", "/run2/gone.md"}
+    assert sum(node_counts.values()) == len(sync.target.nodes)
+
+    texts = {"long": LONG_TEXT.replace("number 5 ", "number five "), "short": "Short page."}
+    node_counts, stats, calls = sync(documents(3, texts))
+    assert (stats["documents_unchanged"], stats["documents_changed"], stats["documents_removed"]) == (1, 1, 1)
+    assert calls == stats["vectors_upserted"] == node_counts["/run3/long.md"]
+    assert sum(node_counts.values()) == len(sync.target.nodes)
+    assert {node.metadata["filepath"] for node in sync.target.nodes.values()} == {"/run3/long.md", "/run1/short.md"}
+
+
+def test_sync_refuses_to_empty_the_index(sync):
+    sync(documents(1, {"page": "Page."}))
+    indexed = dict(sync.target.nodes)
+
+    with pytest.raises(ValueError, match="No documents"):
+        sync([])
+    assert sync.target.nodes == indexed
+
+
+def test_sync_refuses_to_remove_most_documents(sync):
+    sync(documents(1, {f"page{i}": f"Page {i}." for i in range(4)}))
+    indexed = dict(sync.target.nodes)
+
+    with pytest.raises(ValueError, match="keep 1 of the 4 documents"):
+        sync(documents(2, {"page0": "Page 0 changed."}))
+    with pytest.raises(ValueError, match="remove 2 documents"):
+        sync(documents(2, {"page0": "Page 0.", "page1": "Page 1."}), max_removed_documents=1)
+    assert sync.target.nodes == indexed
+
+    _, stats, _ = sync(documents(2, {"page0": "Page 0.", "page1": "Page 1."}))
+    assert stats["documents_removed"] == 2
@@ -3,6 +3,8 @@ import re
 
 import pandas as pd
 
+from utils.tools import replace_file
+
 
 def calendar_format(input_directory, metadata_csv):
     all_links_path = os.path.join(input_directory, metadata_csv)
@@ -29,9 +31,8 @@ def calendar_format(input_directory, metadata_csv):
                 # Combining transformed content and parsed tables
                 combined_content = updated_content + "\n\n"
 
-                # Save changes
-                with open(file_path, "w", encoding="utf-8") as file:
-                    file.write(combined_content)
+                # Save changes without touching the previous run's file it may be hardlinked to
+                replace_file(file_path, combined_content)
 
                 print(f"Calendar tables transformed successfully in {file_path}")
             except Exception as e:
@@ -1,21 +1,47 @@
 import asyncio
+import contextlib
 import datetime
+import email.utils
+import functools
 import hashlib
 import json
 import os
+import tempfile
 import time
 import zlib
 
+import aiohttp
 import nest_asyncio
 import pandas as pd
 import requests
 from bs4 import BeautifulSoup
 from playwright.async_api import async_playwright
 
-from utils.tools import create_folder
+from utils.event_log import flush_event_logs, log_event
+from utils.tools import create_folder, get_domain
 
 nest_asyncio.apply()
 
+# Default limits for the crawl engine
+MAX_CONCURRENCY = 10
+MAX_PER_HOST = 4
+REQUEST_TIMEOUT = 10
+RETRY_DELAY = 10
+
+# Bodies that are not HTML are streamed to disk in chunks of this size
+CHUNK_SIZE = 64 * 1024
+
+# Number of browser contexts shared by the Playwright fallbacks
+BROWSER_POOL_SIZE = 3
+
+# Default politeness for each host: requests per second and burst size
+HOST_RATE = 1 / 3
+HOST_BURST = 1
+
+# Both engines identify themselves like requests, so sites that filter on the
+# User-Agent answer them the same way
+USER_AGENT = requests.utils.default_user_agent()
+
 
 def generate_content_hash(content):
     """Generate a SHA-256 hash of the content."""
@@ -29,70 +55,587 @@ def generate_hash_filename(url):
     return file_name
 
 
-# whatsapp function
-async def get_whatsapp_content(url):
-    playwright = await async_playwright().start()
-    browser = await playwright.chromium.launch(headless=False)
-    page = await browser.new_page()
+def generate_file_hash(filepath):
+    """Generate a SHA-256 hash of a file without loading it into memory."""
+    hasher = hashlib.sha256()
+    with open(filepath, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+class DownloadTooLargeError(requests.exceptions.RequestException):
+    """Raised when a streamed body goes over the configured size limit."""
+
+
+class StreamedDownload:
+    """A response body written to a temporary file chunk by chunk while it is hashed."""
+
+    def __init__(self, download_dir, max_size=None):
+        self.max_size = max_size
+        self.size = 0
+        self.hasher = hashlib.sha256()
+        self.file = tempfile.NamedTemporaryFile(dir=download_dir, suffix=".part", delete=False)  # noqa: SIM115
+        self.path = self.file.name
+
+    def write(self, chunk):
+        self.size += len(chunk)
+        if self.max_size and self.size > self.max_size:
+            self.discard()
+            raise DownloadTooLargeError(f"Body is larger than the {self.max_size} byte limit")
+        self.hasher.update(chunk)
+        self.file.write(chunk)
+
+    def finish(self):
+        self.file.close()
+        return self
+
+    @property
+    def content_hash(self):
+        return self.hasher.hexdigest()
+
+    def move_to(self, filepath):
+        os.replace(self.path, filepath)
+
+    def discard(self):
+        self.file.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def should_stream(status_code, headers):
+    """Only successful (2xx) non-HTML bodies (PDFs and other binaries) are streamed to disk."""
+    return 200 <= status_code < 300 and "text/html" not in headers.get("content-type", "")
+
+
+class CrawlResponse:
+    """
+    Minimal HTTP response shared by the async and sync fetch engines.
+
+    Streamed bodies are not kept in memory: `content` is None and `download`
+    holds the temporary file and its SHA-256 instead.
+    """
+
+    def __init__(self, url, status_code, headers, content, encoding=None, download=None):
+        self.url = url
+        self.status_code = status_code
+        self.headers = headers
+        self.content = content
+        self.encoding = encoding
+        self.download = download
+
+    @functools.cached_property
+    def text(self):
+        """Decode like requests: the header charset, else a guess from the bytes. Decoded once, on first access."""
+        encoding = self.encoding
+        if encoding is None and requests.compat.chardet is not None:
+            encoding = requests.compat.chardet.detect(self.content)["encoding"]
+        return self.content.decode(encoding or "utf-8", errors="replace")
+
+    def save_to(self, filepath):
+        """Move the streamed body to filepath (or write the in-memory one) and return its SHA-256."""
+        if self.download:
+            self.download.move_to(filepath)
+            return self.download.content_hash
+        with open(filepath, "wb") as f:
+            f.write(self.content)
+        return generate_content_hash(self.content)
+
+    def raise_for_status(self):
+        """Raise the same exception `requests` would raise for 4xx/5xx responses."""
+        if self.status_code >= 400:
+            raise requests.exceptions.HTTPError(f"{self.status_code} Error for url: {self.url}", response=self)
+
+
+class AsyncFetcher:
+    """Fetch URLs with a pooled keep-alive aiohttp session."""
+
+    def __init__(
+        self,
+        max_concurrency=MAX_CONCURRENCY,
+        max_per_host=MAX_PER_HOST,
+        timeout=REQUEST_TIMEOUT,
+        download_dir=None,
+        max_download_size=None,
+    ):
+        self.max_concurrency = max_concurrency
+        self.max_per_host = max_per_host
+        self.timeout = timeout
+        self.download_dir = download_dir
+        self.max_download_size = max_download_size
+        self.session = None
+
+    async def __aenter__(self):
+        connector = aiohttp.TCPConnector(limit=self.max_concurrency, limit_per_host=self.max_per_host)
+        self.session = aiohttp.ClientSession(
+            connector=connector,
+            headers={"User-Agent": USER_AGENT},
+            # Like requests, time out on connecting and on each read rather than on the whole body
+            timeout=aiohttp.ClientTimeout(total=None, sock_connect=self.timeout, sock_read=self.timeout),
+        )
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.session.close()
+
+    async def get(self, url, headers=None):
+        try:
+            async with self.session.get(url, headers=headers) as response:
+                if should_stream(response.status, response.headers):
+                    download = StreamedDownload(self.download_dir, self.max_download_size)
+                    try:
+                        async for chunk in response.content.iter_chunked(CHUNK_SIZE):
+                            download.write(chunk)
+                    except (aiohttp.ClientError, asyncio.TimeoutError):
+                        download.discard()
+                        raise
+                    return CrawlResponse(url, response.status, response.headers, None, download=download.finish())
+                content = await response.read()
+                # Same charset rules as requests, which falls back to ISO-8859-1 for text/* bodies
+                encoding = requests.utils.get_encoding_from_headers(response.headers)
+                return CrawlResponse(url, response.status, response.headers, content, encoding)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            # Surface network failures the same way the requests engine does
+            raise requests.exceptions.ConnectionError(f"{type(e).__name__}: {e}") from e
+
+
+class SyncFetcher:
+    """Fetch URLs with a pooled requests session, off the event loop."""
+
+    def __init__(
+        self,
+        max_concurrency=MAX_CONCURRENCY,
+        max_per_host=MAX_PER_HOST,
+        timeout=REQUEST_TIMEOUT,
+        download_dir=None,
+        max_download_size=None,
+    ):
+        self.max_concurrency = max_concurrency
+        self.max_per_host = max_per_host
+        self.timeout = timeout
+        self.download_dir = download_dir
+        self.max_download_size = max_download_size
+        self.session = None
+
+    async def __aenter__(self):
+        self.session = requests.Session()
+        self.session.headers["User-Agent"] = USER_AGENT
+        adapter = requests.adapters.HTTPAdapter(pool_connections=self.max_concurrency, pool_maxsize=self.max_per_host)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.session.close()
+
+    def _get(self, url, headers):
+        with self.session.get(url, headers=headers, timeout=self.timeout, stream=True) as response:
+            if should_stream(response.status_code, response.headers):
+                download = StreamedDownload(self.download_dir, self.max_download_size)
+                try:
+                    for chunk in response.iter_content(CHUNK_SIZE):
+                        download.write(chunk)
+                except requests.exceptions.RequestException:
+                    download.discard()
+                    raise
+                return CrawlResponse(url, response.status_code, response.headers, None, download=download.finish())
+            return CrawlResponse(url, response.status_code, response.headers, response.content, response.encoding)
+
+    async def get(self, url, headers=None):
+        return await asyncio.to_thread(self._get, url, headers)
+
+
+FETCH_ENGINES = {"async": AsyncFetcher, "sync": SyncFetcher}
+
+
+class HttpCache:
+    """
+    Persistent ETag/Last-Modified cache used to revalidate pages with conditional GETs.
+
+    Each entry keeps the validators the server sent and the output_data.csv row the
+    crawl produced. When the server answers 304 Not Modified, the row is carried
+    forward instead of downloading the page again. Only HTML rows are revalidated;
+    PDFs are always downloaded so analyze_file_changes can fingerprint their text.
+
+    A 304 row has no file in this run's crawl folder, so it is only useful if
+    analyze_file_changes can carry forward the page's Markdown from the previous run.
+    Pages are therefore revalidated only when that Markdown is in `markdown_dir`;
+    all others (or all pages, without `markdown_dir`) get an unconditional GET.
+    """
+
+    def __init__(self, path=None, markdown_dir=None):
+        self.path = path
+        self.markdown_dir = markdown_dir
+        self.entries = {}
+        if path and os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                self.entries = json.load(f)
+
+    def conditional_headers(self, url):
+        """Return If-None-Match/If-Modified-Since headers for a cached URL."""
+        entry = self.entries.get(url)
+        if not entry or entry["row"][5] != "html" or not self.has_previous_markdown(entry["row"]):
+            return {}
+        headers = {}
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    def has_previous_markdown(self, row):
+        if not self.markdown_dir:
+            return False
+        stem = os.path.splitext(os.path.basename(row[4]))[0]
+        return os.path.exists(os.path.join(self.markdown_dir, f"{stem}.md"))
+
+    def update(self, url, response, row):
+        """Remember the validators and row of a successful fetch."""
+        etag = response.headers.get("ETag")
+        last_modified = response.headers.get("Last-Modified")
+        if not etag and not last_modified:
+            self.forget(url)
+            return
+        self.entries[url] = {
+            "etag": etag,
+            "last_modified": last_modified,
+            "content_hash": row[6],
+            "row": row,
+        }
+
+    def forget(self, url):
+        self.entries.pop(url, None)
+
+    def carry_forward(self, url, crawl_path):
+        """Return the cached row for a 304 response, pointing at this run's crawl folder."""
+        row = list(self.entries[url]["row"])
+        # The file itself is not downloaded again; analyze_file_changes carries forward its markdown
+        row[4] = os.path.join(crawl_path, "html", os.path.basename(row[4]))
+        return row
+
+    def save(self):
+        if not self.path:
+            return
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.entries, f)
+        os.replace(tmp_path, self.path)
+
+
+class CrawlJournal:
+    """
+    Append-only JSONL journal of successfully crawled rows.
+
+    Every row is written (and flushed to disk) as soon as its URL is done, together
+    with its HTTP cache entry, so an interrupted crawl can resume without refetching
+    it and still produce the same output_data.csv. Failed URLs are not journaled, so a
+    resumed crawl tries them again, and the journal is removed once output_data.csv
+    has been written, so a later crawl of the same folder starts from scratch.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.file = None
+
+    def load(self):
+        """Return the journaled records keyed by URL. A torn last line is ignored."""
+        records = {}
+        if not os.path.exists(self.path):
+            return records
+        with open(self.path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                records[record["url"]] = record
+        return records
+
+    def record(self, url, row, cache_entry=None):
+        if self.file is None:
+            self.file = open(self.path, "a", encoding="utf-8")  # noqa: SIM115
+        self.file.write(json.dumps({"url": url, "row": row, "cache": cache_entry}) + "\n")
+        self.file.flush()
+        os.fsync(self.file.fileno())
 
+    def close(self):
+        if self.file:
+            self.file.close()
+            self.file = None
+
+    def remove(self):
+        self.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class TokenBucket:
+    """Token bucket that spaces out requests to a single host."""
+
+    def __init__(self, rate=HOST_RATE, capacity=HOST_BURST):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self.lock = asyncio.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self):
+        """Wait until a token is available (and any Retry-After has expired), then take it."""
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                if now < self.blocked_until:
+                    await asyncio.sleep(self.blocked_until - now)
+                    continue
+                self._refill(now)
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def block(self, seconds):
+        """Hold back every request to this host for the given number of seconds."""
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+        self.tokens = 0
+
+
+def parse_retry_after(value):
+    """Parse a Retry-After header (delta-seconds or HTTP-date) into seconds, or None."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=datetime.timezone.utc)
+    return max(0.0, (retry_at - datetime.datetime.now(datetime.timezone.utc)).total_seconds())
+
+
+class HostScheduler:
+    """
+    Per-host politeness scheduler.
+
+    Each domain (see `get_domain`) gets its own token bucket and concurrency
+    limit, so a request only waits on its own host and requests to different
+    hosts interleave freely. The global limit is taken after the host token,
+    so tasks waiting on a slow host never hold a slot another host could use.
+    """
+
+    def __init__(
+        self,
+        max_concurrency=MAX_CONCURRENCY,
+        max_per_host=MAX_PER_HOST,
+        host_rate=HOST_RATE,
+        host_burst=HOST_BURST,
+        host_rates=None,
+    ):
+        self.max_per_host = max_per_host
+        self.host_rate = host_rate
+        self.host_burst = host_burst
+        self.host_rates = host_rates or {}
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        self.buckets = {}
+        self.host_semaphores = {}
+
+    def bucket(self, url):
+        domain = get_domain(url)
+        if domain not in self.buckets:
+            rate = self.host_rates.get(domain, self.host_rate)
+            self.buckets[domain] = TokenBucket(rate, self.host_burst)
+            self.host_semaphores[domain] = asyncio.Semaphore(self.max_per_host)
+        return self.buckets[domain]
+
+    @contextlib.asynccontextmanager
+    async def slot(self, url):
+        """Wait for this host's turn, then hold a host and a global request slot."""
+        bucket = self.bucket(url)
+        async with self.host_semaphores[get_domain(url)]:
+            await bucket.acquire()
+            async with self.semaphore:
+                yield
+
+    def honor_retry_after(self, url, response):
+        """Pause the host on 429/503 responses that carry Retry-After. Returns the delay or None."""
+        if response.status_code not in (429, 503):
+            return None
+        retry_after = parse_retry_after(response.headers.get("Retry-After"))
+        if retry_after is not None:
+            print(f"{get_domain(url)} asked us to wait {retry_after:.0f} seconds (Retry-After).")
+            self.bucket(url).block(retry_after)
+        return retry_after
+
+
+class BrowserPool:
+    """
+    Long-lived Chromium shared by every Playwright fetch of a crawl.
+
+    The browser starts lazily on first use and keeps `size` isolated contexts,
+    each with one page. Callers check a page out with `async with pool.page()`
+    and it is returned to the pool afterwards, so at most `size` Playwright
+    fetches run at the same time.
+    """
+
+    def __init__(self, size=BROWSER_POOL_SIZE, headless=True):
+        self.size = size
+        self.headless = headless
+        self.playwright = None
+        self.browser = None
+        self.pages = None
+        self.lock = asyncio.Lock()
+
+    async def start(self):
+        async with self.lock:
+            if self.browser:
+                return
+            self.playwright = await async_playwright().start()
+            self.browser = await self.playwright.chromium.launch(headless=self.headless)
+            self.pages = asyncio.Queue()
+            for _ in range(self.size):
+                context = await self.browser.new_context()
+                await self.pages.put(await context.new_page())
+
+    @contextlib.asynccontextmanager
+    async def page(self):
+        """Check a page out of the pool and return it when done."""
+        await self.start()
+        page = await self.pages.get()
+        try:
+            yield page
+        finally:
+            if page.is_closed():
+                # Replace pages that crashed or were closed by the site
+                page = await page.context.new_page()
+            await self.pages.put(page)
+
+    async def close(self):
+        if self.browser:
+            await self.browser.close()
+            await self.playwright.stop()
+            self.browser = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+
+@contextlib.asynccontextmanager
+async def _pool_or_temporary(pool):
+    """Use the given pool, or a one-page pool for standalone calls."""
+    if pool:
+        yield pool
+    else:
+        async with BrowserPool(size=1) as temporary_pool:
+            yield temporary_pool
+
+
+# whatsapp function
+async def get_whatsapp_content(url, pool=None):
     post_xpath = "/html/body/div[1]/div/div/div/div[2]/div/div/div[1]/div[1]/div[2]/div[2]/div/div/div[1]/div/div/div/div/div/div/div"
 
     print(url)
-    await page.goto(url)
-    await page.wait_for_load_state()
-    post = await page.query_selector(f"xpath={post_xpath}")
-    post_content = await post.inner_html()
-    await browser.close()
-    if post:
-        return post_content
-    else:
-        print(f"Error with {url}")
-        return None
+    async with _pool_or_temporary(pool) as browser_pool, browser_pool.page() as page:
+        await page.goto(url)
+        await page.wait_for_load_state()
+        post = await page.query_selector(f"xpath={post_xpath}")
+        if post:
+            return await post.inner_html()
+    print(f"Error with {url}")
+    return None
 
 
-async def fetch_content_with_playwright(url, filepath):
+async def fetch_content_with_playwright(url, filepath, pool=None):
     """Fetch the content of a URL using Playwright and save it to a file."""
-    async with async_playwright() as p:
-        browser = await p.chromium.launch(headless=True)
-        page = await browser.new_page()
+    async with _pool_or_temporary(pool) as browser_pool, browser_pool.page() as page:
         try:
             await page.goto(url, timeout=60000)  # 60 seconds timeout
-            time.sleep(5)
+            await asyncio.sleep(5)
             content = await page.content()
             with open(filepath, "w", encoding="utf-8") as f:
                 f.write(content)
         except Exception as e:
             print(f"Error loading {url}: {e}")
-        await browser.close()
 
 
-async def fetch_content_from_student_services(urls):
+async def fetch_content_from_student_services(urls, pool=None):
     """Fetch content from student services page with tabs"""
-    plw = await async_playwright().start()
-    brwsr = await plw.chromium.launch()
-    pg = await brwsr.new_page()
-    content = ""
-    for url in urls:
+
+    async def fetch_tab(browser_pool, url):
         print("crawling subpage: ", url["url"])
-        await pg.goto(url["url"])
-        await pg.wait_for_load_state()
-        cntnt = await pg.content()
+        async with browser_pool.page() as pg:
+            await pg.goto(url["url"])
+            await pg.wait_for_load_state()
+            cntnt = await pg.content()
         soup = BeautifulSoup(cntnt, "html.parser")
         art = soup.find("article", class_="main-content").prettify()
         # crete an h1 tag with the title and addit to the art as the first child of the article
 
         h1 = soup.new_tag("h1")
         h1.string = url["title"]
-        art = art.replace(">", f">{h1}", 1)
-        content += art
+        return art.replace(">", f">{h1}", 1)
+
+    # Tabs are fetched concurrently; gather keeps them in their original order
+    async with _pool_or_temporary(pool) as browser_pool:
+        tabs = await asyncio.gather(*(fetch_tab(browser_pool, url) for url in urls))
+    return "".join(tabs)
 
-    await brwsr.close()
-    return content
 
+async def crawl_csv(  # noqa: C901
+    df,
+    base_dir,
+    output_file="output_data.csv",
+    detailed_log_path=None,
+    engine="async",
+    max_concurrency=MAX_CONCURRENCY,
+    max_per_host=MAX_PER_HOST,
+    host_rate=HOST_RATE,
+    host_burst=HOST_BURST,
+    host_rates=None,
+    retry_delay=RETRY_DELAY,
+    http_cache_path=None,
+    previous_markdown_dir=None,
+    forget_urls=None,
+    browser_pool_size=BROWSER_POOL_SIZE,
+    resume=True,
+    max_download_size=None,
+):
+    """
+    Takes CSV file in the format Heading, Subheading, Title, URL and processes each URL.
 
-async def crawl_csv(df, base_dir, output_file="output_data.csv", detailed_log_path=None):  # noqa: C901
+    Rows are fetched concurrently: at most `max_concurrency` requests are in flight
+    overall and at most `max_per_host` against any single domain. Each domain is
+    rate limited to `host_rate` requests per second (override per domain with
+    `host_rates`) and 429/503 responses with Retry-After pause that domain only.
+    `engine` selects the HTTP client ("async" uses aiohttp, "sync" runs requests
+    in worker threads).
 
-    """Takes CSV file in the format Heading, Subheading, Title, URL and processes each URL."""
+    If `http_cache_path` is given, ETag/Last-Modified validators are kept there
+    between runs. HTML pages whose Markdown from the previous run is in
+    `previous_markdown_dir` are revalidated: when the server answers 304, their
+    previous row is carried forward without a download. The cache entries of
+    `forget_urls` (e.g. the URLs links_diff.csv lists as removed) are dropped first.
+
+    Playwright fallbacks share one browser with `browser_pool_size` contexts.
+
+    Successful rows are journaled to crawl_journal.jsonl in `base_dir` until the
+    output CSV is written. With `resume`, a rerun after a crash restores journaled
+    rows instead of fetching them again; failed URLs are fetched again.
+
+    PDFs and other binaries are streamed to disk and hashed as they arrive; bodies
+    over `max_download_size` bytes (if set) are dropped and reported as errors.
+    """
 
     # Define a base directory within the user's space
     # base_dir = "../data/data_16_09_24/crawl/"
@@ -105,9 +648,20 @@ async def crawl_csv(df, base_dir, output_file="output_data.csv", detailed_log_pa
     create_folder(crawl_path, "pdf")
     create_folder(crawl_path, "others")
 
-    output_data = []
+    output_data = {}
+    # Rows of URLs that failed after all retries, which are not journaled
+    failed = set()
+    scheduler = HostScheduler(max_concurrency, max_per_host, host_rate, host_burst, host_rates)
+    http_cache = HttpCache(http_cache_path, previous_markdown_dir)
+    for url in forget_urls or ():
+        http_cache.forget(url)
+    browser_pool = BrowserPool(browser_pool_size)
+    journal = CrawlJournal(os.path.join(base_dir, "crawl_journal.jsonl"))
+    journaled = journal.load() if resume else {}
+    if journaled:
+        print(f"Resuming crawl: {len(journaled)} URLs already done according to {journal.path}")
 
-    async def process_row(row):  # noqa: C901
+    async def process_row(index, row, fetcher):  # noqa: C901
         url = row["URL"]
         heading = row["Section"]
         sub_heading = row["Subsection"]
@@ -126,17 +680,29 @@ async def crawl_csv(df, base_dir, output_file="output_data.csv", detailed_log_pa
 
         # Skip fetching if the file already exists
         if os.path.exists(html_filepath) or os.path.exists(pdf_filepath):
+            existing_filepath = html_filepath if os.path.exists(html_filepath) else pdf_filepath
+            content_hash = generate_file_hash(existing_filepath)
+            # Rebuild the row from the file on disk so it is not missing from output_data.csv
+            output_data[index] = [
+                heading,
+                sub_heading,
+                title,
+                url,
+                existing_filepath,
+                os.path.splitext(existing_filepath)[1][1:],
+                content_hash,
+                datetime.datetime.now().isoformat(),
+                role,
+            ]
             log_entry = {
                 "timestamp": datetime.datetime.now().isoformat(),
                 "stage": "crawl",
                 "url": url,
                 "status": "SKIPPED",
                 "reason": "File already exists",
-                "filepath": html_filepath if os.path.exists(html_filepath) else pdf_filepath,
+                "filepath": existing_filepath,
             }
-            if detailed_log_path:
-                with open(detailed_log_path, "a") as f:
-                    f.write(json.dumps(log_entry) + "\n")
+            log_event(detailed_log_path, log_entry)
             print(f"File already exists for {filename}. Skipping fetch.")
             return
 
@@ -145,17 +711,41 @@ async def crawl_csv(df, base_dir, output_file="output_data.csv", detailed_log_pa
         print("Working on ", url)
         while retry_attempts > 0:
             try:
-                time.sleep(3)
-                response = requests.get(url, timeout=10)
+                async with scheduler.slot(url):
+                    response = await fetcher.get(url, headers=http_cache.conditional_headers(url))
+
+                if response.status_code == 304:
+                    output_data[index] = http_cache.carry_forward(url, crawl_path)
+                    log_entry = {
+                        "timestamp": datetime.datetime.now().isoformat(),
+                        "stage": "crawl",
+                        "url": url,
+                        "status": "NOT_MODIFIED",
+                        "reason": "Server returned 304; previous row carried forward",
+                        "filepath": output_data[index][4],
+                    }
+                    log_event(detailed_log_path, log_entry)
+                    print(f"Not modified: {url}")
+                    break
+
                 response.raise_for_status()  # http errors
                 content_type = response.headers.get("content-type", "")
 
                 log_status = "SUCCESS"
                 log_reason = f"Content Type: {content_type}"
                 log_filepath = ""
+                content_hash = None
+                # Pages assembled with Playwright can change without the page itself changing
+                revalidatable = True
+
+                if any(domain in url for domain in ["faq.whatsapp", "articulate.com", "myinstitute.churchofjesuschrist.org"]):
+                    # These are rendered with Playwright, so a streamed body is not needed
+                    if response.download:
+                        response.download.discard()
 
                 if any(domain in url for domain in ["faq.whatsapp"]):
-                    content = await get_whatsapp_content(url)
+                    revalidatable = False
+                    content = await get_whatsapp_content(url, browser_pool)
                     filepath = html_filepath
                     with open(filepath, "w", encoding="utf-8") as f:
                         f.write(content)
@@ -207,7 +797,8 @@ async def crawl_csv(df, base_dir, output_file="output_data.csv", detailed_log_pa
                                 for link in tab_links
                                 if "#" in link.get("href")
                             ]
-                            tab_content = await fetch_content_from_student_services(tab_links)
+                            revalidatable = False
+                            tab_content = await fetch_content_from_student_services(tab_links, browser_pool)
                             content += tab_content
                         text_content = content
                         content = content.encode("utf-8")
@@ -216,26 +807,23 @@ async def crawl_csv(df, base_dir, output_file="output_data.csv", detailed_log_pa
                     log_filepath = filepath
 
                 elif "application/pdf" in content_type:
-                    content = response.content
                     filepath = pdf_filepath
-                    with open(filepath, "wb") as f:
-                        f.write(response.content)
+                    content_hash = response.save_to(filepath)
                     log_filepath = filepath
 
                 else:
                     # Handle other content types by saving with the correct extension
                     file_extension = content_type.split("/")[-1].split(";")[0]
                     filepath = os.path.join(crawl_path, "others", f"{filename}.{file_extension}")
-                    content = response.content
-                    with open(filepath, "wb") as f:
-                        f.write(content)
+                    content_hash = response.save_to(filepath)
                     log_filepath = filepath
 
-                # Create content hash
-                content_hash = generate_content_hash(content)
+                # Create content hash (streamed bodies were hashed while downloading)
+                if content_hash is None:
+                    content_hash = generate_content_hash(content)
 
                 # Append to the output list
-                output_data.append([
+                output_data[index] = [
                     heading,
                     sub_heading,
                     title,
@@ -245,7 +833,11 @@ async def crawl_csv(df, base_dir, output_file="output_data.csv", detailed_log_pa
                     content_hash,
                     datetime.datetime.now().isoformat(),
                     role,
-                ])
+                ]
+                if revalidatable:
+                    http_cache.update(url, response, output_data[index])
+                else:
+                    http_cache.forget(url)
 
                 log_entry = {
                     "timestamp": datetime.datetime.now().isoformat(),
@@ -255,9 +847,7 @@ async def crawl_csv(df, base_dir, output_file="output_data.csv", detailed_log_pa
                     "reason": log_reason,
                     "filepath": log_filepath,
                 }
-                if detailed_log_path:
-                    with open(detailed_log_path, "a") as f:
-                        f.write(json.dumps(log_entry) + "\n")
+                log_event(detailed_log_path, log_entry)
 
                 break  # Exit retry loop after successful fetch
 
@@ -274,8 +864,8 @@ async def crawl_csv(df, base_dir, output_file="output_data.csv", detailed_log_pa
                 if response.status_code == 403:
                     print(f"Access forbidden for {url}: {http_err}. Using Playwright to fetch HTML.")
                     html_filepath = os.path.join(crawl_path, "html", f"{filename}.html")
-                    await fetch_content_with_playwright(url, html_filepath)
-                    output_data.append([
+                    await fetch_content_with_playwright(url, html_filepath, browser_pool)
+                    output_data[index] = [
                         heading,
                         sub_heading,
                         title,
@@ -285,25 +875,27 @@ async def crawl_csv(df, base_dir, output_file="output_data.csv", detailed_log_pa
                         None,
                         datetime.datetime.now().isoformat(),
                         role,
-                    ])
+                    ]
 
                     log_entry["status"] = "SUCCESS_WITH_PLAYWRIGHT_FALLBACK"
                     log_entry["reason"] = "Access forbidden (403), rescued with Playwright"
                     log_entry["filepath"] = html_filepath
-                    if detailed_log_path:
-                        with open(detailed_log_path, "a") as f:
-                            f.write(json.dumps(log_entry) + "\n")
+                    log_event(detailed_log_path, log_entry)
 
                     break  # Don't retry if it's a 403 error
                 else:
                     print(f"HTTP error occurred for {url}: {http_err}")
+                    retry_after = scheduler.honor_retry_after(url, response)
                     retry_attempts -= 1
-                    if retry_attempts > 0:
-                        print("Retrying in 10 seconds...")
+                    if retry_attempts > 0 and retry_after is not None:
+                        # The host's bucket already holds requests until Retry-After expires
                         log_entry["reason"] += " Retrying..."
-                        time.sleep(10)
+                    elif retry_attempts > 0:
+                        print(f"Retrying in {retry_delay} seconds...")
+                        log_entry["reason"] += " Retrying..."
+                        await asyncio.sleep(retry_delay)
                     else:
-                        output_data.append([
+                        output_data[index] = [
                             heading,
                             sub_heading,
                             title,
@@ -313,13 +905,12 @@ async def crawl_csv(df, base_dir, output_file="output_data.csv", detailed_log_pa
                             None,
                             datetime.datetime.now().isoformat(),
                             role,
-                        ])
+                        ]
 
+                        failed.add(index)
                         log_entry["status"] = "FAILED_HTTP_ERROR"
                         log_entry["reason"] = f"HTTP Error {response.status_code}: {http_err}. Max retries reached."
-                        if detailed_log_path:
-                            with open(detailed_log_path, "a") as f:
-                                f.write(json.dumps(log_entry) + "\n")
+                        log_event(detailed_log_path, log_entry)
 
             except requests.exceptions.RequestException as err:
                 print(f"Error occurred for {url}: {err}")
@@ -331,14 +922,16 @@ async def crawl_csv(df, base_dir, output_file="output_data.csv", detailed_log_pa
                     "reason": f"Request Exception: {err}",
                     "filepath": None,
                 }
+                if isinstance(err, DownloadTooLargeError):
+                    retry_attempts = 1  # retrying will not make the body smaller
                 retry_attempts -= 1
                 if retry_attempts > 0:
-                    print("Retrying in 10 seconds...")
+                    print(f"Retrying in {retry_delay} seconds...")
                     log_entry["reason"] += " Retrying..."
-                    time.sleep(10)
+                    await asyncio.sleep(retry_delay)
                 else:
                     print(f"No content-type header found for {url}: {err}")
-                    output_data.append([
+                    output_data[index] = [
                         heading,
                         sub_heading,
                         title,
@@ -348,24 +941,50 @@ async def crawl_csv(df, base_dir, output_file="output_data.csv", detailed_log_pa
                         None,
                         datetime.datetime.now().isoformat(),
                         role,
-                    ])
+                    ]
 
+                    failed.add(index)
                     log_entry["status"] = "FAILED_REQUEST_ERROR"
                     log_entry["reason"] = f"Request Exception: {err}. Max retries reached."
-                    if detailed_log_path:
-                        with open(detailed_log_path, "a") as f:
-                            f.write(json.dumps(log_entry) + "\n")
-
-    # Process rows in batches of 10 to manage memory usage efficiently
-    batch_size = 10
-    for i in range(0, len(df), batch_size):
-        batch = df.iloc[i : i + batch_size]  # Get next batch of rows
-        tasks = [process_row(row) for _, row in batch.iterrows()]  # Create tasks for batch
-        await asyncio.gather(*tasks)  # Process batch before continuing
-
-    # Create a DataFrame from the output data
+                    log_event(detailed_log_path, log_entry)
+
+    async def journaled_process_row(index, row, fetcher):
+        url = row["URL"]
+        if url in journaled:
+            record = journaled[url]
+            output_data[index] = record["row"]
+            if record.get("cache"):
+                http_cache.entries[url] = record["cache"]
+            log_entry = {
+                "timestamp": datetime.datetime.now().isoformat(),
+                "stage": "crawl",
+                "url": url,
+                "status": "SKIPPED",
+                "reason": "Already crawled (resumed from journal)",
+                "filepath": record["row"][4],
+            }
+            log_event(detailed_log_path, log_entry)
+            return
+        await process_row(index, row, fetcher)
+        if index in output_data and index not in failed:
+            journal.record(url, output_data[index], http_cache.entries.get(url))
+
+    # Process all rows concurrently; the scheduler interleaves them across hosts
+    try:
+        fetch_engine = FETCH_ENGINES[engine](
+            max_concurrency, max_per_host, download_dir=crawl_path, max_download_size=max_download_size
+        )
+        async with browser_pool, fetch_engine as fetcher:
+            tasks = [journaled_process_row(index, row, fetcher) for index, (_, row) in enumerate(df.iterrows())]
+            await asyncio.gather(*tasks)
+    finally:
+        journal.close()
+        http_cache.save()
+        flush_event_logs()
+
+    # Create a DataFrame from the output data, keeping the input order
     output_df = pd.DataFrame(
-        output_data,
+        [output_data[index] for index in sorted(output_data)],
         columns=[
             "Heading",
             "Subheading",
@@ -396,6 +1015,8 @@ async def crawl_csv(df, base_dir, output_file="output_data.csv", detailed_log_pa
     # Append to the existing CSV file or create a new one if it doesn't exist
     if os.path.exists(out_path):
         existing_df = pd.read_csv(out_path)
+        # Fingerprints are added later by analyze_file_changes and would keep duplicates apart
+        existing_df = existing_df.drop(columns=["Content Fingerprint"], errors="ignore")
         combined_df = pd.concat([existing_df, output_df], ignore_index=True)
 
         # Delete the 'Last Update' column temporarily to remove duplicates
@@ -409,4 +1030,6 @@ async def crawl_csv(df, base_dir, output_file="output_data.csv", detailed_log_pa
     else:
         output_df.to_csv(out_path, index=False)
 
+    # Every row is in the CSV now, so the next crawl of this folder must not resume
+    journal.remove()
     print(f"Processing completed. Output saved to {out_path}")
@@ -0,0 +1,262 @@
+import hashlib
+import os
+import re
+import threading
+from contextlib import contextmanager
+
+import numpy as np
+from llama_index.embeddings.openai import OpenAIEmbedding
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+# Embeddings are cached on disk so re-indexing and hyperparameter trials only pay for new text
+EMBED_CACHE_DIR = os.getenv("EMBED_CACHE_DIR", ".cache/embeddings")
+# Size limit of each (model, dimensions) cache; least recently used embeddings are evicted
+# beyond it. 0 turns the cache off.
+EMBED_CACHE_MAX_MB = int(os.getenv("EMBED_CACHE_MAX_MB", "1024"))
+
+KEY_SIZE = 32  # sha256 digest; an all-zero key marks a free row
+INITIAL_ROWS = 1024  # the files double in size as needed, up to the size limit
+
+# Dimensions of each model's embeddings when none are requested, so a model configured
+# with and without its full dimensions shares one cache
+DEFAULT_DIMENSIONS = {
+    "text-embedding-3-large": 3072,
+    "text-embedding-3-small": 1536,
+    "text-embedding-ada-002": 1536,
+}
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+class EmbeddingCache:
+    """
+    Embeddings of one (model, dimensions) pair, stored as three memory-mapped files:
+    - <name>.vectors: float32 matrix with one embedding per row;
+    - <name>.keys: sha256 of the text embedded in each row;
+    - <name>.used: when each row was last read or written, for LRU eviction.
+
+    A row's key is cleared before its vector is overwritten and written after it, so an
+    interrupted write loses that entry instead of mapping a text to the wrong vector.
+
+    Threads and processes (e.g. the workers of an Optuna study) can share the files:
+    every read and write holds an exclusive flock on <name>.lock, which counts the
+    writes, and a process maps the files again when another one has written since its
+    last access. Without fcntl (Windows) only the threads of one process may share them.
+    """
+
+    def __init__(self, path, max_bytes):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.vectors = None
+        self.keys = None
+        self.used = None
+        self.rows = {}
+        self.free_rows = []
+        self.tick = 0
+        self.capacity = 0
+        self.version = None
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.lock_fd = os.open(path + ".lock", os.O_RDWR | os.O_CREAT, 0o644)
+
+    @contextmanager
+    def _locked(self):
+        """Hold the cache for this thread and process, with the files mapped as they are on disk."""
+        with self.lock:
+            if fcntl:
+                fcntl.flock(self.lock_fd, fcntl.LOCK_EX)
+            try:
+                os.lseek(self.lock_fd, 0, os.SEEK_SET)
+                version = int.from_bytes(os.read(self.lock_fd, 8), "little")
+                if version != self.version:
+                    self.version = version
+                    self._load()
+                yield
+            finally:
+                if fcntl:
+                    fcntl.flock(self.lock_fd, fcntl.LOCK_UN)
+
+    def _written(self):
+        """Count a write in the lock file, so other processes map the files again."""
+        self.version += 1
+        os.lseek(self.lock_fd, 0, os.SEEK_SET)
+        os.write(self.lock_fd, self.version.to_bytes(8, "little"))
+
+    def _load(self):
+        self.vectors = self.keys = self.used = None
+        self.rows = {}
+        self.free_rows = []
+        if not os.path.exists(self.path + ".keys"):
+            return
+        rows = os.path.getsize(self.path + ".keys") // KEY_SIZE
+        dimensions = os.path.getsize(self.path + ".vectors") // (4 * rows) if rows else 0
+        if dimensions:
+            self.capacity = max(1, self.max_bytes // (4 * dimensions))
+            # A lower size limit than last time drops the rows past it
+            self._open(dimensions, min(rows, self.capacity))
+            if rows > self.capacity:
+                self._written()
+
+    def _open(self, dimensions, rows):
+        """Map the files with `rows` rows, resizing them if needed."""
+        for suffix, row_size in ((".vectors", 4 * dimensions), (".keys", KEY_SIZE), (".used", 8)):
+            with open(self.path + suffix, "ab") as file:
+                if file.tell() != rows * row_size:
+                    file.truncate(rows * row_size)
+        self.vectors = np.memmap(self.path + ".vectors", dtype=np.float32, mode="r+", shape=(rows, dimensions))
+        self.keys = np.memmap(self.path + ".keys", dtype=np.uint8, mode="r+", shape=(rows, KEY_SIZE))
+        self.used = np.memmap(self.path + ".used", dtype=np.uint64, mode="r+", shape=(rows,))
+
+        occupied = self.keys.any(axis=1)
+        self.rows = {self.keys[row].tobytes(): int(row) for row in np.flatnonzero(occupied)}
+        self.free_rows = [int(row) for row in np.flatnonzero(~occupied)][::-1]
+        self.tick = max(self.tick, int(self.used.max()))
+
+    @staticmethod
+    def key(text):
+        return hashlib.sha256(text.encode("utf-8")).digest()
+
+    def get_many(self, texts):
+        """Return the cached embedding of each text, or None where there is none."""
+        with self._locked():
+            if self.vectors is None:
+                return [None] * len(texts)
+            self.tick += 1
+            embeddings = []
+            for text in texts:
+                row = self.rows.get(self.key(text))
+                if row is None:
+                    embeddings.append(None)
+                else:
+                    self.used[row] = self.tick
+                    embeddings.append(self.vectors[row].tolist())
+            return embeddings
+
+    def put_many(self, texts, embeddings):
+        with self._locked():
+            if self.vectors is None:
+                self.capacity = max(1, self.max_bytes // (4 * len(embeddings[0])))
+                self._open(len(embeddings[0]), min(INITIAL_ROWS, self.capacity))
+            self.tick += 1
+
+            new_entries = {}
+            for text, embedding in zip(texts, embeddings):
+                key = self.key(text)
+                if key not in self.rows:
+                    new_entries[key] = embedding
+            # A batch larger than the whole cache keeps its last entries
+            new_entries = list(new_entries.items())[-self.capacity:]
+
+            rows = self._take_rows(len(new_entries))
+            for row in rows:
+                self.keys[row] = 0
+            self.keys.flush()
+
+            for row, (key, embedding) in zip(rows, new_entries):
+                self.vectors[row] = embedding
+                self.used[row] = self.tick
+            self.vectors.flush()
+            for row, (key, _) in zip(rows, new_entries):
+                self.keys[row] = np.frombuffer(key, dtype=np.uint8)
+                self.rows[key] = row
+            self.keys.flush()
+            self.used.flush()
+            if new_entries:
+                self._written()
+
+    def _take_rows(self, count):
+        """Free rows for `count` new entries, evicting the least recently used ones if needed."""
+        allocated = len(self.keys)
+        if len(self.free_rows) < count and allocated < self.capacity:
+            self.vectors.flush()
+            self.used.flush()
+            self._open(self.vectors.shape[1], min(self.capacity, max(2 * allocated, allocated + count)))
+        rows = [self.free_rows.pop() for _ in range(min(count, len(self.free_rows)))]
+        evict = count - len(rows)
+        if evict > 0:
+            occupied = np.fromiter(self.rows.values(), dtype=np.int64)
+            oldest = occupied[np.argpartition(self.used[occupied], evict - 1)[:evict]]
+            evicted = {int(row) for row in oldest}
+            self.rows = {key: row for key, row in self.rows.items() if row not in evicted}
+            rows.extend(evicted)
+        return rows
+
+
+def get_embedding_cache(model_name, dimensions=None, cache_dir=None, max_mb=None):
+    """
+    Return the cache of a (model, dimensions) pair, or None if caching is turned off.
+    Embedding models of the same pair share one cache, so they see each other's entries.
+    No dimensions means the model's default ones (see DEFAULT_DIMENSIONS).
+    """
+    dimensions = dimensions or DEFAULT_DIMENSIONS.get(model_name)
+    cache_dir = cache_dir or EMBED_CACHE_DIR
+    max_mb = EMBED_CACHE_MAX_MB if max_mb is None else max_mb
+    if max_mb <= 0:
+        return None
+    name = re.sub(r"[^A-Za-z0-9_.-]", "_", f"{model_name}-{dimensions or 'default'}")
+    path = os.path.join(cache_dir, name)
+    # A forked process opens its own lock file, as flock locks are shared through inherited descriptors
+    key = (path, os.getpid())
+    with _caches_lock:
+        if key not in _caches:
+            _caches[key] = EmbeddingCache(path, max_mb * 1024 * 1024)
+        return _caches[key]
+
+
+class EmbeddingCacheMixin:
+    """
+    Serves text and query embeddings from the on-disk cache of the model's name and
+    dimensions, and only asks the embedding model for the texts it has not seen yet.
+    Text and query embeddings share entries, as they do for OpenAI models.
+    Put it before the embedding class in the bases.
+    """
+
+    def _embedding_cache(self):
+        return get_embedding_cache(self.model_name, getattr(self, "dimensions", None))
+
+    def _split_cached(self, texts):
+        cache = self._embedding_cache()
+        embeddings = cache.get_many(texts) if cache else [None] * len(texts)
+        missing = list(dict.fromkeys(text for text, embedding in zip(texts, embeddings) if embedding is None))
+        return cache, embeddings, missing
+
+    def _merge_cached(self, cache, texts, embeddings, missing, new_embeddings):
+        if cache and missing:
+            cache.put_many(missing, new_embeddings)
+        by_text = dict(zip(missing, new_embeddings))
+        return [embedding if embedding is not None else by_text[text] for text, embedding in zip(texts, embeddings)]
+
+    def _get_text_embeddings(self, texts):
+        cache, embeddings, missing = self._split_cached(texts)
+        new_embeddings = super()._get_text_embeddings(missing) if missing else []
+        return self._merge_cached(cache, texts, embeddings, missing, new_embeddings)
+
+    async def _aget_text_embeddings(self, texts):
+        cache, embeddings, missing = self._split_cached(texts)
+        new_embeddings = await super()._aget_text_embeddings(missing) if missing else []
+        return self._merge_cached(cache, texts, embeddings, missing, new_embeddings)
+
+    def _get_text_embedding(self, text):
+        return self._get_text_embeddings([text])[0]
+
+    async def _aget_text_embedding(self, text):
+        return (await self._aget_text_embeddings([text]))[0]
+
+    def _get_query_embedding(self, query):
+        cache, embeddings, missing = self._split_cached([query])
+        new_embeddings = [super()._get_query_embedding(query)] if missing else []
+        return self._merge_cached(cache, [query], embeddings, missing, new_embeddings)[0]
+
+    async def _aget_query_embedding(self, query):
+        cache, embeddings, missing = self._split_cached([query])
+        new_embeddings = [await super()._aget_query_embedding(query)] if missing else []
+        return self._merge_cached(cache, [query], embeddings, missing, new_embeddings)[0]
+
+
+class CachedOpenAIEmbedding(EmbeddingCacheMixin, OpenAIEmbedding):
+    """OpenAIEmbedding backed by the on-disk embedding cache."""
@@ -0,0 +1,128 @@
+import atexit
+import json
+import os
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+# Flush the buffer once it holds this many entries or this many seconds have passed
+MAX_BUFFERED_ENTRIES = 200
+FLUSH_INTERVAL = 2.0
+
+
+class EventLogWriter:
+    """
+    Buffered writer for the pipeline's JSONL event log (pipeline_detailed_log.jsonl).
+
+    The file is opened once in append mode and entries are written in batches. A lock
+    protects the buffer from threads and asyncio tasks, and every batch goes out in a
+    single locked append so concurrent processes never interleave partial lines. A
+    timer writes out buffered entries after flush_interval even if no more arrive.
+    """
+
+    def __init__(self, path, max_buffered_entries=MAX_BUFFERED_ENTRIES, flush_interval=FLUSH_INTERVAL):
+        self.path = path
+        self.max_buffered_entries = max_buffered_entries
+        self.flush_interval = flush_interval
+        self.buffer = []
+        self.last_flush = time.monotonic()
+        self.lock = threading.Lock()
+        self.fd = None
+        self.timer = None
+
+    def write(self, entry):
+        """Queue one log entry, flushing if the size or time threshold is reached."""
+        line = json.dumps(entry) + "\n"
+        with self.lock:
+            self.buffer.append(line)
+            if (
+                len(self.buffer) >= self.max_buffered_entries
+                or time.monotonic() - self.last_flush >= self.flush_interval
+            ):
+                self._flush()
+            elif self.timer is None:
+                self.timer = threading.Timer(self.flush_interval, self.flush)
+                self.timer.daemon = True
+                self.timer.start()
+
+    def flush(self):
+        with self.lock:
+            self._flush()
+
+    def _flush(self):
+        self.last_flush = time.monotonic()
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        if not self.buffer:
+            return
+        data = "".join(self.buffer).encode("utf-8")
+        self.buffer = []
+        if self.fd is None:
+            self.fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        if fcntl:
+            fcntl.flock(self.fd, fcntl.LOCK_EX)
+        try:
+            while data:
+                data = data[os.write(self.fd, data) :]
+        finally:
+            if fcntl:
+                fcntl.flock(self.fd, fcntl.LOCK_UN)
+
+    def close(self):
+        with self.lock:
+            self._flush()
+            if self.fd is not None:
+                os.close(self.fd)
+                self.fd = None
+
+
+_writers = {}
+_writers_lock = threading.Lock()
+
+
+def get_event_log(path):
+    """Return the shared writer for a log file, creating it on first use."""
+    key = os.path.abspath(path)
+    with _writers_lock:
+        if key not in _writers:
+            _writers[key] = EventLogWriter(path)
+        return _writers[key]
+
+
+def log_event(path, entry):
+    """Append an entry to the event log at path. Does nothing when path is None."""
+    if path:
+        get_event_log(path).write(entry)
+
+
+def flush_event_logs():
+    """Write out every buffered entry, e.g. before the log is read back."""
+    with _writers_lock:
+        writers = list(_writers.values())
+    for writer in writers:
+        writer.flush()
+
+
+def close_event_logs():
+    with _writers_lock:
+        writers = list(_writers.values())
+        _writers.clear()
+    for writer in writers:
+        writer.close()
+
+
+def _reset_after_fork():
+    # A forked worker must not re-write the entries its parent still has buffered
+    global _writers_lock
+    _writers.clear()
+    _writers_lock = threading.Lock()
+
+
+atexit.register(close_event_logs)
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
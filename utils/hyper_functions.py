@@ -493,18 +493,16 @@ def include_metadata(nodes: list[TextNode], metadata_keys: list[str]):
             )
 
 
-def run_pipeline(documents, splitter, embed_model, vector_store, include_prev_next_rel):
-    """Run the ingestion pipeline to split documents, generate embeddings, and insert into an index."""
+def build_nodes(documents, splitter, embed_model, include_prev_next_rel):
+    """Split documents into nodes, generate their embeddings and number them by URL ("sequence")."""
+    if not documents:
+        return []
     pipeline = IngestionPipeline(
         transformations=[
             splitter,
             embed_model,
         ]
     )
-    index = VectorStoreIndex.from_vector_store(
-        vector_store,
-        embed_model=embed_model,
-    )
     nodes = pipeline.run(documents=documents, show_progress=False)
 
     if include_prev_next_rel:
@@ -540,6 +538,16 @@ def run_pipeline(documents, splitter, embed_model, vector_store, include_prev_ne
             sequence = 1
             node.metadata['sequence'] = sequence
             sequence += 1
+    return nodes
+
+
+def run_pipeline(documents, splitter, embed_model, vector_store, include_prev_next_rel):
+    """Run the ingestion pipeline to split documents, generate embeddings, and insert into an index."""
+    index = VectorStoreIndex.from_vector_store(
+        vector_store,
+        embed_model=embed_model,
+    )
+    nodes = build_nodes(documents, splitter, embed_model, include_prev_next_rel)
 
     index.insert_nodes(nodes)
     print(f"Nodes inserted: {len(nodes)}")
@@ -1,7 +1,9 @@
+import asyncio
 import re
 import os
 import json
 from typing import Any, cast, Dict, List, Optional
+import pandas as pd
 import requests
 from bs4 import BeautifulSoup, Tag
 from playwright.async_api import async_playwright
@@ -9,6 +11,12 @@ import time
 
 from utils.tools import create_folder
 
+# Number of help API pages requested concurrently
+HELP_PAGE_WINDOW = 5
+
+# all_links.csv columns compared when diffing two link inventories
+LINK_METADATA_COLUMNS = ["Section", "Subsection", "Title", "Role", "filename"]
+
 
 # clean function for the parse-index
 def clean(text: Any) -> str:
@@ -202,13 +210,17 @@ def _build_help_article_url(article_id: str, base_url: str, lang: str = "en") ->
     return f"{base_url.rstrip('/')}/en-US/knowledgebase/article/?kb={article_id}&lang={lang}"
 
 
-async def get_help_links(url, selector):
+async def get_help_links(url, selector, window=HELP_PAGE_WINDOW):
     """
     Get the links from the help page using the API endpoint.
-    
+
+    Pages are requested `window` at a time in parallel and consumed in order
+    until one reports no more records (or fails).
+
     Args:
         url (str): The base help URL (not used directly, but kept for compatibility).
         selector (str): CSS selector (not used with API, but kept for compatibility).
+        window (int): Number of pages to prefetch concurrently.
     
     Returns:
         list: List of article data in format [section, subsection, title, url].
@@ -223,37 +235,43 @@ async def get_help_links(url, selector):
     
     data = []
     page = 1
+    more_records = True
+
+    while more_records:
+        pages = range(page, page + window)
+        pages_data = await asyncio.gather(*(asyncio.to_thread(_fetch_help_page, p, base_url) for p in pages))
+
+        for current_page, page_data in zip(pages, pages_data):
+            if not page_data:
+                print(f"Stopping help articles fetch at page {current_page} due to error.")
+                more_records = False
+                break
+
+            results = page_data.get("results", [])
+            for item in results:
+                article_id = item.get("articleId")
+                title = item.get("title", "")
+
+                if article_id and title:
+                    article_url = _build_help_article_url(article_id, base_url)
+                    # Format: [section, subsection, title, url]
+                    # Using "Help Articles" as section and empty subsection for consistency
+                    data.append(["Help Articles", "", clean(title), article_url])
 
-    while True:
-        page_data = _fetch_help_page(page, base_url)
-        if not page_data:
-            print(f"Stopping help articles fetch at page {page} due to error.")
-            break
-
-        results = page_data.get("results", [])
-        for item in results:
-            article_id = item.get("articleId")
-            title = item.get("title", "")
-            
-            if article_id and title:
-                article_url = _build_help_article_url(article_id, base_url)
-                # Format: [section, subsection, title, url]
-                # Using "Help Articles" as section and empty subsection for consistency
-                data.append(["Help Articles", "", clean(title), article_url])
-
-        # Check if there are more records to fetch
-        if not page_data.get("morerecords", False):
-            break
-
-        page += 1
+            # Check if there are more records to fetch
+            if not page_data.get("morerecords", False):
+                more_records = False
+                break
+
+        page += window
 
     return data
 
 
 async def get_services_links(url):
     """Get the links from the student services page."""
-    content = requests.get(url, timeout=10).content
-    soup = BeautifulSoup(content, "html.parser")
+    response = await asyncio.to_thread(requests.get, url, timeout=10)
+    soup = BeautifulSoup(response.content, "html.parser")
     # get the nav with aria-label="Navigation"
     nav = soup.find("nav", {"aria-label": "Mobile Navigation"})
     li_elems = nav.find_all("li")
@@ -273,3 +291,48 @@ async def get_services_links(url):
             )
 
     return data
+
+
+def diff_link_inventories(previous_df, current_df):
+    """
+    Compare two all_links.csv inventories by URL.
+
+    Returns a DataFrame with one row per URL that was added, removed or whose
+    metadata changed (columns: URL, filename, Change, Changed Columns).
+    Unchanged URLs are left out.
+    """
+    columns = ["URL", *LINK_METADATA_COLUMNS]
+    # Compare the CSV text form, so lists built by groupby match lists read back from disk
+    previous = previous_df[columns].astype(str)
+    current = current_df[columns].astype(str)
+    merged = previous.merge(current, on="URL", how="outer", suffixes=("_previous", ""), indicator=True)
+
+    added = merged[merged["_merge"] == "right_only"].assign(Change="added")
+    removed = merged[merged["_merge"] == "left_only"].assign(Change="removed", filename=lambda d: d["filename_previous"])
+
+    both = merged[merged["_merge"] == "both"]
+    differences = pd.DataFrame({col: both[col] != both[f"{col}_previous"] for col in LINK_METADATA_COLUMNS})
+    changed_columns = pd.Series(
+        [";".join(col for col, differs in zip(LINK_METADATA_COLUMNS, row) if differs) for row in differences.itertuples(index=False)],
+        index=both.index,
+        dtype=object,
+    )
+    changed = both.assign(Change="metadata_changed", **{"Changed Columns": changed_columns})[changed_columns != ""]
+
+    diff = pd.concat([added, removed, changed], ignore_index=True)
+    diff["Changed Columns"] = diff["Changed Columns"].fillna("") if "Changed Columns" in diff else ""
+    return diff[["URL", "filename", "Change", "Changed Columns"]].sort_values(["Change", "URL"], ignore_index=True)
+
+
+def read_links_diff(data_path, diff_file="links_diff.csv"):
+    """
+    Load the links diff written by get_indexes as sets of URLs keyed by change
+    ("added", "removed", "metadata_changed"). Returns None if there is no diff.
+    """
+    diff_path = os.path.join(data_path, diff_file)
+    if not os.path.exists(diff_path):
+        return None
+    diff = pd.read_csv(diff_path)
+    return {
+        change: set(diff.loc[diff["Change"] == change, "URL"]) for change in ["added", "removed", "metadata_changed"]
+    }
@@ -0,0 +1,89 @@
+import hashlib
+import os
+import tempfile
+
+# Default location and size limit of the cache, shared by every run
+LLAMAPARSE_CACHE_DIR = os.getenv("LLAMAPARSE_CACHE_DIR", "data/llamaparse_cache")
+LLAMAPARSE_CACHE_MAX_BYTES = int(os.getenv("LLAMAPARSE_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+
+
+class LlamaParseCache:
+    """
+    Content-addressed on-disk cache of LlamaParse markdown.
+
+    Entries are keyed by the SHA-256 of the parsing instruction and the TXT content,
+    so identical inputs skip the API call no matter which file or run they come from.
+    Each entry is one file written atomically, which makes the cache safe to share
+    between worker processes. Reads refresh the file's mtime and `evict` removes the
+    least recently used entries once the cache grows over `max_bytes`.
+    """
+
+    def __init__(self, cache_dir=LLAMAPARSE_CACHE_DIR, max_bytes=LLAMAPARSE_CACHE_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+
+    @staticmethod
+    def key(content, parsing_instruction):
+        hasher = hashlib.sha256()
+        hasher.update(parsing_instruction.encode("utf-8"))
+        hasher.update(b"\0")
+        hasher.update(content.encode("utf-8"))
+        return hasher.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key[:2], f"{key}.md")
+
+    def get(self, key):
+        """Return the cached markdown for key, or None on a miss."""
+        path = self._path(key)
+        try:
+            with open(path, encoding="utf-8") as f:
+                markdown = f.read()
+        except FileNotFoundError:
+            return None
+        try:
+            os.utime(path)  # mark as recently used
+        except FileNotFoundError:
+            pass  # evicted by another process since the read, which is still a hit
+        return markdown
+
+    def put(self, key, markdown):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(markdown)
+        os.replace(tmp_path, path)
+
+    def evict(self):
+        """
+        Delete least recently used entries until the cache fits in max_bytes. Returns the number removed.
+
+        Temporary files of puts still being written are left alone, and entries that another
+        process removes meanwhile are skipped.
+        """
+        if not os.path.isdir(self.cache_dir):
+            return 0
+        entries = []
+        for root, _dirs, files in os.walk(self.cache_dir):
+            for file in files:
+                if file.endswith(".tmp"):
+                    continue
+                path = os.path.join(root, file)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+        total_size = sum(size for _, size, _ in entries)
+        removed = 0
+        for _, size, path in sorted(entries):
+            if total_size <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+                removed += 1
+            except FileNotFoundError:
+                pass
+            total_size -= size
+        return removed
@@ -4,6 +4,8 @@ from collections import defaultdict
 
 import pandas as pd
 
+from utils.event_log import flush_event_logs
+
 
 def analyze_logs():
     """
@@ -74,6 +76,9 @@ URL removal during the merging process, which is normal and expected.*
     detailed_log_path = os.path.join(DATA_PATH, "pipeline_detailed_log.jsonl")
     all_links_path = os.path.join(DATA_PATH, "all_links.csv")
 
+    # Make sure entries still buffered by the pipeline are on disk before reading
+    flush_event_logs()
+
     if not os.path.exists(detailed_log_path):
         output_lines.append(f"Detailed log file not found: {detailed_log_path}\n")
     elif not os.path.exists(all_links_path):
@@ -29,13 +29,15 @@ def unstructured_elements_to_markdown(elements):  # noqa: C901
     return "".join(texts)
 
 
+QUOTES_TABLE = str.maketrans({"“": '"', "”": '"', "‘": "'", "’": "'"})  # noqa: RUF001
+CAMEL_CASE_PATTERN = re.compile(r"([a-z])([A-Z])")
+
+
 def _clean(text):
     """Convert fancy quotes to normal quotes."""
-    text = text.replace("“", '"').replace("”", '"')
-    text = text.replace("‘", "'").replace("’", "'")  # noqa: RUF001
-    return text
+    return text.translate(QUOTES_TABLE)
 
 
 def _fix_case(text):
     """Convert uppercase letters preceded by a lowercase letter to lowercase letters"""
-    return re.sub(r"([a-z])([A-Z])", lambda m: m.group(1) + m.group(2).lower(), text)
+    return CAMEL_CASE_PATTERN.sub(lambda m: m.group(1) + m.group(2).lower(), text)
@@ -1,24 +1,31 @@
+import asyncio
 import csv
 import datetime
-import json
+import hashlib
 import logging
 import os
 import re
 import time
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 
 import nest_asyncio
 import yaml
-from bs4 import BeautifulSoup
+from bs4 import BeautifulSoup, NavigableString, Tag
 from dotenv import load_dotenv
-from llama_index.core import SimpleDirectoryReader
+from llama_index.core import Document
 from llama_parse import LlamaParse
-from markdownify import markdownify as md
+from markdownify import MarkdownConverter
 from unstructured_client import UnstructuredClient
 from unstructured_client.models import shared
 from unstructured_client.models.errors import SDKError
 
+from utils.event_log import flush_event_logs, log_event
+from utils.llamaparse_cache import LlamaParseCache
 from utils.markdown_utils import unstructured_elements_to_markdown
-from utils.tools import get_domain, get_files
+from utils.pdf_extract import extract_pdf_elements, is_low_quality_extraction
+from utils.rule_table import RegexRule, RuleTable
+from utils.tools import get_domain, get_files, replace_file
 
 # Set the logging level to WARNING or higher to suppress INFO messages
 logging.basicConfig(level=logging.WARNING)
@@ -42,108 +49,180 @@ def is_empty_content(content):
     return not content
 
 
-def clean_markdown(text):
-    text = re.sub(r"```markdown+", "", text)
-
-    # Remove Markdown backticks
-    text = re.sub(r"```+", "", text)
-
-    # Remove inline code backticks (`text`)
-    text = re.sub(r"`+", "", text)
-
-    text = re.sub(r"\[Print\]\(javascript:window\.print\(\)\)", "", text)
-
-    # Remove list of links with same anchors
-    text = re.sub(r"(?:(https?:\/\/[^\s]+)\s+){2,}", "", text)  # Remove repeated links
-
-    # Replace [link](#) and [link](url) with link text only
-    text = re.sub(r"\[([^\]]+)\]\(([^)]+)\)", r"\1", text)
-
-    # Remove lists of links to the same page (e.g., [All](#) [Web Pages](#))
-    text = re.sub(r"(\[([^\]]+)\]\(#\))+(?:\s|,)*", "", text)
-
-    # Regular expression to remove unnecessary text from
-    # knowledge base articles
-    # Remove specific table headers
-    text = re.sub(r"\| \*\*Bot Information\*\* \|\n\| --- \|", "", text)
-    text = re.sub(r"\| \*\*Information\*\* \|\n\| --- \|", "", text)
-    text = re.sub(r"Views:\n\n\|\s*Article Overview\s*\|\s*\n\|\s*---\s*\|\s*\n\|.*?\|", "", text, flags=re.DOTALL)
-    text = re.sub(r"\|\s*Information\s*\|\s*\n\|\s*---\s*\|\s*\n\|.*?\|", "", text, flags=re.DOTALL)
-    text = re.sub(r"\|\s*Bot Information\s*\|\s*\n\|\s*---\s*\|\s*\n\|.*?\|", "", text, flags=re.DOTALL)
-    text = re.sub(r"\n\s*\*\*Information\*\*\s*\n", "\n", text)
-    text = re.sub(r"##? Views:\n\n\| \*\*Article Overview\*\* \|\n\| --- \|\n\|.*?\|", "", text, flags=re.DOTALL)
-    text = re.sub(r"Views:\n\n\| \*\*Article Overview\*\* \|\n\| --- \|\n\|.*?\|", "", text, flags=re.DOTALL)
-    text = re.sub(r"^\| Information \|\n", "", text, flags=re.MULTILINE)
-    text = re.sub(r"\*\s*(Home|Knowledge Base - Home|KA-\d+)\s*\n", "", text)
-    text = re.sub(
-        r"(You’re offline.*?Knowledge Articles|Contoso, Ltd\.|BYU-Pathway Worldwide|Toggle navigation[.\w\s\*\+\-\:]+|Search Filter|Search\n|Knowledge Article Key:)",
-        "",
-        text,
-    )
-    text = re.sub(r"You’re offline\. This is a read only version of the page\.", "", text)
+MARKDOWN_CLEANING_RULES = RuleTable(
+    [
+        # "```markdown" fences and all other backticks. Same result as removing
+        # ```markdown+, then ```+, then `+ one after another.
+        RegexRule("backticks", r"`+(?:(?<=```)markdown+)?", requires=("`",)),
+        RegexRule("print_link", r"\[Print\]\(javascript:window\.print\(\)\)", requires=("[Print](",)),
+        # Remove list of links with same anchors
+        RegexRule("repeated_links", r"https?://\S+\s+(?:https?://\S+\s+)+", requires=("http",)),
+        # Replace [link](#) and [link](url) with link text only
+        RegexRule("link_text", r"\[([^\]]+)\]\(([^)]+)\)", r"\1", requires=("](",)),
+        # Remove lists of links to the same page (e.g., [All](#) [Web Pages](#))
+        RegexRule("same_page_links", r"(\[([^\]]+)\]\(#\))+(?:\s|,)*", requires=("](#)",)),
+        # Unnecessary text from knowledge base articles
+        RegexRule("kb_bot_information_header", r"\| \*\*Bot Information\*\* \|\n\| --- \|", requires=("**Bot Information**",)),
+        RegexRule("kb_information_header", r"\| \*\*Information\*\* \|\n\| --- \|", requires=("**Information**",)),
+        RegexRule(
+            "kb_views_overview_table",
+            r"Views:\n\n\|\s*Article Overview\s*\|\s*\n\|\s*---\s*\|\s*\n\|.*?\|",
+            flags=re.DOTALL,
+            requires=("Views:",),
+        ),
+        RegexRule(
+            "kb_information_table",
+            r"\|\s*Information\s*\|\s*\n\|\s*---\s*\|\s*\n\|.*?\|",
+            flags=re.DOTALL,
+            requires=("Information",),
+        ),
+        RegexRule(
+            "kb_bot_information_table",
+            r"\|\s*Bot Information\s*\|\s*\n\|\s*---\s*\|\s*\n\|.*?\|",
+            flags=re.DOTALL,
+            requires=("Bot Information",),
+        ),
+        RegexRule("kb_information_label", r"\n\s*\*\*Information\*\*\s*\n", "\n", requires=("**Information**",)),
+        RegexRule(
+            "kb_views_heading_table",
+            r"##? Views:\n\n\| \*\*Article Overview\*\* \|\n\| --- \|\n\|.*?\|",
+            flags=re.DOTALL,
+            requires=("Views:",),
+        ),
+        RegexRule(
+            "kb_views_bold_table",
+            r"Views:\n\n\| \*\*Article Overview\*\* \|\n\| --- \|\n\|.*?\|",
+            flags=re.DOTALL,
+            requires=("Views:",),
+        ),
+        RegexRule("kb_information_row", r"^\| Information \|\n", flags=re.MULTILINE, requires=("| Information |",)),
+        RegexRule("kb_breadcrumbs", r"\*\s*(Home|Knowledge Base - Home|KA-\d+)\s*\n", requires=("Home", "KA-")),
+        RegexRule(
+            "kb_navigation",
+            r"(You’re offline.*?Knowledge Articles|Contoso, Ltd\.|BYU-Pathway Worldwide|Toggle navigation[.\w\s\*\+\-\:]+|Search Filter|Search\n|Knowledge Article Key:)",
+            requires=("You’re offline", "Contoso, Ltd.", "BYU-Pathway Worldwide", "Toggle navigation", "Search", "Knowledge Article Key:"),
+        ),
+        RegexRule("kb_offline_banner", r"You’re offline\. This is a read only version of the page\.", requires=("You’re offline",)),
+        # Remove empty headers
+        RegexRule("empty_headers", r"^#+\s*$", flags=re.MULTILINE, requires=("#",)),
+        # Remove text from WhatsApp navigation
+        RegexRule("whatsapp_copy_link", r"Copy link\S*", "Copy link", requires=("Copy link",)),
+        # Remove broken links
+        RegexRule("broken_links", r"\[([^\]]+)\]\.\n\n\((http[^\)]+)\) \(([^)]+)\)\.", r"\1 (\3).", requires=("].\n\n(http",)),
+        # Remove consecutive blank lines
+        RegexRule("blank_lines", r"\n\s*\n\s*\n", "\n\n", requires=("\n",)),
+    ]
+)
 
-    # Others regular expressions to remove unnecessary text
-    # Remove empty headers
-    text = re.sub(r"^#+\s*$", "", text, flags=re.MULTILINE)
 
-    # Remove text from WhatsApp navigation
-    text = re.sub(r"Copy link\S*", "Copy link", text)
+def clean_markdown(text, profile=False):
+    """
+    Removes code fences, link markup and knowledge base boilerplate from Markdown.
+    With `profile=True` the time of each rule is added to MARKDOWN_CLEANING_RULES.timings.
+    """
+    return MARKDOWN_CLEANING_RULES.apply(text, profile)
 
-    # Remove text from the hall foundation menu
-    # text = re.sub(r"(Skip to content|Menu|[*+-].*)\n", '', text, flags=re.MULTILINE)
 
-    # Remove broken links
-    text = re.sub(r"\[([^\]]+)\]\.\n\n\((http[^\)]+)\) \(([^)]+)\)\.", r"\1 (\3).", text)
+# Helper functions for cleaning and parsing HTML and PDF content
+# Elements removed by clean_html: tag names, then the equivalent of the CSS selectors
+# [aria-label="Search Filter"], [aria-label*="Menu"], [aria-label*="menu"],
+# [class*="menu"], [class*="Menu"], [role="region"], [role="dialog"], .sr-only,
+# .navbar, .breadcrumb, .btn-toolbar and .skip-link
+UNWANTED_TAGS = {
+    "head",
+    "style",
+    "script",
+    "img",
+    "svg",
+    "meta",
+    "link",
+    "iframe",
+    "noscript",
+    "footer",
+    "nav",
+    "ps-header",
+}
+UNWANTED_ROLES = {"region", "dialog"}
+UNWANTED_CLASSES = {"sr-only", "navbar", "breadcrumb", "btn-toolbar", "skip-link"}
+# Tags whose whitespace html.parser keeps as is
+PRESERVE_WHITESPACE_TAGS = ["pre", "textarea"]
+
+
+def _is_unwanted(tag):
+    if tag.name in UNWANTED_TAGS:
+        return True
+    attrs = tag.attrs
+    if not attrs:
+        return False
+    aria_label = attrs.get("aria-label")
+    if aria_label is not None and (aria_label == "Search Filter" or "Menu" in aria_label or "menu" in aria_label):
+        return True
+    if attrs.get("role") in UNWANTED_ROLES:
+        return True
+    classes = attrs.get("class")
+    if classes:
+        if isinstance(classes, str):
+            classes = classes.split()
+        joined = " ".join(classes)
+        if "menu" in joined or "Menu" in joined or not UNWANTED_CLASSES.isdisjoint(classes):
+            return True
+    return False
 
-    # Remove consecutive blank lines
-    text = re.sub(r"\n\s*\n\s*\n", "\n\n", text)
 
-    return text
+def _join_strings(tag):
+    """
+    Merge each run of adjacent strings among the children of `tag` into one, collapsing
+    a run of whitespace only to one newline or space, as serializing and re-parsing the
+    tree would.
+    """
+    run = []
+    for child in [*tag.contents, None]:
+        if type(child) is NavigableString:
+            run.append(child)
+            continue
+        if len(run) > 1:
+            text = "".join(run)
+            preserve_whitespace = tag.name in PRESERVE_WHITESPACE_TAGS or tag.find_parent(PRESERVE_WHITESPACE_TAGS)
+            if not text.strip() and not preserve_whitespace:
+                text = "\n" if "\n" in text else " "
+            run[0].replace_with(NavigableString(text))
+            for string in run[1:]:
+                string.extract()
+        run = []
 
 
-# Helper functions for cleaning and parsing HTML and PDF content
 def clean_html(soup):
     """Cleans the HTML content by removing unnecessary elements and extracting the title text."""
     # Extract the title text
     title_text = soup.title.string if soup.title else None
 
-    # Remove unnecessary elements
-    for tag in soup([
-        "head",
-        "style",
-        "script",
-        "img",
-        "svg",
-        "meta",
-        "link",
-        "iframe",
-        "noscript",
-        "footer",
-        "nav",
-        "ps-header",
-    ]):
+    # Find the unnecessary elements in one walk over the tree, without descending
+    # into elements that are removed anyway
+    unwanted = []
+    stack = [soup]
+    while stack:
+        children = deque(stack.pop().contents)
+        while children:
+            child = children.popleft()
+            if not isinstance(child, Tag):
+                continue
+            if child.can_be_empty_element and child.contents:
+                # html.parser sometimes nests the following content inside a void element
+                # like <br>; move it out, as serializing and re-parsing the tree would
+                hoisted = list(child.contents)
+                child.insert_after(*hoisted)
+                children.extendleft(reversed(hoisted))
+            if _is_unwanted(child):
+                unwanted.append(child)
+            else:
+                stack.append(child)
+    parents = {id(tag.parent): tag.parent for tag in unwanted}
+    for tag in unwanted:
         tag.decompose()
+    # The strings around a removed element become neighbours
+    for parent in parents.values():
+        _join_strings(parent)
 
-    # Create selectors to remove elements
-    selectors = [
-        '[aria-label="Search Filter"]',
-        '[aria-label*="Menu"]',
-        '[aria-label*="menu"]',
-        '[class*="menu"]',
-        '[class*="Menu"]',
-        '[role="region"]',
-        '[role="dialog"]',
-        ".sr-only",
-        ".navbar",
-        ".breadcrumb",
-        ".btn-toolbar",
-        ".skip-link",
-    ]
-
-    # Remove elements by selectors
-    for selector in selectors:
-        for tag in soup.select(selector):
-            tag.decompose()
     # Determine the content container (main or body)
     content = soup.main or soup.body
 
@@ -173,7 +252,7 @@ def clean_text(text):
         return ""
 
     # Replace null characters
-    text = re.sub(r"\x00", "th", text)
+    text = text.replace("\x00", "th")
 
     # Remove leading and trailing whitespace
     text = text.strip()
@@ -190,88 +269,238 @@ def clean_text(text):
     return text
 
 
-def parse_pdf_to_txt(filepath, out_folder):
+# Delay before retrying a failed partition request, doubled after each failure
+PDF_RETRY_DELAY = 2
+
+
+class UnstructuredPartitionBackend:
     """
-    Parse PDF file to a text file.
+    Partitions PDFs through the Unstructured API.
+
+    The client is created on first use and reused for every PDF, so concurrent
+    partition requests share its HTTP connection pool.
     """
-    s = UnstructuredClient(
-        api_key_auth=os.environ["UNSTRUCTURED_API_KEY"],
-        server_url=os.environ["UNSTRUCTURED_SERVER_URL"],
-    )
 
-    file_path = filepath
-    print("Processing PDF file:", file_path)
+    def __init__(self, api_key=None, server_url=None):
+        self.api_key = api_key
+        self.server_url = server_url
+        self.client = None
+
+    def partition(self, file_path):
+        """Return the element dicts for file_path. Raises on API errors."""
+        if self.client is None:
+            self.client = UnstructuredClient(
+                api_key_auth=self.api_key or os.environ["UNSTRUCTURED_API_KEY"],
+                server_url=self.server_url or os.environ["UNSTRUCTURED_SERVER_URL"],
+            )
 
-    with open(file_path, "rb") as f:
-        files = shared.Files(content=f.read(), file_name=file_path)
+        with open(file_path, "rb") as f:
+            files = shared.Files(content=f.read(), file_name=file_path)
 
-    req = shared.PartitionParameters(
-        files=files,
-        strategy="fast",
-        languages=["eng"],
-        encoding="utf-8",
-    )
+        req = shared.PartitionParameters(
+            files=files,
+            strategy="fast",
+            languages=["eng"],
+            encoding="utf-8",
+        )
+        return self.client.general.partition(req).elements
+
+
+class LocalPartitionBackend:
+    """Extracts the PDF text layer locally with pypdf, without any network call."""
+
+    def partition(self, file_path):
+        elements, _page_count = extract_pdf_elements(file_path)
+        return elements
+
+
+class LocalFirstPartitionBackend:
+    """
+    Chooses per document between local extraction and the Unstructured API.
+
+    Text-based PDFs are extracted locally. The API is only called when the local
+    result is empty or low quality (scanned pages, broken font encodings) or when
+    pypdf fails to read the file.
+    """
+
+    def __init__(self, remote=None):
+        self.remote = remote or UnstructuredPartitionBackend()
+
+    def partition(self, file_path):
+        try:
+            elements, page_count = extract_pdf_elements(file_path)
+        except Exception as e:
+            print(f"Local extraction failed for {file_path} ({e}); using the Unstructured API")
+            return self.remote.partition(file_path)
+
+        if is_low_quality_extraction(elements, page_count):
+            print(f"Local extraction of {file_path} looks low quality; using the Unstructured API")
+            return self.remote.partition(file_path)
+
+        print(f"Extracted PDF text locally: {file_path}")
+        return elements
+
+
+# Backends selectable with PDF_PARTITION_BACKEND. Any object with a
+# partition(file_path) method returning Unstructured element dicts can be used,
+# e.g. a local stand-in for the API in tests.
+PARTITION_BACKENDS = {
+    "unstructured": UnstructuredPartitionBackend,
+    "local": LocalPartitionBackend,
+    "local_first": LocalFirstPartitionBackend,
+}
+
+_default_partition_backend = None
+
+
+def get_partition_backend():
+    """Return the process-wide partition backend chosen by PDF_PARTITION_BACKEND."""
+    global _default_partition_backend
+    if _default_partition_backend is None:
+        _default_partition_backend = PARTITION_BACKENDS[os.getenv("PDF_PARTITION_BACKEND", "unstructured")]()
+    return _default_partition_backend
+
+
+def parse_pdf_to_txt(filepath, backend=None):
+    """
+    Parse a PDF file to text. Returns the text, or None when partitioning failed or
+    produced no content.
+    """
+    backend = backend or get_partition_backend()
+
+    file_path = filepath
+    print("Processing PDF file:", file_path)
 
     try:
-        resp = s.general.partition(req)
+        elements = backend.partition(file_path)
     except SDKError as e:
         print(e)
-        return "Error"
+        return None
     except Exception as e:
         print("Another exception", e)
-        return "Error"
+        return None
 
-    simple_md = unstructured_elements_to_markdown(resp.elements)
+    simple_md = unstructured_elements_to_markdown(elements)
     simple_md = clean_text(simple_md)
 
     if not simple_md:
-        return "Error"
+        return None
 
-    # filepath["size"] = len(simple_md)
-    file_out = os.path.join(
-        out_folder, "from_pdf", os.path.basename(file_path).replace(".pdf", ".txt")
-    )  # filepath["path"].replace(".pdf", ".txt")
+    print(f"Parsed PDF to TXT: {file_path}")
+    return simple_md
 
-    os.makedirs(os.path.dirname(file_out), exist_ok=True)
 
-    with open(file_out, "w", encoding="utf-8") as f:
-        f.write(simple_md)
+HTML_TO_MARKDOWN = MarkdownConverter(heading_style="ATX")
 
-    print(f"Parsed PDF to TXT and saved to: {file_out}")
-    return file_out
 
-
-def convert_html_to_markdown(file_path, out_folder):
+def convert_html_to_markdown(file_path):
     """
-    Converts HTML content from a file to Markdown and saves it to a new .txt file.
+    Converts HTML content from a file to Markdown.
+
+    Returns the Markdown and the page <title>, which parse_txt_to_md writes as the
+    "title: " line that finalize_markdown turns into the title_tag metadata. The
+    Markdown is None and the title "Error parsing." when the page has no content.
     """
     with open(file_path, encoding="utf-8") as f:
         html_content = f.read()
 
+    markdown_content, title_tag = html_to_markdown(html_content)
+    if markdown_content is not None:
+        print(f"Converted HTML to TXT: {file_path}")
+    return markdown_content, title_tag
+
+
+def html_to_markdown(html_content):
+    """Does the conversion of convert_html_to_markdown on an HTML string."""
     soup = BeautifulSoup(html_content, "html.parser")
+    title_tag = clean_title((soup.title.string if soup.title else "") or "")
     cleaned_soup = clean_html(soup)
 
+    # Keep a <title> placed before the document out of the content
     title = soup.contents[0]
-    title_tag = title.text if title.name == "title" else ""
-    if title_tag:
+    if title.name == "title":
         title.decompose()
 
-    markdown_content = md(str(cleaned_soup), heading_style="ATX")
+    # Convert the cleaned tree directly instead of serializing it for markdownify to parse again
+    markdown_content = HTML_TO_MARKDOWN.convert_soup(cleaned_soup)
     markdown_content = re.sub(r"\n{2,}", "\n\n", markdown_content)
 
-    file_out = os.path.join(out_folder, "from_html", os.path.basename(file_path).replace(".html", ".txt"))
-    # Create the directory if it doesn't exist
-    os.makedirs(os.path.dirname(file_out), exist_ok=True)
-
     if is_empty_content(markdown_content):
-        return file_path, "Error parsing."
+        return None, "Error parsing."
+    return markdown_content, title_tag
 
-    with open(file_out, "w", encoding="utf-8") as f:
-        f.write(markdown_content)
 
-    print(f"Converted HTML to TXT and saved to: {file_out}")
+def html_content_fingerprint(file_path):
+    """
+    SHA-256 of the page title and the Markdown that convert_html_to_markdown produces
+    for an HTML file, with whitespace collapsed.
+
+    Only the cleaned main content counts, so navigation, scripts, forms and other
+    boilerplate (rotating tokens, CSRF values, counters in the page chrome) can change
+    without changing the fingerprint. Returns None when the file cannot be converted.
+    """
+    try:
+        with open(file_path, encoding="utf-8") as f:
+            markdown_content, title_tag = html_to_markdown(f.read())
+    except Exception as e:
+        print(f"Could not fingerprint {file_path}: {e}")
+        return None
 
-    return file_out, title_tag
+    if markdown_content is None:
+        return None
+    hasher = hashlib.sha256()
+    hasher.update(title_tag.encode("utf-8"))
+    hasher.update(b"\0")
+    hasher.update(" ".join(markdown_content.split()).encode("utf-8"))
+    return hasher.hexdigest()
+
+
+def get_txt_path(file_path, out_folder):
+    """
+    Path of the intermediate .txt for a source file, e.g. out/from_pdf/name.txt. The
+    Markdown is written next to it as .md, and the text itself is only saved there
+    (in the error folder) when parsing fails.
+    """
+    subfolder = "from_pdf" if file_path.lower().endswith(".pdf") else "from_html"
+    return os.path.join(out_folder, subfolder, os.path.splitext(os.path.basename(file_path))[0] + ".txt")
+
+
+PDF_PARSING_INSTRUCTION = (
+    "Convert the provided text into accurate and well-structured Markdown format, closely resembling the original PDF structure. "
+    "Use headers from H1 to H3, with H1 for main titles, H2 for sections, and H3 for subsections. "
+    "Detect any bold, large, or all-uppercase text as headers. "
+    "Preserve bullet points and numbered lists with proper indentation to reflect nested lists. "
+    "if it is not a header, ensure that bold and italic text is properly formatted using double **asterisks** for bold and single *asterisks* for italic"
+    "Detect and correctly format blockquotes using the '>' symbol for any quoted text. "
+    "When processing text, pay attention to line breaks that may incorrectly join or split words. "
+    "Automatically correct common errors, such as wrongly concatenated words or broken lines, to ensure the text reads naturally"
+    "If code snippets or technical commands are found, enclose them in triple backticks ``` for proper formatting. "
+    "If any tables are detected, parse them as a title (bold header) followed by list items"
+    "If you see the same header multiple times, merge them into one."
+    "If images contain important text, transcribe only the highlighted or boxed text and ignore general background text. "
+    "Do not enclose fragments of code/Markdown or any other content in triple backticks unless they are explicitly formatted as code blocks in the original text. "
+    "The final output should be a clean, concise Markdown document closely reflecting the original PDF's intent and structure without adding any extra text."
+)
+
+HTML_PARSING_INSTRUCTION = (
+    "Convert the provided text into accurate and well-structured Markdown format, strictly preserving the original structure. "
+    "Use headers from H1 to H3 only where they naturally occur in the text, and do not create additional headers or modify existing ones. "
+    "Do not split the text into multiple sections or alter the sequence of content. "
+    "Detect bold, large, or all-uppercase text as headers only if they represent a natural section break in the original text. "
+    "Preserve all links, ensuring that they remain correctly formatted and in their original place in the text. "
+    "Maintain bullet points and numbered lists with proper indentation to reflect any nested lists, ensuring list numbers remain in sequence. "
+    "If the text is not a header, ensure that bold and italic text is properly formatted using double **asterisks** for bold and single *asterisks* for italic. "
+    "Detect and correctly format blockquotes using the '>' symbol for any quoted text, but do not reformat text that is already in correct Markdown format. "
+    "Respect the original line breaks and text flow, avoiding unnecessary splits, merges, or reordering of content. "
+    "If any tables are detected, parse them as a title (bold header) followed by list items, but do not reformat existing Markdown tables. "
+    "Merge identical headers only if they represent the same section and their content is identical, ensuring no changes to the order of the text. "
+    "Do not enclose fragments of code/Markdown or any other content in triple backticks unless they are explicitly formatted as code blocks in the original text. "
+    "Ensure that the final output is a clean, concise Markdown document that closely reflects the original text's intent and structure, without adding or omitting any content."
+)
+
+PARSING_INSTRUCTIONS = {".pdf": PDF_PARSING_INSTRUCTION, ".html": HTML_PARSING_INSTRUCTION}
+
+llamaparse_cache = LlamaParseCache()
 
 
 def create_file_extractor(parse_type="pdf"):
@@ -281,42 +510,13 @@ def create_file_extractor(parse_type="pdf"):
         parser = LlamaParse(
             api_key=os.environ["LLAMA_CLOUD_API_KEY"],
             result_type="markdown",
-            parsing_instruction=(
-                "Convert the provided text into accurate and well-structured Markdown format, closely resembling the original PDF structure. "
-                "Use headers from H1 to H3, with H1 for main titles, H2 for sections, and H3 for subsections. "
-                "Detect any bold, large, or all-uppercase text as headers. "
-                "Preserve bullet points and numbered lists with proper indentation to reflect nested lists. "
-                "if it is not a header, ensure that bold and italic text is properly formatted using double **asterisks** for bold and single *asterisks* for italic"
-                "Detect and correctly format blockquotes using the '>' symbol for any quoted text. "
-                "When processing text, pay attention to line breaks that may incorrectly join or split words. "
-                "Automatically correct common errors, such as wrongly concatenated words or broken lines, to ensure the text reads naturally"
-                "If code snippets or technical commands are found, enclose them in triple backticks ``` for proper formatting. "
-                "If any tables are detected, parse them as a title (bold header) followed by list items"
-                "If you see the same header multiple times, merge them into one."
-                "If images contain important text, transcribe only the highlighted or boxed text and ignore general background text. "
-                "Do not enclose fragments of code/Markdown or any other content in triple backticks unless they are explicitly formatted as code blocks in the original text. "
-                "The final output should be a clean, concise Markdown document closely reflecting the original PDF's intent and structure without adding any extra text."
-            ),
+            parsing_instruction=PDF_PARSING_INSTRUCTION,
         )
     if parse_type == ".html":
         parser = LlamaParse(
             api_key=os.environ["LLAMA_CLOUD_API_KEY"],
             result_type="markdown",  # "markdown" and "text" are available
-            parsing_instruction=(
-                "Convert the provided text into accurate and well-structured Markdown format, strictly preserving the original structure. "
-                "Use headers from H1 to H3 only where they naturally occur in the text, and do not create additional headers or modify existing ones. "
-                "Do not split the text into multiple sections or alter the sequence of content. "
-                "Detect bold, large, or all-uppercase text as headers only if they represent a natural section break in the original text. "
-                "Preserve all links, ensuring that they remain correctly formatted and in their original place in the text. "
-                "Maintain bullet points and numbered lists with proper indentation to reflect any nested lists, ensuring list numbers remain in sequence. "
-                "If the text is not a header, ensure that bold and italic text is properly formatted using double **asterisks** for bold and single *asterisks* for italic. "
-                "Detect and correctly format blockquotes using the '>' symbol for any quoted text, but do not reformat text that is already in correct Markdown format. "
-                "Respect the original line breaks and text flow, avoiding unnecessary splits, merges, or reordering of content. "
-                "If any tables are detected, parse them as a title (bold header) followed by list items, but do not reformat existing Markdown tables. "
-                "Merge identical headers only if they represent the same section and their content is identical, ensuring no changes to the order of the text. "
-                "Do not enclose fragments of code/Markdown or any other content in triple backticks unless they are explicitly formatted as code blocks in the original text. "
-                "Ensure that the final output is a clean, concise Markdown document that closely reflects the original text's intent and structure, without adding or omitting any content."
-            ),
+            parsing_instruction=HTML_PARSING_INSTRUCTION,
         )
     file_extractor = {".txt": parser}
     return file_extractor
@@ -331,18 +531,13 @@ def has_markdown_tables(content):
     return all(re.search(pattern, content, re.MULTILINE) for pattern in table_patterns)
 
 
-def parse_txt_to_md(
-    file_path, file_extension, stats, empty_llamaparse_files_counted, detailed_log_path, title_tag="", url=None
-):
-    """
-    Parses a .txt file to a Markdown (.md) file using LlamaParse, with detailed logging.
+def _load_txt_for_parsing(file_path, content, file_extension, stats, detailed_log_path, url=None):
     """
-    import datetime
-    import json
-
-    with open(file_path, encoding="utf-8") as f:
-        content = f.read()
+    Resolves converted text without LlamaParse when possible.
 
+    Returns (documents, cache_key). `documents` is None when the text still has to be
+    sent to LlamaParse, i.e. it has no markdown tables and no cached result.
+    """
     log_entry = {
         "timestamp": datetime.datetime.now().isoformat(),
         "stage": "parse_txt_to_md",
@@ -350,26 +545,12 @@ def parse_txt_to_md(
         "status": "START",
         "message": "Starting TXT to MD parsing.",
     }
-    if detailed_log_path:
-        with open(detailed_log_path, "a") as f:
-            f.write(json.dumps(log_entry) + "\n")
-
-    if not has_markdown_tables(content):
-        documents = SimpleDirectoryReader(
-            input_files=[file_path], file_extractor=create_file_extractor(file_extension)
-        ).load_data()
-        log_entry = {
-            "timestamp": datetime.datetime.now().isoformat(),
-            "stage": "parse_txt_to_md",
-            "filepath": file_path,
-            "status": "LLAMAPARSE_USED",
-            "message": "Used LlamaParse extractor for TXT file.",
-        }
-        if detailed_log_path:
-            with open(detailed_log_path, "a") as f:
-                f.write(json.dumps(log_entry) + "\n")
-    else:
-        documents = SimpleDirectoryReader(input_files=[file_path]).load_data()
+    log_event(detailed_log_path, log_entry)
+
+    cache_key = LlamaParseCache.key(content, PARSING_INSTRUCTIONS.get(file_extension, ""))
+
+    if has_markdown_tables(content):
+        documents = [Document(text=content)]
         log_entry = {
             "timestamp": datetime.datetime.now().isoformat(),
             "stage": "parse_txt_to_md",
@@ -378,21 +559,51 @@ def parse_txt_to_md(
             "message": "Loaded TXT file directly without LlamaParse.",
             "url": url,  # Include the URL in the log entry
         }
-        if detailed_log_path:
-            with open(detailed_log_path, "a") as f:
-                f.write(json.dumps(log_entry) + "\n")
+        log_event(detailed_log_path, log_entry)
+        return documents, cache_key
 
-    final_content = "\n\n".join([doc.text for doc in documents])
+    cached_markdown = llamaparse_cache.get(cache_key)
+    if cached_markdown is None:
+        return None, cache_key
 
-    # If content from LlamaParse is empty, revert to original content
-    if is_empty_content(final_content):
-        final_content = content
+    stats["llamaparse_cache_hits"] += 1
+    log_entry = {
+        "timestamp": datetime.datetime.now().isoformat(),
+        "stage": "parse_txt_to_md",
+        "filepath": file_path,
+        "status": "LLAMAPARSE_CACHE_HIT",
+        "message": "Reused cached LlamaParse markdown for identical TXT content.",
+    }
+    log_event(detailed_log_path, log_entry)
+    return [Document(text=cached_markdown)], cache_key
 
-    # If the final content (even after reverting) is empty, then it's a failure
-    if is_empty_content(final_content):
-        print(f"Final content for {os.path.basename(file_path)} is empty. Moving to error.")
-        return True  # True indicates failure/empty
 
+def _record_llamaparse_result(file_path, documents, cache_key, stats, detailed_log_path):
+    """Counts a LlamaParse call and caches its markdown when it is not empty."""
+    stats["llamaparse_cache_misses"] += 1
+    parsed_markdown = "\n\n".join([doc.text for doc in documents])
+    if not is_empty_content(parsed_markdown):
+        llamaparse_cache.put(cache_key, parsed_markdown)
+    log_entry = {
+        "timestamp": datetime.datetime.now().isoformat(),
+        "stage": "parse_txt_to_md",
+        "filepath": file_path,
+        "status": "LLAMAPARSE_USED",
+        "message": "Used LlamaParse extractor for TXT file.",
+    }
+    log_event(detailed_log_path, log_entry)
+
+
+def _write_markdown(
+    file_path, content, documents, stats, detailed_log_path, title_tag="", metadata=None, excluded_domains=()
+):
+    """
+    Writes the parsed documents as .md at the .txt path. Returns True when the result is empty.
+
+    With the file's link `metadata` the Markdown is cleaned and gets its front matter
+    (finalize_markdown) before it is written, so the file is written once. Without it the
+    page title is written as a "title: " first line.
+    """
     final_content = "\n\n".join([doc.text for doc in documents])
 
     # If content from LlamaParse is empty, revert to original content
@@ -408,11 +619,15 @@ def parse_txt_to_md(
     out_name = file_path.replace(".txt", ".md")
 
     title_tag = clean_title(title_tag)
+    if metadata is not None:
+        markdown, _ = finalize_markdown(final_content, metadata, excluded_domains, title_tag)
+    elif title_tag:
+        markdown = f"title: {title_tag}\n{final_content}"
+    else:
+        markdown = final_content
 
     with open(out_name, "w", encoding="utf-8") as f:
-        if title_tag:
-            f.write(f"title: {title_tag}\n")
-        f.write(final_content)
+        f.write(markdown)
         print(f"Parsed TXT to MD and saved to: {out_name}")
 
     stats["md_files_generated"] += 1
@@ -424,25 +639,76 @@ def parse_txt_to_md(
         "status": "FINISHED",
         "message": f"Finished TXT to MD parsing. Empty: {is_empty_content(final_content)}",
     }
-    if detailed_log_path:
-        with open(detailed_log_path, "a") as f:
-            f.write(json.dumps(log_entry) + "\n")
+    log_event(detailed_log_path, log_entry)
 
     return False
 
 
-def associate_markdown_with_metadata(markdown_dirs, csv_path, excluded_domains):
+def parse_txt_to_md(
+    file_path,
+    content,
+    file_extension,
+    stats,
+    empty_llamaparse_files_counted,
+    detailed_log_path,
+    title_tag="",
+    url=None,
+    metadata=None,
+    excluded_domains=(),
+):
     """
-    Associates Markdown files with metadata from a CSV file.
+    Parses converted text to a Markdown (.md) file using LlamaParse, with detailed logging.
 
-    Parameters:
-    - markdown_dirs (list): List of directories containing Markdown files.
-    - csv_path (str): Path to the CSV file containing metadata.
+    `content` is the text of the .txt at `file_path`, which is uploaded from memory and
+    never written to disk; the .md is saved next to where the .txt would be.
+    """
+    documents, cache_key = _load_txt_for_parsing(file_path, content, file_extension, stats, detailed_log_path, url)
 
-    Returns:
-    - dict: Mapping of Markdown file paths to their corresponding metadata.
+    if documents is None:
+        parser = create_file_extractor(file_extension)[".txt"]
+        documents = parser.load_data(content.encode("utf-8"), extra_info={"file_name": os.path.basename(file_path)})
+        _record_llamaparse_result(file_path, documents, cache_key, stats, detailed_log_path)
+
+    return _write_markdown(
+        file_path, content, documents, stats, detailed_log_path, title_tag, metadata, excluded_domains
+    )
+
+
+async def aparse_txt_to_md(
+    file_path,
+    content,
+    file_extension,
+    stats,
+    detailed_log_path,
+    parser,
+    semaphore,
+    title_tag="",
+    url=None,
+    metadata=None,
+    excluded_domains=(),
+):
+    """
+    Async version of parse_txt_to_md that reuses a shared LlamaParse `parser` and holds
+    `semaphore` only while the file is in flight to the API.
+    """
+    documents, cache_key = _load_txt_for_parsing(file_path, content, file_extension, stats, detailed_log_path, url)
+
+    if documents is None:
+        async with semaphore:
+            documents = await parser.aload_data(
+                content.encode("utf-8"), extra_info={"file_name": os.path.basename(file_path)}
+            )
+        _record_llamaparse_result(file_path, documents, cache_key, stats, detailed_log_path)
+
+    return _write_markdown(
+        file_path, content, documents, stats, detailed_log_path, title_tag, metadata, excluded_domains
+    )
+
+
+def load_link_metadata(csv_path):
+    """
+    Reads the metadata of every link in all_links.csv, keyed by filename without extension.
     """
-    all_files = get_files(markdown_dirs)
     # Read the CSV file and store the file paths, URLs, headings, and subheadings in a dictionary
     file_metadata_mapping = {}
     with open(csv_path, newline="", encoding="utf-8") as file:
@@ -460,55 +726,91 @@ def associate_markdown_with_metadata(markdown_dirs, csv_path, excluded_domains):
                 "title": clean_text(row["Title"]),
                 "role": row["Role"],
             }
+    return file_metadata_mapping
 
-    # Now go through the markdown files in each directory and associate them with the metadata
-    markdown_metadata_mapping = {}
-    # List to save files without metadata
-    no_metadata = []
 
-    for markdown_path in all_files:
-        # Get the markdown filename without the extension
-        markdown_filename_without_ext = os.path.splitext(os.path.basename(markdown_path))[0]
+def remove_existing_yaml_frontmatter(content):
+    """
+    Removes existing YAML front matter from the given content.
+    Assumes that front matter is enclosed between '---' markers.
+    """
+    yaml_pattern = re.compile(r"^---[\s\S]*?---\s", re.MULTILINE)
+    return re.sub(yaml_pattern, "", content, count=1)
 
-        # Check if the filename matches any entry in the CSV dictionary
-        if markdown_filename_without_ext in file_metadata_mapping:
-            # Store the path relative to the directory
-            # full_path = os.path.join(markdown_dir, markdown_filename)
-            markdown_metadata_mapping[markdown_path] = file_metadata_mapping[markdown_filename_without_ext]
-            # open the file, and read if the first line begins with "title: "
-            with open(markdown_path, encoding="utf-8") as file:
-                lines = file.readlines()
 
-            if len(lines) == 0:
-                continue
-            # Revisar si la primera línea contiene el título
-            first_line = lines[0].strip()
-
-            # get the url from the metadata
-            url = markdown_metadata_mapping[markdown_path]["url"]
-            if first_line.startswith("title: "):
-                # Extraer el título de la primera línea
-                title = first_line.replace("title: ", "")
-                if get_domain(url) not in excluded_domains:
-                    markdown_metadata_mapping[markdown_path]["title_tag"] = title
-
-                # Eliminar la primera línea (la que contiene el título)
-                lines = lines[1:]
-
-                # Guardar el archivo sin la primera línea
-                with open(markdown_path, "w", encoding="utf-8") as file:
-                    file.writelines(lines)
-
-            # clean the markdown file and save it
-            with open(markdown_path, encoding="utf-8") as file:
-                content = file.read()
-                content = clean_markdown(content)
-            with open(markdown_path, "w", encoding="utf-8") as file:
-                file.write(content)
+def finalize_markdown(content, metadata, excluded_domains, title_tag=None):
+    """
+    Applies every post-processing step to one Markdown document in memory: keep the page
+    title as title_tag unless its domain is excluded, run clean_markdown and prepend the
+    YAML front matter. Returns (final_content, metadata).
 
-        else:
+    Without `title_tag` the title is taken from a "title: " first line of `content`.
+    """
+    metadata = dict(metadata)
+    if title_tag is None:
+        first_line, _, rest = content.partition("\n")
+        first_line = first_line.strip()
+        if first_line.startswith("title: "):
+            title_tag = first_line.replace("title: ", "")
+            content = rest
+    if title_tag and get_domain(metadata["url"]) not in excluded_domains:
+        metadata["title_tag"] = title_tag
+
+    content = clean_markdown(content)
+    content = remove_existing_yaml_frontmatter(content)
+    yaml_metadata = yaml.dump(metadata, default_flow_style=False, allow_unicode=True)
+    return f"---\n{yaml_metadata}---\n" + content, metadata
+
+
+def _postprocess_markdown_file(markdown_path, metadata, excluded_domains):
+    with open(markdown_path, encoding="utf-8") as file:
+        content = file.read()
+    # A file finalized by an earlier run keeps the page title of its front matter
+    title_tag = None
+    if content.startswith("---\n"):
+        front_matter = content[3:].partition("\n---\n")[0]
+        title_tag = (yaml.safe_load(front_matter) or {}).get("title_tag", "")
+    content, metadata = finalize_markdown(content, metadata, excluded_domains, title_tag)
+    # Replace rather than rewrite, since carried-forward files are hardlinks into the previous run
+    replace_file(markdown_path, content)
+    return markdown_path, metadata
+
+
+def postprocess_markdown_files(out_folder, csv_path, excluded_domains, workers=1, markdown_paths=None):
+    """
+    Cleans and attaches metadata, including the page title, to the Markdown files in
+    out_folder, reading and writing each file once, and lists the files without metadata
+    in no_metadata.csv.
+
+    Files parsed in this run are finalized as they are written (see process_directory),
+    so the pipeline passes only the files carried forward from the previous run as
+    `markdown_paths`, to refresh their front matter. None finalizes every file.
+
+    Parameters:
+    - out_folder (str): Folder containing the Markdown files.
+    - csv_path (str): Path to all_links.csv with the metadata of each file.
+    - excluded_domains (list): Domains whose page title is not kept as title_tag.
+    - workers (int): Number of processes used to post-process the files.
+    - markdown_paths (iterable): The only files to finalize, or None for all of them.
+
+    Returns:
+    - dict: Mapping of Markdown file paths to the metadata written in their front matter.
+    """
+    link_metadata = load_link_metadata(csv_path)
+    if markdown_paths is not None:
+        markdown_paths = {os.path.normpath(path) for path in markdown_paths}
+
+    tasks = []
+    no_metadata = []
+    for markdown_path in get_files(out_folder):
+        markdown_filename_without_ext = os.path.splitext(os.path.basename(markdown_path))[0]
+        if markdown_filename_without_ext not in link_metadata:
             print(f"No metadata found for {markdown_path}. Skipping.")
             no_metadata.append(markdown_path)
+        elif markdown_paths is not None and os.path.normpath(markdown_path) not in markdown_paths:
+            continue
+        elif markdown_path.endswith(".md") and "error/" not in markdown_path:
+            tasks.append((markdown_path, link_metadata[markdown_filename_without_ext], excluded_domains))
 
     # Guardamos en CSV las rutas de Markdown sin metadata
     no_metadata_csv_path = os.path.join(os.path.dirname(csv_path), "no_metadata.csv")
@@ -518,118 +820,102 @@ def associate_markdown_with_metadata(markdown_dirs, csv_path, excluded_domains):
         for nm_path in no_metadata:
             writer.writerow([nm_path])
 
-    print("\nMarkdown files and their metadata:")
-    for path, meta in markdown_metadata_mapping.items():
-        print(f"{path}: {meta}")
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(_postprocess_markdown_file, *zip(*tasks), chunksize=32)) if tasks else []
+    else:
+        results = [_postprocess_markdown_file(*task) for task in tasks]
 
-    return markdown_metadata_mapping
+    print(f"Metadata attached to {len(results)} Markdown files")
+    return dict(results)
 
 
-def remove_existing_yaml_frontmatter(content):
+def convert_pdf_to_txt(file_path, out_folder, stats, detailed_log_path, backend=None):
     """
-    Removes existing YAML front matter from the given content.
-    Assumes that front matter is enclosed between '---' markers.
+    Converts a PDF to text with up to 3 attempts, doubling the wait after each failure.
+    Returns (txt_file_path, content, title_tag) like convert_file_to_txt.
     """
-    yaml_pattern = re.compile(r"^---[\s\S]*?---\s", re.MULTILINE)
-    return re.sub(yaml_pattern, "", content, count=1)
+    stats["documents_sent_to_llamaparse"] += 1
+    log_entry = {
+        "timestamp": datetime.datetime.now().isoformat(),
+        "stage": "parse",
+        "filepath": file_path,
+        "status": "PDF_PROCESSING_ATTEMPT",
+        "reason": "Attempting to process PDF file.",
+    }
+    log_event(detailed_log_path, log_entry)
+    for i in range(3):
+        if i > 0:
+            log_entry = {
+                "timestamp": datetime.datetime.now().isoformat(),
+                "stage": "parse",
+                "filepath": file_path,
+                "status": "PDF_RETRY",
+                "reason": f"Retrying PDF processing (attempt {i + 1}).",
+            }
+            log_event(detailed_log_path, log_entry)
+        content = parse_pdf_to_txt(file_path, backend)
+        if content is not None:
+            log_entry = {
+                "timestamp": datetime.datetime.now().isoformat(),
+                "stage": "parse",
+                "filepath": file_path,
+                "status": "PDF_TO_TXT_SUCCESS",
+                "reason": "Successfully converted PDF to TXT.",
+            }
+            log_event(detailed_log_path, log_entry)
+            return get_txt_path(file_path, out_folder), content, ""
+        print("Error parsing PDF file. Retrying...")
+        log_entry = {
+            "timestamp": datetime.datetime.now().isoformat(),
+            "stage": "parse",
+            "filepath": file_path,
+            "status": "PDF_TO_TXT_FAILED",
+            "reason": "Failed to convert PDF to TXT. Retrying.",
+        }
+        log_event(detailed_log_path, log_entry)
+        if i < 2:
+            time.sleep(PDF_RETRY_DELAY * 2**i)
+    return file_path, None, "Error parsing."
 
 
-def attach_metadata_to_markdown_directories(markdown_dirs, metadata_dict):
+def convert_pdfs_concurrently(pdf_paths, out_folder, stats, detailed_log_path, max_workers, backend=None):
     """
-    Attaches metadata as YAML front matter to Markdown files.
-
-    Parameters:
-    - markdown_dirs (list): List of directories containing Markdown files.
-    - metadata_dict (dict): Mapping of Markdown file paths to their corresponding metadata.
-    """
-    # Loop through each directory provided
-
-    all_files = get_files(markdown_dirs, ignored="error/")
-
-    # Loop through each markdown file in the directory
-    for file_path in all_files:
-        if file_path.endswith(".md"):
-            if file_path in metadata_dict:  # Check if full path is in metadata_dict
-                # Extract metadata
-                metadata = metadata_dict[file_path]
-
-                # Open the markdown file, remove existing YAML front matter, and prepend new metadata
-                with open(file_path, "r+", encoding="utf-8") as file:
-                    content = file.read()
-                    # Remove any existing front matter
-                    content_without_frontmatter = remove_existing_yaml_frontmatter(content)
-                    # Prepare the new YAML front matter
-                    yaml_metadata = yaml.dump(metadata, default_flow_style=False, allow_unicode=True)
-                    front_matter = f"---\n{yaml_metadata}---\n"
-                    # Write the new front matter and content back to the file
-                    file.seek(0, 0)
-                    file.write(front_matter + content_without_frontmatter)
-                    file.truncate()  # Ensure the file doesn't retain any old content beyond the new content
-                print(f"Metadata attached to {file_path}")
-            else:
-                print(f"No metadata found for {file_path}. Skipping.")
-
-
-def process_file(file_path, out_folder, stats, empty_llamaparse_files_counted, detailed_log_path, url=None):
+    Converts PDFs to text in a thread pool, with at most `max_workers` partition
+    requests running at once (PDF_PARTITION_WORKERS in pathway_indexer.parser). Returns a dict mapping each PDF path to the
+    (txt_file_path, content, title_tag) result of convert_pdf_to_txt.
     """
-    Processes a file based on its extension: PDF or HTML.
+    backend = backend or get_partition_backend()
+    results = {}
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {}
+        for pdf_path in pdf_paths:
+            # Each task counts into its own Counter, merged here in the calling thread
+            task_stats = Counter()
+            future = executor.submit(convert_pdf_to_txt, pdf_path, out_folder, task_stats, detailed_log_path, backend)
+            futures[future] = (pdf_path, task_stats)
+        for future in as_completed(futures):
+            pdf_path, task_stats = futures[future]
+            results[pdf_path] = future.result()
+            _merge_stats(stats, task_stats)
+    return results
+
+
+def convert_file_to_txt(file_path, out_folder, stats, detailed_log_path):
     """
+    Converts a PDF or HTML file to intermediate text, retrying up to 3 times.
 
+    Returns (txt_file_path, content, title_tag). The text is kept in memory and only
+    written to disk if parsing fails; txt_file_path is where it would be saved. When
+    conversion failed, content is None, title_tag is "Error parsing." and
+    txt_file_path is the source file, which is moved to the error folder.
+    """
     txt_file_path = ""
+    content = None
     title_tag = ""
-    # get the file extension
-    file_extension = os.path.splitext(file_path)[1]
 
     if file_path.lower().endswith(".pdf"):
-        # Handle PDF file
-        stats["documents_sent_to_llamaparse"] += 1
-        log_entry = {
-            "timestamp": datetime.datetime.now().isoformat(),
-            "stage": "parse",
-            "filepath": file_path,
-            "status": "PDF_PROCESSING_ATTEMPT",
-            "reason": "Attempting to process PDF file.",
-        }
-        if detailed_log_path:
-            with open(detailed_log_path, "a") as f:
-                f.write(json.dumps(log_entry) + "\n")
-        for i in range(3):
-            if i > 0:
-                log_entry = {
-                    "timestamp": datetime.datetime.now().isoformat(),
-                    "stage": "parse",
-                    "filepath": file_path,
-                    "status": "PDF_RETRY",
-                    "reason": f"Retrying PDF processing (attempt {i + 1}).",
-                }
-                if detailed_log_path:
-                    with open(detailed_log_path, "a") as f:
-                        f.write(json.dumps(log_entry) + "\n")
-            txt_file_path = parse_pdf_to_txt(file_path, out_folder)
-            if txt_file_path != "Error":
-                log_entry = {
-                    "timestamp": datetime.datetime.now().isoformat(),
-                    "stage": "parse",
-                    "filepath": file_path,
-                    "status": "PDF_TO_TXT_SUCCESS",
-                    "reason": "Successfully converted PDF to TXT.",
-                }
-                if detailed_log_path:
-                    with open(detailed_log_path, "a") as f:
-                        f.write(json.dumps(log_entry) + "\n")
-                break
-            print("Error parsing PDF file. Retrying...")
-            log_entry = {
-                "timestamp": datetime.datetime.now().isoformat(),
-                "stage": "parse",
-                "filepath": file_path,
-                "status": "PDF_TO_TXT_FAILED",
-                "reason": "Failed to convert PDF to TXT. Retrying.",
-            }
-            if detailed_log_path:
-                with open(detailed_log_path, "a") as f:
-                    f.write(json.dumps(log_entry) + "\n")
-            time.sleep(4)
+        return convert_pdf_to_txt(file_path, out_folder, stats, detailed_log_path)
 
     elif file_path.lower().endswith(".html"):
         # Handle HTML file
@@ -641,9 +927,8 @@ def process_file(file_path, out_folder, stats, empty_llamaparse_files_counted, d
             "status": "HTML_PROCESSING_ATTEMPT",
             "reason": "Attempting to process HTML file.",
         }
-        if detailed_log_path:
-            with open(detailed_log_path, "a") as f:
-                f.write(json.dumps(log_entry) + "\n")
+        log_event(detailed_log_path, log_entry)
+        txt_file_path = file_path
         for i in range(3):
             if i > 0:
                 log_entry = {
@@ -653,11 +938,10 @@ def process_file(file_path, out_folder, stats, empty_llamaparse_files_counted, d
                     "status": "HTML_RETRY",
                     "reason": f"Retrying HTML processing (attempt {i + 1}).",
                 }
-                if detailed_log_path:
-                    with open(detailed_log_path, "a") as f:
-                        f.write(json.dumps(log_entry) + "\n")
-            txt_file_path, title_tag = convert_html_to_markdown(file_path, out_folder)
-            if title_tag != "Error parsing.":
+                log_event(detailed_log_path, log_entry)
+            content, title_tag = convert_html_to_markdown(file_path)
+            if content is not None:
+                txt_file_path = get_txt_path(file_path, out_folder)
                 log_entry = {
                     "timestamp": datetime.datetime.now().isoformat(),
                     "stage": "parse",
@@ -665,9 +949,7 @@ def process_file(file_path, out_folder, stats, empty_llamaparse_files_counted, d
                     "status": "HTML_TO_TXT_SUCCESS",
                     "reason": "Successfully converted HTML to TXT.",
                 }
-                if detailed_log_path:
-                    with open(detailed_log_path, "a") as f:
-                        f.write(json.dumps(log_entry) + "\n")
+                log_event(detailed_log_path, log_entry)
                 break
             print("Error converting HTML file. Retrying...")
             log_entry = {
@@ -677,55 +959,25 @@ def process_file(file_path, out_folder, stats, empty_llamaparse_files_counted, d
                 "status": "HTML_TO_TXT_FAILED",
                 "reason": "Failed to convert HTML to TXT. Retrying.",
             }
-            if detailed_log_path:
-                with open(detailed_log_path, "a") as f:
-                    f.write(json.dumps(log_entry) + "\n")
+            log_event(detailed_log_path, log_entry)
             time.sleep(4)
 
-    if title_tag != "Error parsing.":
-        log_entry = {
-            "timestamp": datetime.datetime.now().isoformat(),
-            "stage": "parse",
-            "filepath": file_path,
-            "status": "LLAMAPARSE_ATTEMPT",
-            "reason": "Attempting LlamaParse conversion.",
-        }
-        if detailed_log_path:
-            with open(detailed_log_path, "a") as f:
-                f.write(json.dumps(log_entry) + "\n")
-        # try a maximum of 3 times to parse the txt file to md
-        for i in range(3):
-            is_empty = parse_txt_to_md(
-                txt_file_path, file_extension, stats, empty_llamaparse_files_counted, detailed_log_path, title_tag, url
-            )
-            if not is_empty:
-                # remove the txt file
-                os.remove(txt_file_path)
-                stats["documents_successful_after_retries"] += 1
-                log_entry = {
-                    "timestamp": datetime.datetime.now().isoformat(),
-                    "stage": "parse",
-                    "filepath": file_path,
-                    "status": "LLAMAPARSE_SUCCESS_OR_RETRY_SUCCEEDED",
-                    "reason": "LlamaParse produced content or retry was successful.",
-                }
-                if detailed_log_path:
-                    with open(detailed_log_path, "a") as f:
-                        f.write(json.dumps(log_entry) + "\n")
-                return
-            print("Error parsing TXT file to MD. Retrying...")
-            log_entry = {
-                "timestamp": datetime.datetime.now().isoformat(),
-                "stage": "parse",
-                "filepath": file_path,
-                "status": "LLAMAPARSE_EMPTY_RETRY",
-                "reason": f"LlamaParse returned empty content. Retrying (attempt {i + 1}).",
-            }
-            if detailed_log_path:
-                with open(detailed_log_path, "a") as f:
-                    f.write(json.dumps(log_entry) + "\n")
-            time.sleep(4)
+    return txt_file_path, content, title_tag
+
 
+def _record_parse_success(file_path, stats, detailed_log_path):
+    stats["documents_successful_after_retries"] += 1
+    log_entry = {
+        "timestamp": datetime.datetime.now().isoformat(),
+        "stage": "parse",
+        "filepath": file_path,
+        "status": "LLAMAPARSE_SUCCESS_OR_RETRY_SUCCEEDED",
+        "reason": "LlamaParse produced content or retry was successful.",
+    }
+    log_event(detailed_log_path, log_entry)
+
+
+def _record_parse_failure(file_path, txt_file_path, content, out_folder, stats, detailed_log_path):
     stats["documents_failed_after_retries"] += 1
     log_entry = {
         "timestamp": datetime.datetime.now().isoformat(),
@@ -734,18 +986,207 @@ def process_file(file_path, out_folder, stats, empty_llamaparse_files_counted, d
         "status": "FAILED_AFTER_ALL_RETRIES",
         "reason": "Document could not be processed after all LlamaParse retries.",
     }
-    if detailed_log_path:
-        with open(detailed_log_path, "a") as f:
-            f.write(json.dumps(log_entry) + "\n")
-    # move the txt file to the error folder
+    log_event(detailed_log_path, log_entry)
     error_folder = os.path.join(out_folder, "error")
-    os.rename(txt_file_path, os.path.join(error_folder, os.path.basename(txt_file_path)))  # moving the file
-    print(f"Error parsing TXT file to MD. Moved to {error_folder}")
+    error_path = os.path.join(error_folder, os.path.basename(txt_file_path))
+    if content is None:
+        # conversion failed: move the source file to the error folder
+        os.rename(txt_file_path, error_path)
+    else:
+        # save the converted text to the error folder for debugging
+        with open(error_path, "w", encoding="utf-8") as f:
+            f.write(content)
+    print(f"Error parsing TXT file to MD. Saved to {error_folder}")
+
+
+def _log_llamaparse_attempt(file_path, detailed_log_path):
+    log_entry = {
+        "timestamp": datetime.datetime.now().isoformat(),
+        "stage": "parse",
+        "filepath": file_path,
+        "status": "LLAMAPARSE_ATTEMPT",
+        "reason": "Attempting LlamaParse conversion.",
+    }
+    log_event(detailed_log_path, log_entry)
+
+
+def _log_llamaparse_empty_retry(file_path, attempt, detailed_log_path):
+    print("Error parsing TXT file to MD. Retrying...")
+    log_entry = {
+        "timestamp": datetime.datetime.now().isoformat(),
+        "stage": "parse",
+        "filepath": file_path,
+        "status": "LLAMAPARSE_EMPTY_RETRY",
+        "reason": f"LlamaParse returned empty content. Retrying (attempt {attempt + 1}).",
+    }
+    log_event(detailed_log_path, log_entry)
+
+
+def process_file(
+    file_path,
+    out_folder,
+    stats,
+    empty_llamaparse_files_counted,
+    detailed_log_path,
+    url=None,
+    converted=None,
+    metadata=None,
+    excluded_domains=(),
+):
+    """
+    Processes a file based on its extension: PDF or HTML.
+
+    `converted` is the (txt_file_path, content, title_tag) result of convert_file_to_txt
+    when the file was already converted, e.g. by convert_pdfs_concurrently. `metadata` and
+    `excluded_domains` are passed on to _write_markdown.
+    """
+    file_extension = os.path.splitext(file_path)[1]
+    txt_file_path, content, title_tag = converted or convert_file_to_txt(file_path, out_folder, stats, detailed_log_path)
+
+    if title_tag != "Error parsing.":
+        _log_llamaparse_attempt(file_path, detailed_log_path)
+        # try a maximum of 3 times to parse the txt file to md
+        for i in range(3):
+            is_empty = parse_txt_to_md(
+                txt_file_path,
+                content,
+                file_extension,
+                stats,
+                empty_llamaparse_files_counted,
+                detailed_log_path,
+                title_tag,
+                url,
+                metadata,
+                excluded_domains,
+            )
+            if not is_empty:
+                _record_parse_success(file_path, stats, detailed_log_path)
+                return
+            _log_llamaparse_empty_retry(file_path, i, detailed_log_path)
+            time.sleep(4)
+
+    _record_parse_failure(file_path, txt_file_path, content, out_folder, stats, detailed_log_path)
+
+
+async def parse_txt_files_concurrently(
+    converted_files, out_folder, stats, detailed_log_path, max_in_flight, excluded_domains=()
+):
+    """
+    Sends converted text to LlamaParse concurrently, with at most `max_in_flight`
+    files waiting on the API at once.
+
+    `converted_files` holds (file_path, txt_file_path, content, title_tag, url, metadata) tuples. One
+    LlamaParse client is shared per file type and each Markdown file is written as
+    soon as its own result arrives, with the same retries as process_file.
+    """
+    semaphore = asyncio.Semaphore(max_in_flight)
+    parsers = {}
+
+    async def parse_one(file_path, txt_file_path, content, title_tag, url, metadata):
+        file_extension = os.path.splitext(file_path)[1]
+        if file_extension not in parsers:
+            parsers[file_extension] = create_file_extractor(file_extension)[".txt"]
+
+        _log_llamaparse_attempt(file_path, detailed_log_path)
+        for i in range(3):
+            is_empty = await aparse_txt_to_md(
+                txt_file_path,
+                content,
+                file_extension,
+                stats,
+                detailed_log_path,
+                parsers[file_extension],
+                semaphore,
+                title_tag,
+                url,
+                metadata,
+                excluded_domains,
+            )
+            if not is_empty:
+                _record_parse_success(file_path, stats, detailed_log_path)
+                return
+            _log_llamaparse_empty_retry(file_path, i, detailed_log_path)
+            await asyncio.sleep(4)
 
+        _record_parse_failure(file_path, txt_file_path, content, out_folder, stats, detailed_log_path)
 
-def process_directory(origin_path, out_folder, stats, empty_llamaparse_files_counted, detailed_log_path):
+    await asyncio.gather(*(parse_one(*converted) for converted in converted_files))
+
+
+def _process_file_in_worker(
+    file_path, out_folder, detailed_log_path, url, converted=None, metadata=None, excluded_domains=()
+):
+    """
+    Run process_file in a worker process with its own counters.
+
+    The worker's stats and empty-file set are returned to the parent for merging,
+    since changes made to the parent's objects would be lost in the child.
+    """
+    stats = Counter()
+    empty_llamaparse_files_counted = set()
+    try:
+        process_file(
+            file_path,
+            out_folder,
+            stats,
+            empty_llamaparse_files_counted,
+            detailed_log_path,
+            url=url,
+            converted=converted,
+            metadata=metadata,
+            excluded_domains=excluded_domains,
+        )
+    finally:
+        # Worker processes exit without running atexit hooks
+        flush_event_logs()
+    return dict(stats), empty_llamaparse_files_counted
+
+
+def _convert_file_in_worker(file_path, out_folder, detailed_log_path):
+    """Run convert_file_to_txt in a worker process and return its stats for merging."""
+    stats = Counter()
+    try:
+        converted = convert_file_to_txt(file_path, out_folder, stats, detailed_log_path)
+    finally:
+        flush_event_logs()
+    return dict(stats), converted
+
+
+def _merge_stats(stats, worker_stats):
+    for key, value in worker_stats.items():
+        stats[key] = stats.get(key, 0) + value
+
+
+def process_directory(
+    origin_path,
+    out_folder,
+    stats,
+    empty_llamaparse_files_counted,
+    detailed_log_path,
+    workers=1,
+    llamaparse_max_in_flight=0,
+    pdf_workers=1,
+    link_metadata=None,
+    excluded_domains=(),
+):
     """
     Processes all HTML and PDF files in the specified directory.
+
+    `link_metadata` is the load_link_metadata of all_links.csv. The Markdown of a file
+    found in it is cleaned and gets its front matter as it is written (finalize_markdown,
+    with `excluded_domains`), so postprocess_markdown_files does not rewrite it. Without
+    it, all_links.csv next to `origin_path` is only used to look up each file's URL.
+
+    With `workers` > 1 the files are processed in parallel in a process pool and
+    each worker's stats counters and empty-file set are merged back into `stats`
+    and `empty_llamaparse_files_counted`.
+
+    With `llamaparse_max_in_flight` > 0 every file is converted to text first (in the
+    pool when `workers` > 1) and the texts are then sent to LlamaParse together,
+    up to `llamaparse_max_in_flight` at a time, instead of one file after another.
+
+    With `pdf_workers` > 1 all PDFs are partitioned up front by convert_pdfs_concurrently,
+    `pdf_workers` at a time, before the rest of the pipeline runs.
     """
     import csv
 
@@ -759,7 +1200,7 @@ def process_directory(origin_path, out_folder, stats, empty_llamaparse_files_cou
                 filename_with_ext = os.path.basename(row["filename"])
                 filename_without_ext = os.path.splitext(filename_with_ext)[0]
                 file_url_map[filename_without_ext] = row.get("URL")
-    files_processed_by_directory = 0
+    files_to_process = []
     for root, _dirs, files in os.walk(origin_path):
         if "error" in root:
             continue
@@ -767,50 +1208,96 @@ def process_directory(origin_path, out_folder, stats, empty_llamaparse_files_cou
             if file.lower().endswith((".html", ".pdf")):
                 file_path = os.path.join(root, file)
                 filename_without_ext = os.path.splitext(os.path.basename(file_path))[0]
-                url = file_url_map.get(filename_without_ext)
+                metadata = (link_metadata or {}).get(filename_without_ext)
+                url = metadata["url"] if metadata else file_url_map.get(filename_without_ext)
+                files_to_process.append((file_path, url, metadata))
+
+    converted_pdfs = {}
+    if pdf_workers > 1:
+        pdf_paths = [file_path for file_path, *_ in files_to_process if file_path.lower().endswith(".pdf")]
+        print(f"Converting {len(pdf_paths)} PDF files, {pdf_workers} at a time")
+        converted_pdfs = convert_pdfs_concurrently(pdf_paths, out_folder, stats, detailed_log_path, max_workers=pdf_workers)
+
+    if llamaparse_max_in_flight > 0:
+        converted_files = [
+            (file_path, *converted_pdfs[file_path], url, metadata)
+            for file_path, url, metadata in files_to_process
+            if file_path in converted_pdfs
+        ]
+        files_to_convert = [link for link in files_to_process if link[0] not in converted_pdfs]
+        if workers > 1:
+            # Flush first so forked workers don't inherit buffered log entries
+            flush_event_logs()
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                futures = {}
+                for file_path, url, metadata in files_to_convert:
+                    print(f"Converting file: {file_path} (URL: {url})")
+                    futures[executor.submit(_convert_file_in_worker, file_path, out_folder, detailed_log_path)] = (
+                        file_path,
+                        url,
+                        metadata,
+                    )
+                for future in as_completed(futures):
+                    file_path, url, metadata = futures[future]
+                    worker_stats, converted = future.result()
+                    _merge_stats(stats, worker_stats)
+                    converted_files.append((file_path, *converted, url, metadata))
+        else:
+            for file_path, url, metadata in files_to_convert:
+                print(f"Converting file: {file_path} (URL: {url})")
+                converted = convert_file_to_txt(file_path, out_folder, stats, detailed_log_path)
+                converted_files.append((file_path, *converted, url, metadata))
+
+        for file_path, txt_file_path, content, title_tag, *_ in converted_files:
+            if title_tag == "Error parsing.":
+                _record_parse_failure(file_path, txt_file_path, content, out_folder, stats, detailed_log_path)
+        converted_files = [converted for converted in converted_files if converted[3] != "Error parsing."]
+
+        print(f"Sending {len(converted_files)} files to LlamaParse, {llamaparse_max_in_flight} at a time")
+        asyncio.run(
+            parse_txt_files_concurrently(
+                converted_files, out_folder, stats, detailed_log_path, llamaparse_max_in_flight, excluded_domains
+            )
+        )
+    elif workers > 1:
+        # Flush first so forked workers don't inherit buffered log entries
+        flush_event_logs()
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = {}
+            for file_path, url, metadata in files_to_process:
                 print(f"Processing file: {file_path} (URL: {url})")
-                process_file(file_path, out_folder, stats, empty_llamaparse_files_counted, detailed_log_path, url=url)
-                files_processed_by_directory += 1
-    return files_processed_by_directory
-
-
-def add_titles_tag(input_directory, out_folder):
-    all_files = get_files(input_directory)
-    # save only html files
-    html_files = [file for file in all_files if file.endswith(".html")]
-    # ignore the error folder
-    html_files = [file for file in html_files if "error" not in file]
-    out_files = get_files(out_folder)
-
-    print(f"=== input directory: {input_directory}===")
-    # Load a soup object from each html, get the title, and add it to the first line of the markdown file
-    for file_path in html_files:
-        with open(file_path, encoding="utf-8") as file:
-            content = file.read()
-        soup = BeautifulSoup(content, "html.parser")
-        title = soup.title.string if soup.title else ""
-        title = clean_title(title)
-
-        if not title:
-            continue
-
-        print(f"title exist in {file_path}")
-
-        # get the markdown file by filename
-        filename = os.path.basename(file_path).replace(".html", ".md")
-        md_file = [file for file in out_files if filename in file]
-
-        if len(md_file) == 0:
-            print(f"Markdown file not found for {filename}")
-            continue
-        # open the file
-        with open(md_file[0], encoding="utf-8") as file:
-            content = file.read()
-
-        with open(md_file[0], "w", encoding="utf-8") as f:
-            f.write(f"title: {title}\n")
-
-            f.write(content)
+                future = executor.submit(
+                    _process_file_in_worker,
+                    file_path,
+                    out_folder,
+                    detailed_log_path,
+                    url,
+                    converted_pdfs.get(file_path),
+                    metadata,
+                    excluded_domains,
+                )
+                futures[future] = file_path
+            for future in as_completed(futures):
+                worker_stats, worker_empty_files = future.result()
+                _merge_stats(stats, worker_stats)
+                empty_llamaparse_files_counted.update(worker_empty_files)
+    else:
+        for file_path, url, metadata in files_to_process:
+            print(f"Processing file: {file_path} (URL: {url})")
+            process_file(
+                file_path,
+                out_folder,
+                stats,
+                empty_llamaparse_files_counted,
+                detailed_log_path,
+                url=url,
+                converted=converted_pdfs.get(file_path),
+                metadata=metadata,
+                excluded_domains=excluded_domains,
+            )
 
-        print(f"Title added to {filename}")
-        print()
+    evicted = llamaparse_cache.evict()
+    if evicted:
+        print(f"Evicted {evicted} old entries from the LlamaParse cache")
+    flush_event_logs()
+    return len(files_to_process)
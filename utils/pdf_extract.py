@@ -0,0 +1,109 @@
+import hashlib
+import re
+import unicodedata
+
+from pypdf import PdfReader
+
+# Below this many characters per page the PDF is probably scanned or image-based
+MIN_CHARS_PER_PAGE = 200
+# Share of letters and whitespace a readable text layer should have
+MIN_TEXT_RATIO = 0.7
+
+LIST_ITEM_PATTERN = re.compile(r"^\s*(?:[•●▪◦·\-–*]|\d{1,3}[.)]|[a-zA-Z][.)])\s+")
+BULLET_PATTERN = re.compile(r"^\s*[•●▪◦·\-–*]\s+")
+SENTENCE_END_PATTERN = re.compile(r"[.!?:;]['\")\]]?$")
+WHITESPACE_PATTERN = re.compile(r"\s+")
+
+
+def _is_title(line):
+    """Short lines without sentence punctuation that are upper or title case."""
+    if len(line) > 80 or SENTENCE_END_PATTERN.search(line) or not any(c.isalpha() for c in line):
+        return False
+    words = [word for word in line.split() if word[0].isalpha()]
+    return line.isupper() or (bool(words) and all(word[0].isupper() for word in words if len(word) > 3))
+
+
+def _page_elements(text):
+    """Split the text of one page into Title, ListItem and NarrativeText element dicts."""
+    elements = []
+    paragraph = []
+
+    def flush_paragraph():
+        if paragraph:
+            elements.append({"type": "NarrativeText", "text": " ".join(paragraph)})
+            paragraph.clear()
+
+    for raw_line in text.splitlines():
+        line = raw_line.strip()
+        if not line or line.isdigit():
+            # Blank lines end a paragraph; lone numbers are page numbers
+            flush_paragraph()
+            continue
+        if LIST_ITEM_PATTERN.match(line):
+            flush_paragraph()
+            elements.append({"type": "ListItem", "text": BULLET_PATTERN.sub("", line)})
+        elif not paragraph and _is_title(line):
+            elements.append({"type": "Title", "text": line})
+        elif paragraph and paragraph[-1].endswith("-") and line[0].islower():
+            # Word broken across lines
+            paragraph[-1] = paragraph[-1][:-1] + line
+        elif elements and elements[-1]["type"] == "ListItem" and not paragraph and line[0].islower():
+            # Continuation of a wrapped list item
+            elements[-1]["text"] += " " + line
+        else:
+            paragraph.append(line)
+            if SENTENCE_END_PATTERN.search(line) and len(line) < 60:
+                # A short line ending a sentence usually closes the paragraph
+                flush_paragraph()
+    flush_paragraph()
+    return elements
+
+
+def extract_pdf_elements(file_path):
+    """
+    Extract the text layer of a PDF with pypdf and return it as the Unstructured-style
+    element dicts ({"type", "text"}) that unstructured_elements_to_markdown expects.
+
+    Returns (elements, page_count).
+    """
+    reader = PdfReader(file_path)
+    elements = []
+    for page in reader.pages:
+        elements.extend(_page_elements(page.extract_text() or ""))
+    return elements, len(reader.pages)
+
+
+def is_low_quality_extraction(elements, page_count):
+    """
+    Whether a local extraction is too thin or garbled to use, e.g. for scanned PDFs
+    or PDFs with broken font encodings.
+    """
+    text = "".join(element["text"] for element in elements)
+    if not text.strip():
+        return True
+    if len(text) < MIN_CHARS_PER_PAGE * max(page_count, 1):
+        return True
+    readable = sum(1 for c in text if c.isalpha() or c.isspace())
+    return readable / len(text) < MIN_TEXT_RATIO
+
+
+def pdf_text_fingerprint(file_path):
+    """
+    SHA-256 of the normalized text layer of a PDF.
+
+    Unlike the hash of the file bytes it does not change when a PDF is regenerated
+    with new metadata (creation or modification dates, document IDs) or a different
+    internal layout but the same text. Returns None when there is no text to compare,
+    e.g. for scanned PDFs, or when the PDF cannot be read.
+    """
+    try:
+        reader = PdfReader(file_path)
+        text = "\n".join(page.extract_text() or "" for page in reader.pages)
+    except Exception as e:
+        print(f"Could not read the text of {file_path}: {e}")
+        return None
+
+    text = WHITESPACE_PATTERN.sub(" ", unicodedata.normalize("NFKC", text)).strip()
+    if not text:
+        return None
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
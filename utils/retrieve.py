@@ -1,4 +1,3 @@
-from cachetools import LRUCache
 import re
 
 import chromadb
@@ -12,10 +11,10 @@ from llama_index.core.node_parser import (
 from llama_index.core.vector_stores.types import VectorStoreQueryMode
 
 # from llama_index.embeddings.huggingface import HuggingFaceEmbedding
-from llama_index.embeddings.openai import OpenAIEmbedding
 from llama_index.vector_stores.chroma import ChromaVectorStore
 
 from utils.custom_node_parser import CustomNodeParser
+from utils.embedding_cache import CachedOpenAIEmbedding
 
 
 def _generate_ngrams_from_text(text, ngram_size=3):
@@ -124,43 +123,6 @@ def extract_question_ngrams(qa_df, ngram_size):
     return question_ngrams
 
 
-# cache embedding calls to speed up tests and go faster - not used
-# cache = LRUCache(maxsize=100_000)
-
-
-class CachedOpenAIEmbedding(OpenAIEmbedding):
-    def __init__(self, embed_model_name):
-        super().__init__(
-            model=embed_model_name,
-            embed_batch_size=100,
-            max_retries=25,
-            timeout=180,
-            reuse_client=True,        
-        )    
-
-    def _get_key(self, text):
-        return f"{self.model_name}|{text}"
-    
-    def _get_text_embedding(self, text: str) -> list[float]:
-        key = self._get_key(text)
-        if key not in cache:
-            embedding = super()._get_text_embedding(text)
-            cache[key] = embedding
-        return cache[key]
-
-    def _get_text_embeddings(self, texts: list[str]) -> list[list[float]]:
-        lookups = []
-        for text in texts:
-            key = self._get_key(text)
-            if key not in cache:
-                lookups.append(text)
-        embeddings = super()._get_text_embeddings(lookups) if len(lookups) > 0 else []
-        for lookup, embedding in zip(lookups, embeddings):
-            key = self._get_key(lookup)
-            cache[key] = embedding
-        return [cache[self._get_key(text)] for text in texts]
-
-    
 def objective(trial, documents, ngram_size, question_ngrams, f_beta=1.0):
     """
     This function is called by Optuna. It creates an index, run queries over the index,
@@ -184,7 +146,14 @@ def objective(trial, documents, ngram_size, question_ngrams, f_beta=1.0):
         ],
     )
     if embed_model_name == "text-embedding-3-small" or embed_model_name == "text-embedding-3-large":
-        embed_model = CachedOpenAIEmbedding(embed_model_name)
+        # Embeddings are cached on disk, so later trials only embed chunks they have not seen
+        embed_model = CachedOpenAIEmbedding(
+            model=embed_model_name,
+            embed_batch_size=100,
+            max_retries=25,
+            timeout=180,
+            reuse_client=True,
+        )
 
     # define splitter
     splitter_name = trial.suggest_categorical(
@@ -0,0 +1,55 @@
+import re
+import time
+from collections import defaultdict
+
+
+class RegexRule:
+    """
+    One substitution of a cleaning rule table.
+
+    The pattern is compiled once. `requires` lists literals of which at least one must
+    occur in the text for the pattern to be able to match, so the rule is skipped
+    without running the regex when none of them is present.
+    """
+
+    def __init__(self, name, pattern, replacement="", flags=0, requires=()):
+        self.name = name
+        self.pattern = re.compile(pattern, flags)
+        self.replacement = replacement
+        self.requires = requires
+
+    def apply(self, text):
+        if self.requires and not any(literal in text for literal in self.requires):
+            return text
+        return self.pattern.sub(self.replacement, text)
+
+
+class RuleTable:
+    """
+    Applies a list of RegexRule in order. With `profile=True` the time spent in each
+    rule is added to `timings`, and `report` prints them, slowest first.
+    """
+
+    def __init__(self, rules):
+        self.rules = rules
+        self.timings = defaultdict(float)
+
+    def apply(self, text, profile=False):
+        if not profile:
+            for rule in self.rules:
+                text = rule.apply(text)
+            return text
+
+        for rule in self.rules:
+            start = time.perf_counter()
+            text = rule.apply(text)
+            self.timings[rule.name] += time.perf_counter() - start
+        return text
+
+    def report(self):
+        total = sum(self.timings.values()) or 1
+        for name, seconds in sorted(self.timings.items(), key=lambda item: item[1], reverse=True):
+            print(f"{name:<32} {seconds * 1000:10.2f} ms {seconds / total:7.1%}")
+
+    def reset_timings(self):
+        self.timings.clear()
@@ -27,4 +27,16 @@ def get_files(path_dir, ignored=""):
 def get_domain(url):
     """Get the domain from a URL."""
     domain = url.split("//")[-1].split("/")[0]
-    return domain
\ No newline at end of file
+    return domain
+
+
+def replace_file(path, content):
+    """
+    Write text to path through a temporary file and os.replace. The path gets a new
+    inode, so hardlinks to the old file (e.g. markdown carried forward from the previous
+    run) keep their content.
+    """
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(content)
+    os.replace(tmp_path, path)
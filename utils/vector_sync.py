@@ -0,0 +1,216 @@
+import hashlib
+import json
+import os
+from collections import defaultdict
+
+from utils.hyper_functions import build_nodes
+
+# Pinecone accepts at most 1000 ids per delete request
+DELETE_BATCH_SIZE = 1000
+
+
+def document_key(document):
+    """Stable key of a document across runs: a hash of its URL (or file name when it has none)."""
+    source = document.metadata.get("url") or os.path.basename(document.metadata.get("filepath", ""))
+    return hashlib.sha256(source.encode("utf-8")).hexdigest()[:16]
+
+
+def index_signature(splitter, embed_model):
+    """
+    Settings that change the vectors of an unchanged document: the embedding model and
+    the splitter's options. Part of every content hash, so changing them re-indexes everything.
+    """
+    settings = {
+        name: value
+        for name, value in vars(splitter).items()
+        if isinstance(value, (str, int, float, bool)) and not name.startswith("_")
+    }
+    settings["embed_model"] = embed_model.model_name
+    settings["embed_dimensions"] = getattr(embed_model, "dimensions", None)
+    return json.dumps(settings, sort_keys=True)
+
+
+def document_hash(document, signature):
+    """Hash of everything that ends up in a document's vectors, except its filepath, which changes every run."""
+    metadata = {key: value for key, value in document.metadata.items() if key != "filepath"}
+    hasher = hashlib.sha256()
+    hasher.update(signature.encode("utf-8"))
+    hasher.update(b"\0")
+    hasher.update(json.dumps(metadata, sort_keys=True, default=str).encode("utf-8"))
+    hasher.update(b"\0")
+    hasher.update(document.text.encode("utf-8"))
+    return hasher.hexdigest()[:16]
+
+
+def vector_id(key, content_hash, sequence):
+    return f"{key}#{content_hash}#{sequence}"
+
+
+def parse_vector_id(vector_id):
+    """Return (key, content_hash) of an id made by vector_id, or (None, None) for any other id."""
+    parts = vector_id.split("#")
+    if len(parts) != 3:
+        return None, None
+    return parts[0], parts[1]
+
+
+class PineconeSyncTarget:
+    """Lists, upserts and deletes vectors in the namespace of a PineconeVectorStore."""
+
+    def __init__(self, vector_store):
+        self.vector_store = vector_store
+
+    def list_ids(self):
+        # Listing ids is only supported by serverless indexes
+        for ids in self.vector_store.client.list(namespace=self.vector_store.namespace):
+            yield from ids
+
+    def upsert(self, nodes):
+        if nodes:
+            self.vector_store.add(nodes)
+
+    def delete(self, ids):
+        for i in range(0, len(ids), DELETE_BATCH_SIZE):
+            self.vector_store.client.delete(
+                ids=ids[i : i + DELETE_BATCH_SIZE], namespace=self.vector_store.namespace
+            )
+
+
+class InMemorySyncTarget:
+    """
+    Stand-in for a vector index that keeps the nodes in a dict, to check what
+    sync_documents would change without a Pinecone index.
+    """
+
+    def __init__(self):
+        self.nodes = {}
+
+    def list_ids(self):
+        return list(self.nodes)
+
+    def upsert(self, nodes):
+        for node in nodes:
+            self.nodes[node.node_id] = node
+
+    def delete(self, ids):
+        for id_ in ids:
+            self.nodes.pop(id_, None)
+
+
+def check_removals(indexed_documents, removed_documents, indexed_vectors, document_count, min_ratio, max_removed):
+    """
+    Refuse a sync that would delete much of the index, as an empty or partial set of
+    documents (a wrong DATA_PATH, a failed parse stage) would. Raises ValueError before
+    anything is embedded, upserted or deleted.
+    """
+    if indexed_vectors and not document_count:
+        raise ValueError(f"No documents to sync; refusing to delete all {indexed_vectors} vectors in the index")
+    if max_removed is not None and removed_documents > max_removed:
+        raise ValueError(
+            f"The sync would remove {removed_documents} documents from the index, more than the limit of {max_removed}"
+        )
+    remaining = indexed_documents - removed_documents
+    if indexed_documents and remaining < indexed_documents * min_ratio:
+        raise ValueError(
+            f"The sync would keep {remaining} of the {indexed_documents} documents in the index, "
+            f"less than {min_ratio:.0%}"
+        )
+
+
+def sync_documents(
+    documents,
+    splitter,
+    embed_model,
+    target,
+    include_prev_next_rel=False,
+    min_document_ratio=0.5,
+    max_removed_documents=None,
+):
+    """
+    Bring the vectors in `target` in line with `documents` without rebuilding the index.
+
+    Vectors are keyed by (URL, content hash, sequence) through their ids, so the index
+    itself records which version of each document it holds:
+    - documents whose content hash matches are left alone and need no embedding calls;
+    - new and changed documents are split, embedded and upserted, then the vectors of
+      their old version are deleted;
+    - vectors of URLs that are no longer in `documents` (and ids in any other format,
+      e.g. from a full rebuild) are deleted.
+
+    Documents need a "filepath" metadata entry, which their nodes inherit.
+
+    The sync is aborted with ValueError, before any change, if it would keep less than
+    `min_document_ratio` of the documents in the index or remove more than
+    `max_removed_documents` of them (see check_removals).
+
+    Returns (nodes, node_counts, sync_stats): the nodes that were embedded, the number of
+    vectors each document's filepath now has in the index, and counts of what changed.
+    """
+    signature = index_signature(splitter, embed_model)
+
+    existing = defaultdict(list)
+    indexed_vectors = 0
+    for id_ in target.list_ids():
+        key, content_hash = parse_vector_id(id_)
+        existing[key].append((content_hash, id_))
+        indexed_vectors += 1
+    indexed_documents = sum(1 for key in existing if key is not None)
+
+    node_counts = {}
+    changed_documents = []
+    document_ids = {}
+    stale_ids = []
+    seen_keys = set()
+    sync_stats = {"documents_unchanged": 0, "documents_new": 0, "documents_changed": 0, "documents_removed": 0}
+    for document in documents:
+        key = document_key(document)
+        if key in seen_keys:
+            print(f"Skipping duplicate document for {document.metadata.get('url')}: {document.metadata.get('filepath')}")
+            continue
+        seen_keys.add(key)
+        content_hash = document_hash(document, signature)
+        current = existing.pop(key, [])
+
+        if current and all(current_hash == content_hash for current_hash, _ in current):
+            sync_stats["documents_unchanged"] += 1
+            node_counts[document.metadata["filepath"]] = len(current)
+            continue
+
+        sync_stats["documents_changed" if current else "documents_new"] += 1
+        changed_documents.append(document)
+        document_ids[document.metadata["filepath"]] = (key, content_hash)
+        node_counts[document.metadata["filepath"]] = 0
+        stale_ids.extend(id_ for current_hash, id_ in current if current_hash != content_hash)
+
+    # Whatever is left belongs to documents that are gone
+    sync_stats["documents_removed"] = sum(1 for key in existing if key is not None)
+    for ids in existing.values():
+        stale_ids.extend(id_ for _, id_ in ids)
+
+    print(
+        f"Index sync: {sync_stats['documents_unchanged']} unchanged, {sync_stats['documents_new']} new, "
+        f"{sync_stats['documents_changed']} changed and {sync_stats['documents_removed']} removed documents"
+    )
+    check_removals(
+        indexed_documents,
+        sync_stats["documents_removed"],
+        indexed_vectors,
+        len(seen_keys),
+        min_document_ratio,
+        max_removed_documents,
+    )
+
+    nodes = build_nodes(changed_documents, splitter, embed_model, include_prev_next_rel)
+    for node in nodes:
+        filepath = node.metadata["filepath"]
+        key, content_hash = document_ids[filepath]
+        node_counts[filepath] += 1
+        node.id_ = vector_id(key, content_hash, node_counts[filepath])
+
+    # Upsert before deleting so a changed document is never missing from the index
+    target.upsert(nodes)
+    target.delete(stale_ids)
+    sync_stats["vectors_upserted"] = len(nodes)
+    sync_stats["vectors_deleted"] = len(stale_ids)
+    print(f"Vectors upserted: {len(nodes)}, deleted: {len(stale_ids)}")
+    return nodes, node_counts, sync_stats